@@ -1,119 +1,93 @@
+import asyncio
+import hashlib
 import json
-import matplotlib.pyplot as plt
-from zhipuai import ZhipuAI
-from 绘制论点拓扑图 import main as visualize_graph
-from 论点查重 import main as check_similarity
+import os
+import threading
+import time
+from contextlib import aclosing
+from 大模型接口 import get_backend, run_sync, ZHIPU_BASE_URL
+from 响应缓存 import CachedBackend, get_response_cache
+from 快照编码 import encode_snapshot, estimate_tokens, expand_id
+from 论点图 import DebateGraph, UtteranceNode
+from 模型路由 import ModelProfile, get_model_router
+from 限流器 import get_shared_limiter
+from 追踪 import configure_tracing, format_summary, get_tracer
+from 流式解析 import JsonArrayStream
+from 日志文件 import read_jsonl, rewrite_jsonl
+from 阶段调度 import Stage, format_stage_report, run_stages
+# 论点查重（numpy）和绘制论点拓扑图（networkx，png 时还有 matplotlib）在用到时才导入，只评分或只点评时不必加载
 
 # 配置区
 MODEL_READ1 = 'GLM-4-Air-0111'  # 长文本模型
 MODEL_READ2 = 'GLM-Zero-Preview'  # 短文本模型
 MODEL_EVALUATION = 'GLM-4-Plus' # 评委点评模型
+# 抽取环节可选的模型：上下文长度（token）、每千 token 价格（元）、质量分、没有实测数据时每千 token 的耗时估计（秒）
+EXTRACT_MODELS = [
+    ModelProfile(MODEL_READ1, context_tokens=128000, input_price=0.0005, output_price=0.0005, quality=0.0, prior_seconds_per_1k=2.0),
+    ModelProfile(MODEL_READ2, context_tokens=16000, input_price=0.01, output_price=0.01, quality=1.0, prior_seconds_per_1k=6.0),
+]
+# 模型选择的目标函数权重：预计耗时（秒）、预计花费（元）、近期错误率、质量分；分数低的模型优先，失败时退回下一个
+ROUTER_OBJECTIVE = {"latency": 1.0, "cost": 10.0, "errors": 30.0, "quality": 30.0}
+EXTRACT_MAX_TOKENS = 4025  # 抽取请求的最大输出长度
+EXTRACT_TEMPERATURE = 0.5  # 抽取请求的温度
+STREAM_EXTRACTION = True  # 抽取时流式接收回复，每条更新指令一闭合就写入论点拓扑图；False 则等完整回复到达后再解析
 TOPIC = "<辩题完整表述>"  # 辩题
 API_KEY = "<你的apikey>"  # 请填入你的 API Key
 FILEPATH = "<你的辩论赛json>" # 请填入已处理成json格式的辩论赛文本，用“录音转文字toJson.py”处理
 ARGUMENT_ROUNDS = [1,3]  # 立论环节的轮数
 WINDOW_LENGTH = 3 # 窗口长度
-
-# 设置字体为 SimHei
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
+BASE_URL = ZHIPU_BASE_URL  # 接口地址；离线运行时改为本地替身服务器地址，如 "http://127.0.0.1:8000"
+MAX_CONCURRENCY = 8  # 同时在途的大模型请求数上限
+RECORD_PATH = None  # 填入文件路径（如 "录制的响应.jsonl"）即可录制所有请求和响应，供“本地替身服务器.py”回放
+CACHE_PATH = "响应缓存.sqlite"  # 大模型响应的磁盘缓存，设为 None 则不使用缓存
+CACHE_MAX_MB = 200  # 缓存大小上限，超出后淘汰最久未用的响应
+CACHE_MODE = "use"  # "use" 正常使用缓存；"refresh" 忽略已有缓存并重新请求；"bypass" 完全不读写缓存
+SNAPSHOT_TOKEN_BUDGET = 6000  # 每轮提示词中论点拓扑图快照的 token 预算，保证短文本模型放得下
+SCOREBOARD_PATH = None  # 填入文件路径（如 "实时比分.jsonl"）则每轮结束后追加一行实时比分，供直播叠加层读取
+IMAGE_FORMAT = "png"  # 论点拓扑图格式："png" 位图；"svg" 矢量图；"html" 可平移缩放、悬停看全文的网页（后两者体积小、生成快）
+TRACE_PATH = None  # 填入文件路径（如 "追踪.jsonl"）则把每次请求、每轮抽取、每个阶段的追踪记录逐行写入
+METRICS_PORT = None  # 填入端口号（如 9464）则在该端口的 /metrics 提供 Prometheus 指标
+METRICS_PATH = None  # 填入文件路径则把 Prometheus 指标写入该文件（供 node_exporter 的 textfile collector 读取）
+RENDER_IN_PROCESS = True  # png 在独立的进程中绘制，与点评等阶段并发执行且互不争抢 GIL；False 则在线程中绘制
+JOURNAL_ENABLED = True  # 每轮合并后把更新指令追加写入轮次日志；程序中途退出后重跑，已完成的轮次直接回放，不再调用大模型
 
 # 用于截取文本片段，避免图中节点标签过长
 def text_snippet(text, length=30):
     return text if len(text) <= length else text[:length] + "..."
 
-# 添加清洗大模型返回的回复的函数
-def clean_model_response(response):
-    start = response.find('[')
-    end = response.rfind(']')
-    if start != -1 and end != -1:
-        return response[start:end+1]
-    else:
-        start = response.find('{')
-        end = response.rfind('}')
-        if start != -1 and end != -1:
-            return '[' + response[start:end+1] + ']'
-    return response
-
-############################################
-# 数据结构定义：每个节点代表一次发言更新
-############################################
-class UtteranceNode:
-    def __init__(self, node_id, speaker, text, node_type, base_importance=0.0, target_id=None, delta=0.0, round_number=None):
-        """
-        node_type: 
-          - "new_argument": 新增论点（需要 base_importance），
-          - "support": 支持（需要 target_id 与正 delta），
-          - "attack": 反驳（需要 target_id 与负 delta）。
-        """
-        self.node_id = node_id
-        self.speaker = speaker
-        self.text = text
-        self.node_type = node_type
-        self.base_importance = base_importance
-        self.target_id = target_id
-        self.delta = delta
-        self.round_number = round_number  # 用于记录该节点所在的辩论轮数
-
-    def to_dict(self):
-        return {
-            "id": self.node_id,
-            "speaker": self.speaker,
-            "text": self.text,
-            "node_type": self.node_type,
-            "base_importance": self.base_importance,
-            "target_id": self.target_id,
-            "delta": self.delta,
-            "round_number": self.round_number
-        }
+def transcript_hash(transcript):
+    """一轮发言内容的哈希，用于判断日志中的轮次是否仍对应当前的比赛文本"""
+    canonical = json.dumps(transcript, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
 ############################################
-# 辩论论点拓扑图：管理所有发言节点
+# 数据结构（UtteranceNode、DebateGraph）见“论点图.py”
 ############################################
-class DebateGraph:
-    def __init__(self):
-        # 所有节点存放在 nodes 字典中，键为 node_id
-        self.nodes = {}
-        
-    def add_node(self, node: UtteranceNode):
-        self.nodes[node.node_id] = node
-
-    def remove_node(self, node_id):
-        if node_id in self.nodes:
-            del self.nodes[node_id]
-
-    def remove_duplicate_nodes(self):
-        # 修改：遍历 self.nodes，而不是 self.graph.nodes
-        seen_texts = {}
-        nodes_to_remove = []
-        for node_id, node in self.nodes.items():
-            text = node.text
-            if text in seen_texts:
-                nodes_to_remove.append(node_id)
-            else:
-                seen_texts[text] = node_id
-
-        for node_id in nodes_to_remove:
-            self.remove_node(node_id)
-
-    def to_json(self):
-        nodes_list = [node.to_dict() for node in self.nodes.values()]
-        return json.dumps(nodes_list, ensure_ascii=False, indent=2)
-    
-    ##### 请移步“绘制论点拓扑图.py”程序处理.json文件
-    # def visualize_graph(self, filename=f"{TOPIC}.png"):
-        
 ############################################
 # LLM 客户端：调用 ChatGLM 接口
 ############################################
 class LLMClient:
-    def __init__(self, api_key):
-        self.client = ZhipuAI(api_key=api_key)
+    def __init__(self, api_key, backend=None, topic=TOPIC):
+        self.topic = topic
+        # 默认使用进程内共享的异步后端，连接复用且在途请求数受 MAX_CONCURRENCY 限制
+        self.backend = backend or get_backend(api_key, BASE_URL, MAX_CONCURRENCY, RECORD_PATH)
+        # 同一提示词的响应缓存到磁盘，重跑同一份比赛时无需重复调用接口
+        self.cache = None
+        if CACHE_PATH:
+            self.cache = get_response_cache(CACHE_PATH, CACHE_MAX_MB * 1024 * 1024)
+            self.backend = CachedBackend(self.backend, self.cache, CACHE_MODE)
+        self.router = get_model_router(EXTRACT_MODELS, ROUTER_OBJECTIVE)
 
-    def extract_information(self, round_text, graph_snapshot):
-        
-        prompt_system = ("你是一位专业的辩论分析专家，熟悉辩论评委模型的原理和论点拓扑图的数据结构。当前的论点拓扑图以 JSON 格式表示，是一个数组，每个元素是一个节点，包含字段：\n"
-            "  id: 唯一标识符\n"
+    def extract_information(self, round_text, graph_snapshot, on_update=None):
+        return run_sync(self.aextract_information(round_text, graph_snapshot, on_update))
+
+    def generate_commentary(self, details):
+        return run_sync(self.agenerate_commentary(details))
+
+    def extraction_messages(self, round_text, graph_snapshot):
+        """抽取请求的对话消息"""
+        prompt_system = ("你是一位专业的辩论分析专家，熟悉辩论评委模型的原理和论点拓扑图的数据结构。当前的论点拓扑图以表格形式表示，第一行是表头，之后每行是一个节点，字段之间用 | 分隔（不适用的字段记为 -），包含字段：\n"
+            "  id: 唯一标识符（数字）\n"
             "  speaker: 发言持方，可为'Pro' 或 'Con'\n"
             "  text: 发言内容\n"
             "  node_type: 发言类型，可为 'new_argument'（新增论点）、'support'（支持）、'attack'（反驳）\n"
@@ -122,14 +96,16 @@ class LLMClient:
             "  delta: 如果是支持或反驳，该字段表示对目标论点的重要性增减值（支持为正，反驳为负）\n"
             "  round_number: 发言所在的辩论轮数\n"
             "\n"
-            "  你可以根据当前的论点拓扑图情况，了解当前的辩论战局。如果拓扑图为空，意味着比赛刚刚开始，是立论环节\n\n"
+            "  支持/反驳节点的 text 可能被截断，表格只列出与当前战局最相关的节点\n"
+            "\n"
+            "  你可以根据当前的论点拓扑图情况，了解当前的辩论战局。如果拓扑图为空（[]），意味着比赛刚刚开始，是立论环节\n\n"
             
             "你需要根据当前的辩论环节发言，分析其中的论点、支持和反驳，并按照要求更新论点拓扑图。"
             "请为每个更新生成一条指令。每条指令必须是一个 JSON 对象，包含如下字段：\n"
             "  - speaker: 发言者\n"
             "  - action: 'new_argument' 或 'support' 或 'attack'\n"
             "  - 如果 action 为 'new_argument'，请提供 'text' 和 'importance'（重要性取值 [0,1.5]）\n"
-            "  - 如果 action 为 'support' 或 'attack'，请提供 'target_id'、'text' 和 'delta'（支持为正，反驳为负，对应取值[0,0.5]或者[-0.5,0]）\n"
+            "  - 如果 action 为 'support' 或 'attack'，请提供 'target_id'（表格中的数字 id）、'text' 和 'delta'（支持为正，反驳为负，对应取值[0,0.5]或者[-0.5,0]）\n"
             "\n"
             "下面是importance和delta的赋值标准：\n"
             "  1. 新增论点：根据论点的清晰度和新颖性，初始重要性取值范围为[0,1.5]，0为“很弱”，1.5为“很强”。\n"
@@ -149,7 +125,7 @@ class LLMClient:
             "  9. 论据的类型可能包括：**事实、数据、逻辑推理、权威引用、案例分析、历史事件、比较分析、价值观、常识判断**等，你需要把论据的内容概括作为support或attack的text写入\n"
             " 10. 如果论点拓扑图为空，意味着比赛刚刚开始，是立论环节。在立论环节，你需要识别一辩立论中的论据（即support），程序会帮你处理未知的target_id\n\n"
             
-            f"这一场比赛的辩题为：{TOPIC}，你可以根据论点对辩题的论证力度来判断论点的重要性。"
+            f"这一场比赛的辩题为：{self.topic}，你可以根据论点对辩题的论证力度来判断论点的重要性。"
         )
             
         prompt_user = (
@@ -161,32 +137,93 @@ class LLMClient:
             "当前的论点拓扑图如下：\n"
             f"{graph_snapshot}\n"
         )
-        
-        if(len(round_text)+len(graph_snapshot)+ 800 > 16000):
-            model = MODEL_READ1
-        else:
-            model = MODEL_READ2
-        # 如果文本长度过长，使用更大的模型
-        
-        response = self.client.chat.completions.create(
-            model = model,
-            messages=[
-                {"role": "system", "content": prompt_system},
-                {"role": "user", "content": prompt_user}
-            ],
-            temperature=0.5,
-            max_tokens=4025
-        )
-        
-        llm_output = response.choices[0].message.content
-        
-        try:
-            data = json.loads(clean_model_response(llm_output))
-        except json.JSONDecodeError:
-            raise ValueError("LLM输出无法解析为JSON: " + llm_output)
-        return data
+        return [
+            {"role": "system", "content": prompt_system},
+            {"role": "user", "content": prompt_user}
+        ]
 
-    def generate_commentary(self, details):
+    def extraction_fingerprint(self):
+        """抽取提示词模板和模型配置的哈希：其中任何一项改变，之前抽取的结果就不再对应当前的配置"""
+        config = {
+            "messages": self.extraction_messages("{round_text}", "{graph_snapshot}"),
+            "models": [vars(profile) for profile in EXTRACT_MODELS],
+            "objective": ROUTER_OBJECTIVE,
+            "max_tokens": EXTRACT_MAX_TOKENS,
+            "temperature": EXTRACT_TEMPERATURE,
+            "snapshot_token_budget": SNAPSHOT_TOKEN_BUDGET
+        }
+        canonical = json.dumps(config, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def aextract_information(self, round_text, graph_snapshot, on_update=None):
+        """
+        返回本轮的更新指令列表。回复按 JSON 数组增量解析（见“流式解析.py”），
+        每条指令一闭合就调用 on_update(指令)；个别指令无法解析或回复结尾被截断时，保留其余指令。
+        """
+        messages = self.extraction_messages(round_text, graph_snapshot)
+        # 按估算的 token 数排除上下文放不下的模型，再按实测的延迟、错误率和花费排序；失败时依次退回下一个模型
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        candidates = self.router.candidates(prompt_tokens, EXTRACT_MAX_TOKENS)
+        get_tracer().annotate(prompt_tokens_estimate=prompt_tokens, route=candidates)
+        last_error = None
+        for model in candidates:
+            start = time.perf_counter()
+            parser = JsonArrayStream()
+            pieces, updates, stats = [], [], {}
+            first_update_seconds = None
+
+            def consume(piece):
+                nonlocal first_update_seconds
+                pieces.append(piece)
+                for update in parser.feed(piece):
+                    if first_update_seconds is None:
+                        first_update_seconds = time.perf_counter() - start
+                    updates.append(update)
+                    if on_update is not None:
+                        on_update(update)
+
+            try:
+                if STREAM_EXTRACTION:
+                    stream = self.backend.chat_stream(model, messages, temperature=EXTRACT_TEMPERATURE, max_tokens=EXTRACT_MAX_TOKENS, stats=stats)
+                    async with aclosing(stream):
+                        async for piece in stream:
+                            consume(piece)
+                else:
+                    response = await self.backend.chat(model, messages, temperature=EXTRACT_TEMPERATURE, max_tokens=EXTRACT_MAX_TOKENS)
+                    stats = {"usage": response.get("usage"), "from_cache": response.get("from_cache", False)}
+                    consume(response["choices"][0]["message"]["content"])
+            except Exception as e:
+                if not updates:
+                    self.router.record(model, time.perf_counter() - start, prompt_tokens, 0, ok=False)
+                    last_error = e
+                    print(f"模型 {model} 调用失败（{e}），尝试下一个模型")
+                    continue
+                # 已收到的指令可能已经写入论点拓扑图，不能再换模型重来，保留它们
+                print(f"模型 {model} 的回复在中途中断（{e}），保留已收到的 {len(updates)} 条更新")
+            parser.close()
+            llm_output = "".join(pieces)
+            usage = stats.get("usage") or {}
+            completion_tokens = usage.get("completion_tokens") or estimate_tokens(llm_output)
+            if not parser.parsed_anything():
+                get_tracer().count("parse_failures")
+                if self.cache is not None:
+                    # 不可用的回复不留在缓存里，否则重跑时同一模型总是返回同一个坏回复
+                    self.backend.discard(model, messages, temperature=EXTRACT_TEMPERATURE, max_tokens=EXTRACT_MAX_TOKENS)
+                self.router.record(model, time.perf_counter() - start, prompt_tokens, completion_tokens, ok=False)
+                last_error = ValueError("LLM输出无法解析为JSON: " + llm_output)
+                print(f"模型 {model} 的输出无法解析为JSON，尝试下一个模型")
+                continue
+            if parser.errors or parser.truncated:
+                get_tracer().count("partial_parses")
+                print(f"模型 {model} 的输出中有 {parser.errors} 条指令无法解析{'，结尾被截断' if parser.truncated else ''}，"
+                      f"保留其余 {len(updates)} 条")
+            self.router.record(model, time.perf_counter() - start, usage.get("prompt_tokens") or prompt_tokens,
+                               completion_tokens, ok=True, cached=stats.get("from_cache", False))
+            get_tracer().annotate(model=model, first_update_seconds=first_update_seconds)
+            return updates
+        raise last_error
+
+    async def agenerate_commentary(self, details):
         prompt = (
             "你是一位资深辩论评委，请根据以下辩论比赛数据生成评委点评，要求清晰地梳理场上的攻防过程，让观众信服这场比赛的结果。数据如下：\n"
             "论点拓扑图以 JSON 格式表示，是一个数组，每个元素是一个节点，包含字段：\n"
@@ -200,35 +237,231 @@ class LLMClient:
             "  round_number: 发言所在的辩论轮数\n"
             "\n"
             "你可以根据当前的论点拓扑图情况，了解当前的辩论战局。\n\n"
-            f"比赛辩题：{TOPIC}\n"
+            f"比赛辩题：{self.topic}\n"
             f"Pro 总论点得分: {details.get('Pro_score')}\n"
             f"Con 总论点得分: {details.get('Con_score')}\n"
             f"比赛结果: {details.get('result')}\n"
             f"论点拓扑图：{details.get('graph_snapshot')}\n"
             "请输出中文点评，2000字左右。你需要像一个人类评委那样点评，也就是最好不要表现出“我是从论点拓扑图里得到的比赛信息”的姿态。而是不露痕迹地梳理攻防，判断哪些论点立住了，哪些论点被挑战了。"
         )
-        response = self.client.chat.completions.create(
+        response = await self.backend.chat(
             model=MODEL_EVALUATION,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
             max_tokens=4025
         )
-        commentary = response.choices[0].message.content
+        commentary = response["choices"][0]["message"]["content"]
         return commentary
 
 ############################################
 # 辩论评委模型：整合调用与图更新
 ############################################
 class DebateJudgeModel:
-    def __init__(self, api_key, argument_rounds):
+    def __init__(self, api_key, argument_rounds, topic=TOPIC):
         self.graph = DebateGraph()
         self.node_counter = 0
-        self.llm_client = LLMClient(api_key)
+        self.topic = topic
+        self.llm_client = LLMClient(api_key, topic=topic)
         self.argument_rounds = argument_rounds  # 保存立论环节的轮数
         global WINDOW_LENGTH
         self.window_length = WINDOW_LENGTH  # 保存窗口长度
+        self.score_timeline = []  # 每轮结束后的实时比分
+        self.failed_rounds = []  # 重试后仍然失败的轮次，不再静默丢弃
+        self.scoreboard_path = SCOREBOARD_PATH
+        self.journal_file = None  # 轮次日志，由 open_journal 打开
+        self.completed_rounds = set()  # 已从日志回放、无需重新处理的轮次
 
     def process_round(self, transcript, round_number):
+        """处理一轮发言并更新论点拓扑图，返回本轮结束后的实时比分"""
+        self._update_graph(transcript, round_number)
+        return self.record_scoreboard(round_number)
+
+    def record_scoreboard(self, round_number):
+        """读取增量维护的比分（不重新遍历全图），追加到时间线，并按需写出一行 JSON"""
+        entry = {
+            "round": round_number,
+            "time": time.time(),
+            "Pro": self.graph.team_scores["Pro"],
+            "Con": self.graph.team_scores["Con"],
+            "arguments": [
+                {"id": arg_id, "speaker": self.graph.nodes[arg_id].speaker,
+                 "text": text_snippet(self.graph.nodes[arg_id].text), "score": score}
+                for arg_id, score in self.graph.aggregates.items()
+            ]
+        }
+        self.score_timeline.append(entry)
+        if self.scoreboard_path:
+            with open(self.scoreboard_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"Round {round_number}: 实时比分 Pro {entry['Pro']:.2f} : Con {entry['Con']:.2f}")
+        return entry
+
+    def _update_graph(self, transcript, round_number):
+        round_text, graph_snapshot = self.build_round_input(transcript, round_number)
+        counter_before = self.node_counter
+        # 每条更新指令一到达就写入论点拓扑图
+        state = self.new_round_state()
+        try:
+            updates = run_sync(self.aextract_round(round_number, round_text, graph_snapshot,
+                                                   on_update=lambda update: self.apply_update(update, round_number, state)))
+        except Exception as e:
+            print(f"Round {round_number}: LLM调用出错：{e}")
+            self.failed_rounds.append(round_number)
+            return
+        if not updates:
+            print(f"Round {round_number}: 无更新指令。")
+        self.write_journal(round_number, transcript, updates, counter_before)
+
+    ############################################
+    # 轮次日志：每轮合并后追加一行，重跑时回放已完成的轮次
+    ############################################
+    def journal_header(self):
+        # 提示词或抽取模型配置改变后，日志中的轮次不再可信，重新处理
+        return {"topic": self.topic, "argument_rounds": list(self.argument_rounds), "window_length": self.window_length,
+                "extraction": self.llm_client.extraction_fingerprint()}
+
+    def open_journal(self, journal_path, transcripts):
+        """
+        回放日志中已完成的轮次（不调用大模型），并打开日志供之后每轮追加。
+        从第一轮起依次回放，遇到缺失、失败或发言内容已改变的轮次即停止，该轮及之后的轮次重新处理。
+        返回回放的轮数。
+        """
+        records = read_jsonl(journal_path)
+        kept = []
+        if records and records[0].get("header") == self.journal_header():
+            for record in records[1:]:
+                round_number = record["round"]
+                if (round_number != len(kept) + 1 or round_number > len(transcripts)
+                        or record["transcript_hash"] != transcript_hash(transcripts[round_number - 1])):
+                    break
+                print(f"\n==== 从日志回放第 {round_number} 轮辩论 ====")
+                self.apply_updates(record["updates"], round_number)
+                if self.node_counter != record["node_counter"]:
+                    # 回放得到的节点与记录不一致，日志不可信，全部重新处理
+                    print(f"警告：第 {round_number} 轮回放结果与日志不一致，放弃日志，从第 1 轮重新处理")
+                    self.graph = DebateGraph()
+                    self.node_counter = 0
+                    self.score_timeline = []
+                    kept = []
+                    break
+                self.record_scoreboard(round_number)
+                kept.append(record)
+        elif records:
+            print(f"日志 {journal_path} 与当前辩题、轮次设置或抽取配置不符，重新开始")
+
+        # 只保留能接上的部分，之后的轮次会重新处理并追加
+        rewrite_jsonl(journal_path, [{"header": self.journal_header()}] + kept)
+        self.journal_file = open(journal_path, "a", encoding="utf-8")
+        self.completed_rounds = {record["round"] for record in kept}
+        if kept:
+            print(f"已从日志回放 {len(kept)} 轮，从第 {len(kept) + 1} 轮继续")
+        return len(kept)
+
+    def write_journal(self, round_number, transcript, updates, counter_before):
+        """追加一轮的更新指令和由此产生的节点；写入后立即落盘，进程随时退出都不会丢失已完成的轮次"""
+        if self.journal_file is None:
+            return
+        record = {
+            "round": round_number,
+            "transcript_hash": transcript_hash(transcript),
+            "updates": updates,
+            "node_ids": [f"node_{k}" for k in range(counter_before + 1, self.node_counter + 1)],
+            "node_counter": self.node_counter
+        }
+        self.journal_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+
+    def close_journal(self):
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+
+    ############################################
+    # 并行调度：按轮次依赖关系并发请求，按轮次顺序合并
+    ############################################
+    def round_dependencies(self, round_number):
+        """返回构造第 round_number 轮快照时需要用到的轮次，与 build_round_input 的取点规则一致"""
+        if round_number in self.argument_rounds:
+            return set()
+        earlier = range(1, round_number)
+        if round_number <= (2 + self.window_length):
+            return set(earlier)
+        return {r for r in earlier if r in self.argument_rounds or r >= round_number - self.window_length}
+
+    async def aextract_round(self, round_number, round_text, graph_snapshot, on_update=None):
+        """抽取一轮的更新指令，记录为一个追踪 span：轮次、发言长度、快照大小，以及其中的请求和解析失败"""
+        with get_tracer().span("round.extract", round=round_number, round_chars=len(round_text),
+                               snapshot_tokens=estimate_tokens(graph_snapshot)):
+            return await self.llm_client.aextract_information(round_text, graph_snapshot, on_update)
+
+    def run_rounds(self, transcripts):
+        """同步入口：并发处理所有轮次，返回每轮的实时比分"""
+        return run_sync(self.arun_rounds(transcripts))
+
+    async def arun_rounds(self, transcripts):
+        """
+        一轮的依赖全部合并进图后立即发出请求，互不依赖的轮次并发执行（并发数受后端限制）；
+        结果严格按轮次顺序合并，因此节点编号、去重和比分与逐轮串行处理完全一致。
+        正在合并的那一轮，每条更新指令一到达就写入论点拓扑图；之后的轮次先缓存已到达的指令，轮到它时再依次写入。
+        """
+        merged = {r: asyncio.Event() for r in range(1, len(transcripts) + 1)}
+        for round_number in self.completed_rounds:
+            merged[round_number].set()
+        rounds = [r for r in merged if r not in self.completed_rounds]
+        received = {r: [] for r in rounds}  # 已到达的更新指令
+        applied = {r: 0 for r in rounds}  # 其中已写入图的条数
+        states = {r: self.new_round_state() for r in rounds}
+        merging = None  # 正在合并的轮次
+
+        def apply_received(round_number):
+            while applied[round_number] < len(received[round_number]):
+                self.apply_update(received[round_number][applied[round_number]], round_number, states[round_number])
+                applied[round_number] += 1
+
+        def on_update(round_number, update):
+            # 回调和合并循环都在事件循环线程中执行，不需要加锁
+            received[round_number].append(update)
+            if round_number == merging:
+                apply_received(round_number)
+
+        async def extract(round_number):
+            for dep in self.round_dependencies(round_number):
+                await merged[dep].wait()
+            round_text, graph_snapshot = self.build_round_input(transcripts[round_number - 1], round_number)
+            print(f"Round {round_number}: 已发出请求")
+            return await self.aextract_round(round_number, round_text, graph_snapshot,
+                                             on_update=lambda update: on_update(round_number, update))
+
+        tasks = {r: asyncio.create_task(extract(r)) for r in rounds}
+        entries = []
+        try:
+            for round_number in rounds:
+                print(f"\n==== 合并第 {round_number} 轮辩论 ====")
+                counter_before = self.node_counter
+                merging = round_number
+                apply_received(round_number)
+                try:
+                    updates = await tasks[round_number]
+                except Exception as e:
+                    print(f"Round {round_number}: LLM调用出错：{e}")
+                    self.failed_rounds.append(round_number)
+                    updates = None
+                apply_received(round_number)
+                merging = None
+                if updates is not None:
+                    if not updates:
+                        print(f"Round {round_number}: 无更新指令。")
+                    self.write_journal(round_number, transcripts[round_number - 1], updates, counter_before)
+                entries.append(self.record_scoreboard(round_number))
+                merged[round_number].set()
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return entries
+
+    def build_round_input(self, transcript, round_number):
+        """返回 (本轮发言文本, 论点拓扑图快照)"""
         # 整合本轮发言文本
         round_text_lines = [f"{text['speaker']}: {text['text']}" for text in transcript]
         round_text = "\n".join(round_text_lines)
@@ -240,70 +473,79 @@ class DebateJudgeModel:
         else:
             if round_number <= (2 + self.window_length):
                 # 如果当前轮次较小，则传入完整的图
-                graph_snapshot = self.graph.to_json()
+                relevant_nodes = list(self.graph.nodes.values())
             else:
                 # 传入立论轮和最近 window_length 轮的节点
                 relevant_nodes = []
                 for node in self.graph.nodes.values():
                     # 注意：要求每个节点在创建时记录了所属的 round_number
                     if (node.round_number in self.argument_rounds) or (node.round_number is not None and node.round_number >= round_number - self.window_length):
-                        relevant_nodes.append(node.to_dict())
-                graph_snapshot = json.dumps(relevant_nodes, ensure_ascii=False, indent=2)
-        
-        try:
-            updates = self.llm_client.extract_information(round_text, graph_snapshot)
-        except Exception as e:
-            print(f"Round {round_number}: LLM调用出错：{e}")
-            return
+                        relevant_nodes.append(node)
+            # 按相关性排序并压缩为表格，不超过 token 预算
+            graph_snapshot = encode_snapshot(relevant_nodes, SNAPSHOT_TOKEN_BUDGET)
+        return round_text, graph_snapshot
 
+    def apply_updates(self, updates, round_number):
+        """把大模型返回的更新指令写入论点拓扑图"""
         if not updates:
             print(f"Round {round_number}: 无更新指令。")
             return
-
-        # 在 process_round 方法中，替换原来的更新处理循环：
-        last_new_argument_id = None  # 记录最新加入的 new_argument 节点的 node_id
-
+        state = self.new_round_state()
         for update in updates:
-            action = update.get("action", "none")
-            speaker = update.get("speaker", "Unknown")
-            if action == "new_argument":
-                self.node_counter += 1
-                node_id = f"node_{self.node_counter}"
-                text = update.get("text", "")
-                try:
-                    importance = float(update.get("importance", 1.0))
-                except Exception:
-                    importance = 1.0
-                new_node = UtteranceNode(node_id, speaker, text, "new_argument", base_importance=importance, round_number = round_number)
-                self.graph.add_node(new_node)
-                last_new_argument_id = node_id  # 更新记录
-                print(f"Round {round_number}: 添加新论点 {node_id}（{speaker}）：{text}，初始重要性：{importance}")
-            elif action in ("support", "attack"):
-                # 直接尝试获取 target_id
-                target_id = update.get("target_id")
-                # 如果当前为第一轮或者 target_id 无效，则使用上一个 new_argument 的 node_id
-                if round_number == 1 or not target_id or target_id not in self.graph.nodes:
-                    if last_new_argument_id is None:
-                        print(f"Round {round_number}: {speaker} 的更新 {update} 无法找到对应的 new_argument 节点，跳过。")
-                        continue
-                    target_id = last_new_argument_id
-                self.node_counter += 1
-                node_id = f"node_{self.node_counter}"
-                text = update.get("text", "")
-                try:
-                    delta = float(update.get("delta", 0.0))
-                except Exception:
-                    delta = 0.0
-                if action == "attack" and delta > 0:
-                    delta = -delta
-                new_node = UtteranceNode(node_id, speaker, text, action, target_id=target_id, delta=delta, round_number=round_number)
-                self.graph.add_node(new_node)
-                print(f"Round {round_number}: {speaker} 的更新 {node_id} 被识别为 {action}，针对 {target_id}：{text}，影响值：{delta}")
-            else:
-                print(f"Round {round_number}: {speaker} 的更新指令未识别：{update}")
+            self.apply_update(update, round_number, state)
+
+    def new_round_state(self):
+        # 一轮之内跨指令的状态：记录最新加入的 new_argument 节点的 node_id
+        return {"last_new_argument_id": None}
 
-        # 移除重复的节点（用文本匹配去重）
-        self.graph.remove_duplicate_nodes()
+    def apply_update(self, update, round_number, state):
+        """把一条更新指令写入论点拓扑图；同一轮的指令按顺序调用，并共用同一个 state"""
+        action = update.get("action", "none")
+        speaker = update.get("speaker", "Unknown")
+        text = update.get("text", "")
+        duplicate_id = self.graph.find_duplicate(text)
+        if action in ("new_argument", "support", "attack") and duplicate_id is not None:
+            # 与已有节点文本相同：不新增节点，后续更新改为指向已有节点
+            if action == "new_argument" and self.graph.nodes[duplicate_id].node_type == "new_argument":
+                state["last_new_argument_id"] = duplicate_id
+            print(f"Round {round_number}: {speaker} 的更新与已有节点 {duplicate_id} 重复，已合并：{text}")
+            return
+        if action == "new_argument":
+            self.node_counter += 1
+            node_id = f"node_{self.node_counter}"
+            try:
+                importance = float(update.get("importance", 1.0))
+            except Exception:
+                importance = 1.0
+            new_node = UtteranceNode(node_id, speaker, text, "new_argument", base_importance=importance, round_number = round_number)
+            self.graph.add_node(new_node)
+            state["last_new_argument_id"] = node_id  # 更新记录
+            print(f"Round {round_number}: 添加新论点 {node_id}（{speaker}）：{text}，初始重要性：{importance}")
+        elif action in ("support", "attack"):
+            # 直接尝试获取 target_id
+            target_id = update.get("target_id")
+            if target_id:
+                # 快照中使用的是短 id，先还原为 node_xx
+                target_id = self.graph.resolve(expand_id(target_id))
+            # 如果当前为第一轮或者 target_id 无效，则使用上一个 new_argument 的 node_id
+            if round_number == 1 or not target_id or target_id not in self.graph.nodes:
+                if state["last_new_argument_id"] is None:
+                    print(f"Round {round_number}: {speaker} 的更新 {update} 无法找到对应的 new_argument 节点，跳过。")
+                    return
+                target_id = state["last_new_argument_id"]
+            self.node_counter += 1
+            node_id = f"node_{self.node_counter}"
+            try:
+                delta = float(update.get("delta", 0.0))
+            except Exception:
+                delta = 0.0
+            if action == "attack" and delta > 0:
+                delta = -delta
+            new_node = UtteranceNode(node_id, speaker, text, action, target_id=target_id, delta=delta, round_number=round_number)
+            self.graph.add_node(new_node)
+            print(f"Round {round_number}: {speaker} 的更新 {node_id} 被识别为 {action}，针对 {target_id}：{text}，影响值：{delta}")
+        else:
+            print(f"Round {round_number}: {speaker} 的更新指令未识别：{update}")
         
     def evaluate_debate(self):
         """
@@ -312,11 +554,8 @@ class DebateJudgeModel:
         team_scores = {"Pro": 0.0, "Con": 0.0}
         for node in self.graph.nodes.values():
             if node.node_type == "new_argument":
-                aggregated = node.base_importance
-                # 累加所有支持/反驳对该论点的贡献
-                for other in self.graph.nodes.values():
-                    if other.target_id == node.node_id:
-                        aggregated += other.delta
+                # 通过反向索引累加所有支持/反驳对该论点的贡献
+                aggregated = self.graph.argument_score(node.node_id)
                 # 只计入正向贡献
                 if node.speaker not in team_scores:
                     print(f"错误：发现未知发言者 '{node.speaker}'")
@@ -352,59 +591,149 @@ class DebateJudgeModel:
 ############################################
 # 主流程
 ############################################
-def main():
-    filepath = FILEPATH
-    with open(filepath, 'r', encoding='utf-8') as f:
-        transcripts = json.load(f)
-        
-    api_key = API_KEY
-    judge_model = DebateJudgeModel(api_key, ARGUMENT_ROUNDS)
-    round_number = 1
-    for transcript in transcripts:
-        print(f"\n==== 开始第 {round_number} 轮辩论 ====")
-        judge_model.process_round(transcript, round_number)
-        round_number += 1
-
-    print("\n==== 辩论结束 ====\n")
-
-    with open(f"{TOPIC}.json", 'w', encoding='utf-8') as f:
-        f.write(judge_model.graph.to_json())
-    print(f"\n论点拓扑图json已保存为 {TOPIC}.json")
-
-    # 使用词向量技术对论点拓扑图进行清洗查重
-    check_similarity(f"{TOPIC}.json", api_key, f"{TOPIC}.json")
-    
-    # 读取清洗后的论点拓扑图
-    with open(f"{TOPIC}.json", 'r', encoding='utf-8') as f:
-        cleaned_graph = json.load(f)
-        
-    # 把清洗后的论点拓扑图传入评分函数
-    judge_model.graph = DebateGraph()
-    for node_dict in cleaned_graph:
-        node = UtteranceNode(
-            node_id=node_dict["id"],
-            speaker=node_dict["speaker"],
-            text=node_dict["text"],
-            node_type=node_dict["node_type"],
-            base_importance=node_dict.get("base_importance", 0.0),
-            target_id=node_dict.get("target_id"),
-            delta=node_dict.get("delta", 0.0),
-            round_number=node_dict.get("round_number")
-        )
-        judge_model.graph.add_node(node)
-        
+# matplotlib 的 pyplot 不是线程安全的，多场比赛并发评判时串行绘图
+RENDER_LOCK = threading.Lock()
+
+def load_graph(graph_path):
+    """读取论点拓扑图json，返回 (DebateGraph, 节点字典列表)"""
+    with open(graph_path, 'r', encoding='utf-8') as f:
+        nodes_list = json.load(f)
+    return DebateGraph.from_dicts(nodes_list), nodes_list
+
+def score_debate(graph_path, api_key=API_KEY, topic=TOPIC):
+    """只对已有的论点拓扑图评分，不调用大模型。返回 (judge_model, Pro_score, Con_score, result)"""
+    judge_model = DebateJudgeModel(api_key, ARGUMENT_ROUNDS, topic=topic)
+    judge_model.graph, _ = load_graph(graph_path)
     Pro_score, Con_score, result = judge_model.evaluate_debate()
-    
-    print("\n==== 最终结果 ====")
-    print(f"Pro 得分：{Pro_score:.2f}")
-    print(f"Con 得分：{Con_score:.2f}")
-    print(f"比赛结果：{result}")
+    return judge_model, Pro_score, Con_score, result
+
+def write_commentary(judge_model, Pro_score, Con_score, result, nodes_list, commentary_path):
     print("\n评委点评：")
-    commentary = judge_model.generate_judgement_commentary(Pro_score, Con_score, result, json.dumps(cleaned_graph, ensure_ascii=False, indent=2))
+    commentary = judge_model.generate_judgement_commentary(Pro_score, Con_score, result, json.dumps(nodes_list, ensure_ascii=False, indent=2))
     print(commentary)
+    with open(commentary_path, 'w', encoding='utf-8') as f:
+        f.write(commentary)
+    return commentary
+
+def render_graph(graph_path, topic, image_path):
+    from 绘制论点拓扑图 import main as visualize_graph
+    with RENDER_LOCK:
+        visualize_graph(graph_path, topic, output_path=image_path)
+
+def judge_debate(topic, filepath, api_key=API_KEY, output_dir=".", argument_rounds=ARGUMENT_ROUNDS, output_name=None):
+    """
+    完整评判一场比赛：逐轮建图、查重、评分、点评、绘图。
+    所有输出都写入 output_dir，文件名以 output_name（默认为辩题）开头。返回得分、结果、各输出路径和各阶段耗时。
+    """
+    tracer = configure_tracing(TRACE_PATH, METRICS_PORT, METRICS_PATH)
+    with tracer.span("debate", topic=topic) as debate_span:
+        outcome = run_pipeline(tracer, topic, filepath, api_key, output_dir, argument_rounds, output_name or topic)
+    # 本场比赛的各阶段耗时、各模型的请求延迟和 token 用量
+    summary = tracer.summary(debate_span.span_id)
+    print("\n" + format_summary(summary))
+    outcome["stage_seconds"] = summary["stages"]
+    return outcome
+
+def run_pipeline(tracer, topic, filepath, api_key, output_dir, argument_rounds, output_name):
+    os.makedirs(output_dir, exist_ok=True)
+    graph_path = os.path.join(output_dir, f"{output_name}.json")
+    image_path = os.path.join(output_dir, f"{output_name}.{IMAGE_FORMAT}")
+    commentary_path = os.path.join(output_dir, f"{output_name}_点评.txt")
+    journal_path = os.path.join(output_dir, f"{output_name}.journal.jsonl")
+
+    with open(filepath, 'r', encoding='utf-8') as f:
+        transcripts = json.load(f)
+        
+    judge_model = DebateJudgeModel(api_key, argument_rounds, topic=topic)
+    if SCOREBOARD_PATH:
+        judge_model.scoreboard_path = os.path.join(output_dir, os.path.basename(SCOREBOARD_PATH))
+    with tracer.span("stage.extraction", rounds=len(transcripts)):
+        if JOURNAL_ENABLED:
+            # 上次中途退出时，已完成的轮次从日志回放，只重新处理之后的轮次
+            judge_model.open_journal(journal_path, transcripts)
+        # 互不依赖的轮次（如各立论轮）并发请求，结果按轮次顺序合并
+        try:
+            judge_model.run_rounds(transcripts)
+        finally:
+            judge_model.close_journal()
+
+        print("\n==== 辩论结束 ====\n")
+        if judge_model.failed_rounds:
+            print(f"警告：第 {judge_model.failed_rounds} 轮在多次重试后仍然失败，这些轮次的发言没有计入论点拓扑图")
+
+        with open(graph_path, 'w', encoding='utf-8') as f:
+            f.write(judge_model.graph.to_json())
+        print(f"\n论点拓扑图json已保存为 {graph_path}")
+
+    # 之后的各环节按依赖关系并发执行（见“阶段调度.py”）：
+    #   dedup → scoring → library / commentary，绘图只依赖查重结果，与评分、点评同时进行
+    def dedup(raw_graph_path):
+        # 使用词向量技术对论点拓扑图进行清洗查重
+        from 论点查重 import main as check_similarity
+        check_similarity(raw_graph_path, api_key, raw_graph_path, base_url=BASE_URL)
+        return {"graph_path": raw_graph_path}
+
+    def scoring(graph_path):
+        # 读取清洗后的论点拓扑图，传入评分函数
+        judge_model.graph, cleaned_graph = load_graph(graph_path)
+        Pro_score, Con_score, result = judge_model.evaluate_debate()
+        print("\n==== 最终结果 ====")
+        print(f"Pro 得分：{Pro_score:.2f}")
+        print(f"Con 得分：{Con_score:.2f}")
+        print(f"比赛结果：{result}")
+        return {"graph": judge_model.graph, "cleaned_graph": cleaned_graph, "scores": (Pro_score, Con_score, result)}
+
+    def library(graph):
+        # 把本场比赛的论点和最终得分收录进跨比赛论点库，以后遇到相近的论点可以直接查到
+        from 论点查重 import add_to_library
+        added = add_to_library(topic, graph, graph_path, api_key, BASE_URL)
+        if added:
+            print(f"论点库：收录本场 {added} 条论点")
+
+    def commentary(scores, cleaned_graph):
+        write_commentary(judge_model, *scores, cleaned_graph, commentary_path)
+
+    render_pool = "process" if RENDER_IN_PROCESS and IMAGE_FORMAT == "png" else "thread"
+    stages = [
+        Stage("dedup", dedup, inputs=("raw_graph_path",), outputs=("graph_path",)),
+        Stage("scoring", scoring, inputs=("graph_path",), outputs=("graph", "cleaned_graph", "scores")),
+        # 论点库只是附带的收录，失败（如向量请求出错）不影响本场的评分、点评和绘图
+        Stage("library", library, inputs=("graph",), optional=True),
+        Stage("commentary", commentary, inputs=("scores", "cleaned_graph")),
+        # 输出论点拓扑图图片
+        Stage("rendering", render_graph, inputs=("graph_path", "topic", "image_path"), pool=render_pool),
+    ]
+    values, stage_report = run_stages(stages, {"raw_graph_path": graph_path, "topic": topic, "image_path": image_path})
+    Pro_score, Con_score, result = values["scores"]
+    print("\n" + format_stage_report(stage_report))
+    if JOURNAL_ENABLED and not judge_model.failed_rounds and os.path.exists(journal_path):
+        # 整场评判已完成，日志只用于中途退出后续跑；删除后再次运行会按当前的提示词和模型重新抽取。
+        # 有失败的轮次时保留日志，重跑只需重新处理这些轮次及之后的轮次
+        os.remove(journal_path)
     
-    # 输出论点拓扑图图片
-    visualize_graph(f"{TOPIC}.json",TOPIC)
+    if judge_model.llm_client.cache is not None:
+        stats = judge_model.llm_client.cache.stats()
+        print(f"\n响应缓存：命中 {stats['hits']} 次，未命中 {stats['misses']} 次，淘汰 {stats['evictions']} 条，共 {stats['entries']} 条")
+    limiter = get_shared_limiter().metrics()
+    print(f"限流器：共 {limiter['requests']} 次请求，平均排队 {limiter['avg_wait_seconds']:.2f} 秒，最大排队 {limiter['max_queue_depth']} 个，"
+          f"重试 {limiter['retries']} 次（其中 429 共 {limiter['rate_limited']} 次）")
+    if judge_model.llm_client.router.report():
+        print("模型路由：\n" + judge_model.llm_client.router.report())
+
+    return {
+        "topic": topic,
+        "Pro_score": Pro_score,
+        "Con_score": Con_score,
+        "result": result,
+        "failed_rounds": judge_model.failed_rounds,
+        "graph_path": graph_path,
+        "image_path": image_path,
+        "commentary_path": commentary_path,
+        "postprocess": stage_report
+    }
+
+def main():
+    judge_debate(TOPIC, FILEPATH, API_KEY)
 
 
 if __name__ == "__main__":
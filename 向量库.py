@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from 日志文件 import read_jsonl, rewrite_jsonl
+
+# 本地向量库：把文本的词向量持久化到内存映射文件中，跨运行、跨比赛复用。
+# 每个 (模型, 维度) 对应一组文件：
+#   <模型>_<维度>.f32         float32 向量矩阵，按行存放，容量不够时成倍扩容
+#   <模型>_<维度>.index.jsonl 文本哈希 -> 行号，追加写入
+# 先写向量再追加索引，进程中途退出时最多丢失最后一条未写完的索引，不会读到半截向量；
+# 载入时把写到一半的索引行截掉，并丢弃指向向量文件之外的索引（见“日志文件.py”）。
+# 同一组文件只应由一个进程写入。
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingStore:
+    def __init__(self, directory, model, dimensions, initial_capacity=1024):
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{model}_{dimensions}")
+        self.base_path = base
+        self.vectors_path = base + ".f32"
+        self.index_path = base + ".index.jsonl"
+        self.model = model
+        self.dimensions = dimensions
+        self._lock = threading.Lock()
+
+        row_bytes = 4 * dimensions
+        existing_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        records = read_jsonl(self.index_path)
+        valid = [record for record in records if record["row"] < existing_rows]
+        if len(valid) < len(records):
+            # 向量文件比索引短（被截断或替换过），这些行的向量已不存在，之后重新请求
+            print(f"{self.index_path}：{len(records) - len(valid)} 条索引超出向量文件的 {existing_rows} 行，已丢弃")
+            rewrite_jsonl(self.index_path, valid)
+        self.rows = {record["hash"]: record["row"] for record in valid}
+        self.count = max(self.rows.values(), default=-1) + 1
+
+        self.capacity = max(existing_rows, initial_capacity, self.count)
+        self._open(self.capacity)
+
+    def _open(self, capacity):
+        mode = "r+" if os.path.exists(self.vectors_path) else "w+"
+        if mode == "r+" and os.path.getsize(self.vectors_path) < capacity * 4 * self.dimensions:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(capacity * 4 * self.dimensions)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(capacity, self.dimensions))
+        self.capacity = capacity
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self.vectors.flush()
+        del self.vectors
+        self._open(capacity)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, text):
+        return text_hash(text) in self.rows
+
+    def missing(self, texts):
+        """返回库中还没有的文本（去重，保持首次出现的顺序）"""
+        seen = set()
+        result = []
+        for text in texts:
+            h = text_hash(text)
+            if h not in self.rows and h not in seen:
+                seen.add(h)
+                result.append(text)
+        return result
+
+    def add_many(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dimensions:
+            raise ValueError(f"向量维度应为 {self.dimensions}，实际为 {vectors.shape}")
+        with self._lock:
+            new = [(text_hash(t), v) for t, v in zip(texts, vectors) if text_hash(t) not in self.rows]
+            if not new:
+                return
+            if self.count + len(new) > self.capacity:
+                self._grow(self.count + len(new))
+            start = self.count
+            for offset, (_, vector) in enumerate(new):
+                self.vectors[start + offset] = vector
+            self.vectors.flush()
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                for offset, (h, _) in enumerate(new):
+                    self.rows[h] = start + offset
+                    f.write(json.dumps({"hash": h, "row": start + offset}) + "\n")
+            self.count = start + len(new)
+
+    def get_many(self, texts):
+        """按顺序取出向量，返回 (len(texts), dimensions) 的 float32 数组。所有文本都必须已在库中"""
+        rows = [self.rows[text_hash(t)] for t in texts]
+        return np.asarray(self.vectors[rows])
+
+_stores = {}
+
+def get_embedding_store(directory, model, dimensions):
+    key = (directory, model, dimensions)
+    if key not in _stores:
+        _stores[key] = EmbeddingStore(directory, model, dimensions)
+    return _stores[key]
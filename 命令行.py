@@ -0,0 +1,200 @@
+import argparse
+import importlib
+import os
+import sys
+import time
+
+# 统一的命令行入口，各个环节可以单独运行：
+#   python 命令行.py judge      <辩题> <比赛json>        完整评判一场比赛（建图、查重、评分、点评、绘图）
+#   python 命令行.py dedup      <论点拓扑图json>          词向量查重，合并相似节点
+#   python 命令行.py score      <论点拓扑图json>          只评分，不调用大模型
+#   python 命令行.py commentary <辩题> <论点拓扑图json>   评分并生成评委点评
+#   python 命令行.py render     <辩题> <论点拓扑图json>   绘制论点拓扑图（png / svg / html）
+#   python 命令行.py transcribe <录音转文字txt>           把飞书妙记的文本转换成比赛json
+#   python 命令行.py pack       <归档> <论点拓扑图json...> 把多场比赛的论点拓扑图打包成一个二进制归档
+#   python 命令行.py library    <论点拓扑图json...>       把已评判比赛收录进跨比赛论点库
+#   python 命令行.py similar    <文本>                    在论点库中查找最接近的已知论点
+# 每个子命令只导入自己用到的模块：score 和 commentary 不会加载 numpy、networkx、matplotlib。
+# 加上 --import-time 只导入该子命令需要的模块并打印各自的耗时，不执行任何操作，例如：
+#   python 命令行.py --import-time render 辩题 图.json -o 图.png
+
+def required_modules(args):
+    """返回该子命令需要导入的模块，按导入顺序排列"""
+    if args.command == "judge":
+        modules = ["main", "论点查重", "绘制论点拓扑图"]
+        if (args.format or "png") == "png":
+            modules.append("matplotlib.pyplot")
+        return modules
+    if args.command == "dedup":
+        return ["论点查重"]
+    if args.command in ("score", "commentary"):
+        return ["main"]
+    if args.command == "render":
+        modules = ["绘制论点拓扑图"]
+        if render_output(args).lower().endswith(".png"):
+            modules.append("matplotlib.pyplot")
+        return modules
+    if args.command == "transcribe":
+        return ["录音转文字toJson"]
+    if args.command == "pack":
+        return ["论点图归档"]
+    if args.command in ("library", "similar"):
+        return ["main", "论点查重"]
+    raise ValueError(f"未知子命令：{args.command}")
+
+def import_modules(names):
+    """依次导入模块，返回 [(模块名, 耗时秒数, 新加载的模块数)]；被前面的模块顺带导入的依赖计入前者"""
+    timings = []
+    for name in names:
+        before = len(sys.modules)
+        start = time.perf_counter()
+        importlib.import_module(name)
+        timings.append((name, time.perf_counter() - start, len(sys.modules) - before))
+    return timings
+
+def print_import_times(command, timings):
+    total = sum(seconds for _, seconds, _ in timings)
+    print(f"子命令 {command} 的导入耗时：")
+    for name, seconds, loaded in timings:
+        print(f"  {name:<20}{seconds * 1000:>9.1f} ms  （新加载 {loaded} 个模块）")
+    print(f"  {'合计':<18}{total * 1000:>9.1f} ms  （共 {len(sys.modules)} 个模块）")
+
+def render_output(args):
+    if args.output:
+        return args.output
+    return os.path.splitext(args.graph)[0] + "." + (args.format or "png")
+
+############################################
+# 各子命令
+############################################
+def run_judge(args):
+    judge = sys.modules["main"]
+    if args.format:
+        judge.IMAGE_FORMAT = args.format
+    rounds = [int(r) for r in args.argument_rounds.split(",")] if args.argument_rounds else judge.ARGUMENT_ROUNDS
+    judge.judge_debate(args.topic, args.filepath, args.api_key or judge.API_KEY,
+                       output_dir=args.output_dir, argument_rounds=rounds)
+
+def run_dedup(args):
+    dedup = sys.modules["论点查重"]
+    dedup.main(args.graph, args.api_key or dedup.API_KEY, args.output or args.graph, base_url=dedup.BASE_URL)
+
+def run_score(args):
+    judge = sys.modules["main"]
+    judge.score_debate(args.graph, topic=args.topic or judge.TOPIC)
+
+def run_commentary(args):
+    judge = sys.modules["main"]
+    judge_model, Pro_score, Con_score, result = judge.score_debate(args.graph, args.api_key or judge.API_KEY, args.topic)
+    _, nodes_list = judge.load_graph(args.graph)
+    output = args.output or os.path.splitext(args.graph)[0] + "_点评.txt"
+    judge.write_commentary(judge_model, Pro_score, Con_score, result, nodes_list, output)
+
+def run_render(args):
+    draw = sys.modules["绘制论点拓扑图"]
+    draw.main(args.graph, args.topic, output_path=render_output(args))
+
+def run_transcribe(args):
+    transcribe = sys.modules["录音转文字toJson"]
+    filepath = args.filepath
+    output = args.output or "toinput" + f"{filepath[:filepath.rfind('.')] if '.' in filepath else filepath}.json"
+    transcribe.main(filepath, args.api_key or transcribe.API_KEY, args.chunk_tokens or transcribe.CHUNK_TOKENS,
+                    args.max_threads, output)
+
+def run_pack(args):
+    archive = sys.modules["论点图归档"]
+    count = archive.pack_json_files(args.graphs, args.archive)
+    print(f"已打包 {count} 场比赛到 {args.archive}")
+
+def run_library(args):
+    judge, dedup = sys.modules["main"], sys.modules["论点查重"]
+    for path in args.graphs:
+        graph, _ = judge.load_graph(path)
+        topic = os.path.splitext(os.path.basename(path))[0]
+        added = dedup.add_to_library(topic, graph, path, args.api_key or dedup.API_KEY, dedup.BASE_URL)
+        print(f"{topic}：收录 {added} 条" if added else f"{topic}：已在论点库中，跳过")
+
+def run_similar(args):
+    dedup = sys.modules["论点查重"]
+    results = dedup.similar_arguments(args.text, args.k, args.api_key or dedup.API_KEY, dedup.BASE_URL)
+    for result in results:
+        topics = "、".join(sorted({r["topic"] for r in result["occurrences"]}))
+        print(f"{result['similarity']:.3f}  平均得分 {result['mean_score']:+.2f}  {result['text']}  （{topics}）")
+
+COMMANDS = {
+    "judge": run_judge,
+    "dedup": run_dedup,
+    "score": run_score,
+    "commentary": run_commentary,
+    "render": run_render,
+    "transcribe": run_transcribe,
+    "pack": run_pack,
+    "library": run_library,
+    "similar": run_similar,
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="赛博评委命令行")
+    parser.add_argument("--import-time", action="store_true", help="只导入子命令需要的模块并打印耗时，不执行")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("judge", help="完整评判一场比赛")
+    p.add_argument("topic", help="辩题完整表述")
+    p.add_argument("filepath", help="比赛json路径")
+    p.add_argument("--api-key")
+    p.add_argument("--output-dir", default=".")
+    p.add_argument("--argument-rounds", help="立论环节的轮数，逗号分隔，如 1,3")
+    p.add_argument("--format", choices=("png", "svg", "html"), help="论点拓扑图格式，默认沿用 main.py 的 IMAGE_FORMAT")
+
+    p = sub.add_parser("dedup", help="词向量查重，合并相似节点")
+    p.add_argument("graph", help="论点拓扑图json路径")
+    p.add_argument("-o", "--output", help="输出路径，默认覆盖原文件")
+    p.add_argument("--api-key")
+
+    p = sub.add_parser("score", help="只评分，不调用大模型")
+    p.add_argument("graph", help="论点拓扑图json路径")
+    p.add_argument("--topic")
+
+    p = sub.add_parser("commentary", help="评分并生成评委点评")
+    p.add_argument("topic", help="辩题完整表述")
+    p.add_argument("graph", help="论点拓扑图json路径")
+    p.add_argument("-o", "--output", help="点评输出路径，默认为 <论点拓扑图>_点评.txt")
+    p.add_argument("--api-key")
+
+    p = sub.add_parser("render", help="绘制论点拓扑图")
+    p.add_argument("topic", help="辩题完整表述")
+    p.add_argument("graph", help="论点拓扑图json路径")
+    p.add_argument("-o", "--output", help="输出路径，扩展名决定格式（.png / .svg / .html）")
+    p.add_argument("--format", choices=("png", "svg", "html"), help="未给出 --output 时使用的格式，默认 png")
+
+    p = sub.add_parser("transcribe", help="把录音转文字的文本转换成比赛json")
+    p.add_argument("filepath", help="飞书妙记导出的txt路径")
+    p.add_argument("-o", "--output")
+    p.add_argument("--api-key")
+    p.add_argument("--chunk-tokens", type=int, help="每个chunk的token预算")
+    p.add_argument("--max-threads", type=int, default=50, help="最大并发请求数")
+
+    p = sub.add_parser("pack", help="把多场比赛的论点拓扑图打包成一个二进制归档")
+    p.add_argument("archive", help="归档输出路径，如 赛季.dgar")
+    p.add_argument("graphs", nargs="+", help="论点拓扑图json路径，辩题取文件名")
+
+    p = sub.add_parser("library", help="把已评判比赛收录进跨比赛论点库")
+    p.add_argument("graphs", nargs="+", help="论点拓扑图json路径，辩题取文件名")
+    p.add_argument("--api-key")
+
+    p = sub.add_parser("similar", help="在论点库中查找最接近的已知论点")
+    p.add_argument("text", help="要查找的论点文本")
+    p.add_argument("-k", type=int, default=5, help="返回条数")
+    p.add_argument("--api-key")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    timings = import_modules(required_modules(args))
+    if args.import_time:
+        print_import_times(args.command, timings)
+        return
+    COMMANDS[args.command](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from 大模型接口 import LLMBackend, chunk_content, response_as_chunk, response_from_chunks
+from 追踪 import get_tracer
+
+# 大模型对话响应的磁盘缓存。
+# 键为 (model, messages, temperature, max_tokens) 的哈希，值为完整的响应字典。
+# 缓存总大小超过上限时，按最近访问时间淘汰最旧的条目（LRU）。
+# 完整收到的回复先写入缓存；调用方判定回复不可用（如无法解析）时调用 CachedBackend.discard 删除，
+# 避免重跑时同样的提示词总是拿到同一个坏回复。
+
+CACHE_MODES = ("use", "refresh", "bypass")
+# use: 命中则直接返回，未命中则调用接口并写入缓存
+# refresh: 不读缓存，总是调用接口，并用新响应覆盖缓存
+# bypass: 完全不读写缓存
+
+def cache_key(payload):
+    """只用影响输出的字段计算键：模型、提示词、温度和最大输出长度"""
+    fields = {
+        "model": payload.get("model"),
+        "messages": payload.get("messages"),
+        "temperature": payload.get("temperature"),
+        "max_tokens": payload.get("max_tokens"),
+    }
+    canonical = json.dumps(fields, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, path, max_bytes=200 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key, response):
+        data = json.dumps(response, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self.total_bytes -= old[0]
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, data, size, time.time()))
+            self.total_bytes += size
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key):
+        """删除一条缓存，返回是否存在"""
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is None:
+                return False
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+            self.total_bytes -= old[0]
+            return True
+
+    def _evict(self):
+        # 按最近访问时间从旧到新删除，直到总大小回到上限以内
+        while self.total_bytes > self.max_bytes:
+            row = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            self.total_bytes -= row[1]
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": count, "bytes": self.total_bytes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class CachedBackend(LLMBackend):
+    """包装另一个后端，对对话接口的响应做磁盘缓存；向量接口直接透传"""
+    def __init__(self, inner, cache, mode="use"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"未知的缓存模式：{mode}，可选 {CACHE_MODES}")
+        self.inner = inner
+        self.cache = cache
+        self.mode = mode
+
+    async def request(self, endpoint, payload):
+        if endpoint != "chat/completions" or self.mode == "bypass":
+            return await self.inner.request(endpoint, payload)
+        key = cache_key(payload)
+        if self.mode == "use":
+            cached = self.cache.get(key)
+            if cached is not None:
+                get_tracer().annotate(cache="hit")
+                return dict(cached, from_cache=True)  # 标记缓存命中，调用方统计延迟时可以排除
+        get_tracer().annotate(cache="miss")
+        response = await self.inner.request(endpoint, payload)
+        self.cache.put(key, response)
+        return response
+
+    async def stream_request(self, endpoint, payload):
+        if endpoint != "chat/completions" or self.mode == "bypass":
+            async for chunk in self.inner.stream_request(endpoint, payload):
+                yield chunk
+            return
+        key = cache_key(payload)
+        if self.mode == "use":
+            cached = self.cache.get(key)
+            if cached is not None:
+                get_tracer().annotate(cache="hit")
+                yield response_as_chunk(dict(cached, from_cache=True))
+                return
+        get_tracer().annotate(cache="miss")
+        # 边转发边收集，完整收到后才写入缓存；中途中断的回复不缓存
+        contents, usage = [], None
+        async for chunk in self.inner.stream_request(endpoint, payload):
+            contents.append(chunk_content(chunk))
+            usage = chunk.get("usage") or usage
+            yield chunk
+        self.cache.put(key, response_from_chunks(contents, usage))
+
+    def discard(self, model, messages, temperature=None, max_tokens=None):
+        """调用方拒绝了这次对话的回复：从缓存中删除，下次同样的请求重新调用接口。参数与 chat 相同"""
+        if self.mode == "bypass":
+            return False
+        payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        return self.cache.delete(cache_key(payload))
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+_caches = {}
+
+def get_response_cache(path, max_bytes=200 * 1024 * 1024):
+    """同一路径在进程内只打开一次"""
+    if path not in _caches:
+        _caches[path] = ResponseCache(path, max_bytes)
+    return _caches[path]
@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from 限流器 import MAX_RETRIES, backoff_delay, estimate_request_tokens, get_shared_limiter
+from 追踪 import get_tracer
+
+# 智谱清言的 OpenAI 兼容接口地址
+ZHIPU_BASE_URL = "https://open.bigmodel.cn/api/paas/v4"
+
+# 本程序是 main.py、录音转文字toJson.py、论点查重.py 共用的大模型调用层。
+# 所有请求都走异步 HTTP 客户端：同一个后端对象复用连接池，并用信号量限制同时在途的请求数。
+# 请求发出前还要经过进程内共享的限流器（见“限流器.py”），遇到 429 / 5xx / 网络错误时按指数退避重试。
+# 同步代码通过 run_sync() 把协程交给后台事件循环执行，因此同步调用之间同样复用连接。
+# 每次 chat / embed 调用记录为一个追踪 span（见“追踪.py”），包含模型、token 用量、重试次数和是否命中缓存。
+# chat_stream 以流式（SSE）接收回复，逐段产出文本；不支持流式的后端等完整响应到达后一次产出。
+
+############################################
+# 后台事件循环：同步代码和异步代码共用
+############################################
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_event_loop():
+    """返回进程内共用的后台事件循环（首次调用时在守护线程中启动）"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="llm-backend-loop", daemon=True)
+            thread.start()
+    return _loop
+
+def run_sync(coro):
+    """在后台事件循环中执行协程并阻塞等待结果。不要在该事件循环内部调用"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+def request_key(endpoint, payload):
+    """
+    根据接口名和请求体生成稳定的哈希键，录制与回放都用它来匹配请求。
+    stream 字段只决定响应的传输方式，不参与哈希：流式录制的请求可以由本地替身服务器（收到的请求体带 stream）回放
+    """
+    payload = {name: value for name, value in payload.items() if name != "stream"}
+    canonical = json.dumps({"endpoint": endpoint, "payload": payload}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+############################################
+# 后端接口：返回 OpenAI/智谱兼容格式的响应字典
+############################################
+class LLMBackend:
+    async def request(self, endpoint, payload):
+        """
+        endpoint: "chat/completions" 或 "embeddings"
+        payload: 请求体字典
+        返回响应体字典。子类必须实现
+        """
+        raise NotImplementedError
+
+    async def chat(self, model, messages, temperature=None, max_tokens=None):
+        payload = {"model": model, "messages": messages}
+        if temperature is not None:
+            payload["temperature"] = temperature
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        with get_tracer().span("llm.chat", endpoint="chat/completions", model=model,
+                               prompt_chars=sum(len(m.get("content") or "") for m in messages)) as span:
+            response = await self.request("chat/completions", payload)
+            if span.attributes.get("cache") != "hit":
+                # 命中缓存的响应没有真正消耗 token
+                usage = response.get("usage") or {}
+                span.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+            return response
+
+    async def stream_request(self, endpoint, payload):
+        """
+        流式请求，逐个产出 OpenAI 兼容格式的增量块：{"choices": [{"delta": {"content": ...}}], "usage": ...}。
+        默认实现不是真正的流式：等完整响应到达后作为一个块产出。
+        """
+        response = await self.request(endpoint, payload)
+        yield response_as_chunk(response)
+
+    async def chat_stream(self, model, messages, temperature=None, max_tokens=None, stats=None):
+        """
+        流式对话，逐段产出回复文本。结束后在 stats 字典中填入 usage 和 from_cache。
+        应在同一个任务中消费完，或用 contextlib.aclosing 提前关闭，追踪 span 才能正确结束。
+        """
+        payload = {"model": model, "messages": messages}
+        if temperature is not None:
+            payload["temperature"] = temperature
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        stats = stats if stats is not None else {}
+        with get_tracer().span("llm.chat", endpoint="chat/completions", model=model, stream=True,
+                               prompt_chars=sum(len(m.get("content") or "") for m in messages)) as span:
+            start = time.perf_counter()
+            received = 0
+            async for chunk in self.stream_request("chat/completions", payload):
+                if chunk.get("usage"):
+                    stats["usage"] = chunk["usage"]
+                if chunk.get("from_cache"):
+                    stats["from_cache"] = True
+                content = chunk_content(chunk)
+                if content:
+                    if not received:
+                        span.set(first_chunk_seconds=time.perf_counter() - start)
+                    received += len(content)
+                    yield content
+            if span.attributes.get("cache") != "hit":
+                usage = stats.get("usage") or {}
+                span.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+
+    async def embed(self, model, inputs, dimensions=None):
+        payload = {"model": model, "input": inputs}
+        if dimensions is not None:
+            payload["dimensions"] = dimensions
+        with get_tracer().span("llm.embed", endpoint="embeddings", model=model, inputs=len(inputs)) as span:
+            response = await self.request("embeddings", payload)
+            span.set(prompt_tokens=(response.get("usage") or {}).get("prompt_tokens"))
+            return [item["embedding"] for item in response["data"]]
+
+    async def aclose(self):
+        pass
+
+def response_as_chunk(response):
+    """把完整的对话响应转换成一个流式增量块"""
+    message = (response.get("choices") or [{}])[0].get("message") or {}
+    return {"choices": [{"index": 0, "delta": {"role": "assistant", "content": message.get("content") or ""}}],
+            "usage": response.get("usage"), "from_cache": response.get("from_cache", False)}
+
+def chunk_content(chunk):
+    return "".join((choice.get("delta") or {}).get("content") or "" for choice in chunk.get("choices") or [])
+
+def response_from_chunks(contents, usage=None):
+    """把流式收到的各段文本拼回完整的对话响应，供缓存和录制使用"""
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(contents)}}], "usage": usage}
+
+class HTTPBackend(LLMBackend):
+    """通过 HTTP 调用智谱（或任何 OpenAI 兼容）接口，连接复用，在途请求数受 max_concurrency 限制"""
+    def __init__(self, api_key, base_url=ZHIPU_BASE_URL, max_concurrency=8, timeout=300, limiter=None, max_retries=MAX_RETRIES):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/") + "/"
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        # 默认使用进程内共享的限流器，所有后端共用同一份请求/token 额度
+        self.limiter = limiter or get_shared_limiter()
+        self.max_retries = max_retries
+        self._client = None
+        self._semaphore = None
+
+    def _get_client(self):
+        # httpx 和信号量都要在事件循环里创建，所以延迟到第一次请求时
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def request(self, endpoint, payload):
+        import httpx
+        client = self._get_client()
+        estimated = estimate_request_tokens(payload)
+        attempt = 0
+        while True:
+            await self.limiter.acquire(estimated)
+            status_code, retry_after = None, None
+            try:
+                async with self._semaphore:
+                    response = await client.post(endpoint, json=payload)
+                if response.status_code == 429 or response.status_code >= 500:
+                    status_code = response.status_code
+                    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                response.raise_for_status()
+                data = response.json()
+                usage = data.get("usage") or {}
+                self.limiter.settle(estimated, usage.get("total_tokens"))
+                return data
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                retryable = status_code is not None or isinstance(e, httpx.TransportError)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.limiter.record_retry(status_code)
+                delay = backoff_delay(attempt, retry_after)
+                get_tracer().count("retries")
+                get_tracer().event("retry", status=status_code or type(e).__name__, delay=delay)
+                print(f"请求 {endpoint} 失败（{status_code or type(e).__name__}），{delay:.1f} 秒后第 {attempt} 次重试")
+                await asyncio.sleep(delay)
+
+    async def stream_request(self, endpoint, payload):
+        """
+        以 SSE 接收回复。收到第一个块之前的失败与 request 一样退避重试；之后的失败直接抛出，由调用方决定保留多少。
+        服务端不支持流式（返回普通 json，如本地替身服务器）时，把完整响应作为一个块产出。
+        """
+        import httpx
+        client = self._get_client()
+        estimated = estimate_request_tokens(payload)
+        body = dict(payload, stream=True)
+        attempt = 0
+        while True:
+            await self.limiter.acquire(estimated)
+            status_code, retry_after = None, None
+            received = False
+            try:
+                async with self._semaphore:
+                    async with client.stream("POST", endpoint, json=body) as response:
+                        if response.status_code == 429 or response.status_code >= 500:
+                            status_code = response.status_code
+                            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                        if response.is_error:
+                            await response.aread()
+                        response.raise_for_status()
+                        usage = None
+                        if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                            data = json.loads(await response.aread())
+                            usage = data.get("usage")
+                            received = True
+                            yield response_as_chunk(data)
+                        else:
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    break
+                                chunk = json.loads(data)
+                                usage = chunk.get("usage") or usage
+                                received = True
+                                yield chunk
+                self.limiter.settle(estimated, (usage or {}).get("total_tokens"))
+                return
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                retryable = not received and (status_code is not None or isinstance(e, httpx.TransportError))
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.limiter.record_retry(status_code)
+                delay = backoff_delay(attempt, retry_after)
+                get_tracer().count("retries")
+                get_tracer().event("retry", status=status_code or type(e).__name__, delay=delay)
+                print(f"请求 {endpoint} 失败（{status_code or type(e).__name__}），{delay:.1f} 秒后第 {attempt} 次重试")
+                await asyncio.sleep(delay)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+def _parse_retry_after(value):
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class RecordingBackend(LLMBackend):
+    """包装另一个后端，把每次请求和响应追加写入 jsonl 文件，供本地替身服务器回放"""
+    def __init__(self, inner, record_path):
+        self.inner = inner
+        self.record_path = record_path
+        self._lock = threading.Lock()
+
+    async def request(self, endpoint, payload):
+        response = await self.inner.request(endpoint, payload)
+        self.write_record(endpoint, payload, response)
+        return response
+
+    async def stream_request(self, endpoint, payload):
+        # 边转发边收集，完整收到后再录制；中途中断的回复不录制
+        contents, usage = [], None
+        async for chunk in self.inner.stream_request(endpoint, payload):
+            contents.append(chunk_content(chunk))
+            usage = chunk.get("usage") or usage
+            yield chunk
+        self.write_record(endpoint, payload, response_from_chunks(contents, usage))
+
+    def write_record(self, endpoint, payload, response):
+        record = {"key": request_key(endpoint, payload), "endpoint": endpoint,
+                  "request": payload, "response": response}
+        with self._lock:
+            with open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+class ReplayBackend(LLMBackend):
+    """
+    从录制文件中回放响应，不发出任何网络请求。
+    miss: 找不到录制时的处理方式
+      - "error": 抛出 KeyError
+      - "empty": 对话接口返回 "[]"，向量接口返回按文本哈希生成的伪向量
+    """
+    def __init__(self, record_path, miss="error"):
+        self.record_path = record_path
+        self.miss = miss
+        self.records = {}
+        with open(record_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    self.records[record["key"]] = record["response"]
+        print(f"已载入录制响应 {len(self.records)} 条：{record_path}")
+
+    def lookup(self, endpoint, payload):
+        response = self.records.get(request_key(endpoint, payload))
+        if response is not None:
+            return response
+        if self.miss == "error":
+            raise KeyError(f"没有录制过该请求：{endpoint} {payload.get('model')}")
+        if endpoint == "embeddings":
+            inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+            dims = payload.get("dimensions", 2048)
+            return {"data": [{"index": i, "embedding": fallback_embedding(text, dims)} for i, text in enumerate(inputs)]}
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": "[]"}}]}
+
+    async def request(self, endpoint, payload):
+        return self.lookup(endpoint, payload)
+
+def fallback_embedding(text, dims):
+    """按文本哈希生成确定性的伪向量，相同文本得到相同向量"""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.gauss(0.0, 1.0) for _ in range(dims)]
+
+############################################
+# 共享后端：同一组参数在进程内只创建一次
+############################################
+_backends = {}
+_override = None
+
+def set_backend_override(backend):
+    """之后所有 get_backend 调用都返回 backend（传 None 恢复正常）。供基准测试等离线场景替换整条流程的后端"""
+    global _override
+    _override = backend
+
+def get_backend(api_key, base_url=ZHIPU_BASE_URL, max_concurrency=8, record_path=None):
+    if _override is not None:
+        return _override
+    key = (api_key, base_url, max_concurrency, record_path)
+    if key not in _backends:
+        backend = HTTPBackend(api_key, base_url, max_concurrency)
+        if record_path:
+            backend = RecordingBackend(backend, record_path)
+        _backends[key] = backend
+    return _backends[key]
@@ -1,8 +1,16 @@
-from zhipuai import ZhipuAI
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import hashlib
+import json
+import os
+import re
+from 大模型接口 import get_backend, run_sync, ZHIPU_BASE_URL
+from 快照编码 import estimate_tokens
+from 日志文件 import read_jsonl
 
 FILEPATH = "<辩论赛的录音转文字>.txt"   # 填入文本文件路径
 API_KEY = "<你的apikey>"    # 智谱清言API密钥
+BASE_URL = ZHIPU_BASE_URL    # 离线运行时改为本地替身服务器地址
+CHUNK_TOKENS = 1500    # 每个chunk的token预算；模型输出与输入长度相当，需给输出留出余量
 
 # 使用飞书妙记把录音文件转换成带说话人标记的文本
 # 飞书妙记转换成的文本文件格式里，用\n\n来分隔多个发言
@@ -18,7 +26,9 @@ def clean_model_response(response):
     return response
 
 def toJson(content, api_key):
-    client = ZhipuAI(api_key=api_key)  # 请填写您自己的APIKey
+    return run_sync(atoJson(content, get_backend(api_key, BASE_URL)))
+
+async def atoJson(content, backend):
     systemprompt = (
         "你负责把录音转文字的文本转换成json格式。你应当对文本进行适当的清洗，要求如下：\n"
         "1. 去掉因录音转文字产生的无意义的语气词;\n"
@@ -35,62 +45,211 @@ def toJson(content, api_key):
         ']'
     )
     
-    response = client.chat.completions.create(
+    response = await backend.chat(
         model="GLM-4-Air-0111",  # 请填写您要调用的模型名称
         messages=[
             {"role": "system", "content": systemprompt},
             {"role": "user", "content": f"下面，请你清洗这段文本，并且按照要求转换成json格式：{content}"},    
         ],
     )
-    output = clean_model_response(response.choices[0].message.content)
+    output = clean_model_response(response["choices"][0]["message"]["content"])
     global i
     i += 1
     print(f"已处理chunks：{i}\n")
     return output
 
-def parse_text(filepath, chunk_length):
+############################################
+# 分块：按说话人切分发言，再把整段发言装进token预算内，尽量在说话人切换处断开
+############################################
+# 飞书妙记每段发言的第一行是“说话人 1 00:01”或“张三 01:02:03”这样的标记
+SPEAKER_LINE = re.compile(r'^(.+?)\s+\d{1,2}:\d{2}(?::\d{2})?\s*$')
+
+def paragraph_speaker(paragraph):
+    """返回段落开头标注的说话人；没有标注（同一人发言的续段）时返回 None"""
+    first_line = paragraph.strip().split('\n', 1)[0].strip()
+    match = SPEAKER_LINE.match(first_line)
+    return match.group(1) if match else None
+
+def split_turns(paragraphs):
+    """把连续的同一说话人段落合成一个发言轮次，返回 [(说话人, [段落, ...]), ...]"""
+    turns = []
+    for paragraph in paragraphs:
+        speaker = paragraph_speaker(paragraph)
+        if turns and (speaker is None or speaker == turns[-1][0]):
+            turns[-1][1].append(paragraph)
+        else:
+            turns.append((speaker, [paragraph]))
+    return turns
+
+def parse_text(filepath, chunk_tokens=CHUNK_TOKENS):
     with open(filepath, 'r', encoding='utf-8') as f:
         content = f.read()
-    lines = content.split('\n\n')
-    
+    lines = [line for line in content.split('\n\n') if line.strip()]
+
     chunks = []
-    for i in range(0, len(lines), chunk_length):
-        chunk = '\n'.join(lines[i:i + chunk_length])
-        chunks.append(chunk)
-        
+    current, used = [], 0
+    for _, paragraphs in split_turns(lines):
+        cost = sum(estimate_tokens(p) for p in paragraphs)
+        if current and used + cost > chunk_tokens:
+            # 放不下整段发言时，在说话人切换处断开
+            chunks.append('\n'.join(current))
+            current, used = [], 0
+        if cost <= chunk_tokens:
+            current.extend(paragraphs)
+            used += cost
+            continue
+        # 单段发言超出预算，只能在段落之间切开，切开处由写出时的合并步骤接回
+        for paragraph in paragraphs:
+            paragraph_cost = estimate_tokens(paragraph)
+            if current and used + paragraph_cost > chunk_tokens:
+                chunks.append('\n'.join(current))
+                current, used = [], 0
+            current.append(paragraph)
+            used += paragraph_cost
+    if current:
+        chunks.append('\n'.join(current))
+
     print(f"Total lines: {len(lines)}")
     print(f"Total chunks: {len(chunks)}")
     
     return chunks
 
-def merge_jsons(jsons):
-    merged = '[' + ','.join(jsons) + ']'
-    return merged
+############################################
+# 按顺序流式写出：先完成的chunk暂存在重排缓冲区，轮到它时再写入
+############################################
+class OrderedJsonWriter:
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.part_path = output_path + ".part"
+        self.f = open(self.part_path, 'w', encoding='utf-8')
+        self.f.write('[')
+        self.next_index = 0
+        self.pending = {}
+        self.written_any = False
+        self.tail = None  # 上一个chunk的最后一条发言，等看到下一个chunk的开头再写出
+        self.merged = 0
 
-def process_chunk(index, chunk, api_key, jsons):
-    jsons[index] = toJson(chunk, api_key)
+    def put(self, index, output):
+        self.pending[index] = output
+        while self.next_index in self.pending:
+            self._write_chunk(self.pending.pop(self.next_index))
+            self.next_index += 1
+        self.f.flush()
 
-def main(filepath, api_key, chunk_length, max_threads):
-    chunks = parse_text(filepath, chunk_length)
-    jsons = [None] * len(chunks)
-    
-    with ThreadPoolExecutor(max_workers=max_threads) as executor:
-        futures = [executor.submit(process_chunk, i, chunk, api_key, jsons) for i, chunk in enumerate(chunks)]
-        for future in as_completed(futures):
-            future.result()  # 等待所有线程完成
-    
-    merged_json = merge_jsons(jsons)
-    return merged_json
+    def _write_chunk(self, chunk_json):
+        if not chunk_json.strip():
+            return
+        try:
+            entries = json.loads('[' + chunk_json + ']')
+        except json.JSONDecodeError:
+            # 模型输出不是合法json时原样写出，不做合并
+            self._flush_tail()
+            self._write_raw(chunk_json)
+            return
+        for position, entry in enumerate(entries):
+            if (position == 0 and self.tail is not None and isinstance(entry, dict)
+                    and entry.get("speaker") == self.tail.get("speaker")):
+                # 同一说话人的发言在chunk边界被切开，接回成一条
+                self.tail["text"] = self.tail.get("text", "") + entry.get("text", "")
+                self.merged += 1
+                continue
+            self._flush_tail()
+            self.tail = entry if isinstance(entry, dict) else None
+            if self.tail is None:
+                self._write_raw(json.dumps(entry, ensure_ascii=False))
+
+    def _flush_tail(self):
+        if self.tail is not None:
+            self._write_raw(json.dumps(self.tail, ensure_ascii=False))
+            self.tail = None
+
+    def _write_raw(self, text):
+        if self.written_any:
+            self.f.write(',')
+        self.f.write('\n' + text)
+        self.written_any = True
+
+    def finish(self):
+        # 全部chunk写完后才把 .part 文件改名为正式输出，避免留下不完整的json
+        self._flush_tail()
+        self.f.write('\n]')
+        self.f.close()
+        os.replace(self.part_path, self.output_path)
+
+    def abort(self):
+        self.f.close()
+
+############################################
+# 断点续传：每完成一个chunk就追加一行检查点，重跑时跳过已转换的chunk
+############################################
+def chunk_hash(chunk):
+    return hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+
+def load_checkpoint(checkpoint_path):
+    """
+    返回 {chunk 内容哈希: 转换结果}；按内容而非序号匹配，分块方式改变后未变的chunk仍可复用。
+    上次中断时写了一半的行会被截掉，之后追加的检查点接在完整的行后面
+    """
+    return {record["hash"]: record["output"] for record in read_jsonl(checkpoint_path)}
+
+def append_checkpoint(checkpoint_file, chunk, output):
+    checkpoint_file.write(json.dumps({"hash": chunk_hash(chunk), "output": output}, ensure_ascii=False) + '\n')
+    checkpoint_file.flush()
+    os.fsync(checkpoint_file.fileno())
+
+async def process_chunks(chunks, backend, output_path):
+    checkpoint_path = output_path + ".ckpt.jsonl"
+    done = load_checkpoint(checkpoint_path)
+    writer = OrderedJsonWriter(output_path)
+    failed = []
+
+    async def convert(index, chunk):
+        try:
+            return index, await atoJson(chunk, backend), None
+        except Exception as e:
+            return index, None, e
+
+    try:
+        with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint_file:
+            tasks = []
+            for index, chunk in enumerate(chunks):
+                if chunk_hash(chunk) in done:
+                    writer.put(index, done[chunk_hash(chunk)])
+                else:
+                    tasks.append(asyncio.ensure_future(convert(index, chunk)))
+            print(f"检查点中已有 {len(chunks) - len(tasks)} 个chunk，本次需转换 {len(tasks)} 个")
+            for future in asyncio.as_completed(tasks):
+                index, output, error = await future
+                if error is not None:
+                    # 单个chunk失败不影响其他chunk，已完成的结果都在检查点里
+                    print(f"chunk {index} 转换失败：{error}")
+                    failed.append(index)
+                    continue
+                append_checkpoint(checkpoint_file, chunks[index], output)
+                writer.put(index, output)
+    except BaseException:
+        writer.abort()
+        raise
+    if failed:
+        writer.abort()
+        raise RuntimeError(f"有 {len(failed)} 个chunk转换失败（序号 {sorted(failed)}），重新运行即可只转换这些chunk")
+    writer.finish()
+    if writer.merged:
+        print(f"已合并 {writer.merged} 处在chunk边界被切开的发言")
+    os.remove(checkpoint_path)
 
-def output_to_jsonfile(json, output_path):
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(json)
+def main(filepath, api_key, chunk_tokens, max_threads, output_path):
+    chunks = parse_text(filepath, chunk_tokens)
+    # 所有chunk共用一个后端：连接复用，同时在途的请求数不超过 max_threads
+    backend = get_backend(api_key, BASE_URL, max_concurrency=max_threads)
+    run_sync(process_chunks(chunks, backend, output_path))
+    print(f"已保存为 {output_path}")
+    return output_path
 
 if __name__ == '__main__':
     filepath = FILEPATH
     api_key = API_KEY
-    chunk_length = 5
-    max_threads = 50  # 设置最大线程数量
-    merged_json = main(filepath, api_key, chunk_length, max_threads)
+    chunk_tokens = CHUNK_TOKENS
+    max_threads = 50  # 设置最大并发请求数量
     output_path = "toinput"+f"{filepath[:filepath.rfind('.')] if '.' in filepath else filepath}.json"
-    output_to_jsonfile(merged_json, output_path)
\ No newline at end of file
+    main(filepath, api_key, chunk_tokens, max_threads, output_path)
@@ -0,0 +1,119 @@
+import re
+
+# 论点拓扑图快照编码：把节点列表压缩成按相关性排序、不超过 token 预算的表格文本，供 process_round 的提示词使用。
+# 表格每行一个节点，字段以 | 分隔，节点 id 只保留数字部分（node_17 -> 17）。
+
+SNAPSHOT_HEADER = "id|speaker|node_type|base_importance|target_id|delta|round_number|text"
+CHILD_TEXT_LIMIT = 40  # 支持/反驳节点的文本截断长度，论点节点保留全文
+
+# token 估算系数：智谱模型约 1.4 个汉字一个 token，英文约 4 个字符一个 token
+CJK_TOKENS_PER_CHAR = 0.7
+ASCII_TOKENS_PER_CHAR = 0.25
+OTHER_TOKENS_PER_CHAR = 0.5
+
+_CJK = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+def estimate_tokens(text):
+    """不依赖分词器，按字符类别粗略估算 token 数"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    ascii_count = sum(1 for ch in text if ord(ch) < 128)
+    other = len(text) - cjk - ascii_count
+    return int(cjk * CJK_TOKENS_PER_CHAR + ascii_count * ASCII_TOKENS_PER_CHAR + other * OTHER_TOKENS_PER_CHAR) + 1
+
+def short_id(node_id):
+    """node_17 -> 17；不符合该格式的 id 原样保留"""
+    if node_id is None:
+        return "-"
+    prefix, _, number = str(node_id).rpartition("_")
+    return number if prefix == "node" and number.isdigit() else str(node_id)
+
+def expand_id(node_id):
+    """把模型返回的短 id（17 或 "17"）还原为 node_17"""
+    if node_id is None:
+        return None
+    node_id = str(node_id).strip()
+    return f"node_{node_id}" if node_id.isdigit() else node_id
+
+def _format_number(value):
+    return f"{value:.2f}".rstrip("0").rstrip(".") if value else "0"
+
+def encode_row(node, text_limit=CHILD_TEXT_LIMIT):
+    text = node.text.replace("|", "/").replace("\n", " ")
+    if node.node_type == "new_argument":
+        importance, target, delta = _format_number(node.base_importance), "-", "-"
+    else:
+        importance, target, delta = "-", short_id(node.target_id), _format_number(node.delta)
+        if len(text) > text_limit:
+            text = text[:text_limit] + "…"
+    round_number = "-" if node.round_number is None else str(node.round_number)
+    return f"{short_id(node.node_id)}|{node.speaker}|{node.node_type}|{importance}|{target}|{delta}|{round_number}|{text}"
+
+def rank_nodes(nodes):
+    """
+    按相关性给节点排序，只使用传入的节点计算（不读取窗口之外的节点）：
+      1. 论点优先，仍然成立的（残留度 > 0）排在前面，残留度高的在前；
+      2. 支持/反驳按 |delta| 排序，尚未被回应的反驳额外加分，较新的轮次略微加分。
+    """
+    by_id = {node.node_id: node for node in nodes}
+    children = {}
+    for node in nodes:
+        if node.target_id in by_id:
+            children.setdefault(node.target_id, []).append(node)
+
+    aggregates = {}
+    for node in nodes:
+        if node.node_type == "new_argument":
+            aggregates[node.node_id] = node.base_importance + sum(c.delta for c in children.get(node.node_id, []))
+
+    latest_round = max((n.round_number or 0 for n in nodes), default=0) or 1
+
+    def unresolved(attack):
+        target = by_id.get(attack.target_id)
+        if target is None:
+            return False
+        attack_round = attack.round_number or 0
+        # 被攻击方在此之后补强了目标，或直接反驳了这条攻击，视为已回应
+        for reply in children.get(attack.target_id, []):
+            if reply.node_type == "support" and reply.speaker == target.speaker and (reply.round_number or 0) >= attack_round:
+                return False
+        for reply in children.get(attack.node_id, []):
+            if reply.speaker == target.speaker:
+                return False
+        return True
+
+    def priority(node):
+        if node.node_type == "new_argument":
+            aggregated = aggregates[node.node_id]
+            return (2 if aggregated > 0 else 1, aggregated)
+        score = abs(node.delta) + 0.3 * (node.round_number or 0) / latest_round
+        if node.node_type == "attack" and unresolved(node):
+            score += 0.5
+        return (0, score)
+
+    return sorted(nodes, key=priority, reverse=True)
+
+def encode_snapshot(nodes, budget_tokens, text_limit=CHILD_TEXT_LIMIT):
+    """按相关性依次选取节点，直到用完 token 预算；输出按节点 id 排序的表格。没有节点时返回 "[]" """
+    if not nodes:
+        return "[]"
+    used = estimate_tokens(SNAPSHOT_HEADER)
+    selected = []
+    for node in rank_nodes(nodes):
+        row = encode_row(node, text_limit)
+        cost = estimate_tokens(row) + 1
+        if used + cost > budget_tokens:
+            continue  # 跳过放不下的行，较短的低优先级行可能仍然放得下
+        used += cost
+        selected.append((node, row))
+    dropped = len(nodes) - len(selected)
+
+    def order(item):
+        number = short_id(item[0].node_id)
+        return (0, int(number), "") if number.isdigit() else (1, 0, number)
+
+    lines = [SNAPSHOT_HEADER] + [row for _, row in sorted(selected, key=order)]
+    if dropped:
+        lines.append(f"（另有 {dropped} 个相关性较低的节点未列出）")
+    return "\n".join(lines)
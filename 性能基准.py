@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import main as judge
+import 论点查重 as dedup
+from 大模型接口 import LLMBackend, ReplayBackend, set_backend_override
+from 快照编码 import estimate_tokens
+
+# 离线性能基准：用假的大模型后端跑完整条 judge_debate 流程，不联网、不消耗额度。
+#   python 性能基准.py                              # 默认跑“测试文件”里的三场比赛，结果写入 基准结果.json
+#   python 性能基准.py --latency 1.5 --jitter 0.5   # 模拟每次请求 1~2 秒的网络和推理延迟
+#   python 性能基准.py --replay 录制的响应.jsonl     # 用录制的真实响应代替合成响应（未录制的请求退回合成响应）
+#   python 性能基准.py --compare 旧的基准结果.json    # 与另一次提交的结果逐项对比
+# 输出 json 记录每场比赛各阶段（extraction / dedup / scoring / library / commentary / rendering）的耗时、
+# 后处理各阶段并发执行的实际耗时和关键路径、每次请求的提示词大小、峰值内存和吞吐量。
+
+BENCHMARK_FILES = [
+    ("“乐子人”是不是真正的快乐", "测试文件/input乐子人.json"),
+    ("向下的自由是不是自由", "测试文件/input向下的自由.json"),
+    ("当今中国，拐卖妇女儿童应不应该实施“买卖同罪”", "测试文件/input拐卖妇女儿童.json"),
+]
+OUTPUT_PATH = "基准结果.json"
+STAGES = ("extraction", "dedup", "scoring", "library", "commentary", "rendering")
+
+############################################
+# 假后端
+############################################
+class SyntheticBackend(LLMBackend):
+    """
+    根据提示词确定性地生成响应，同样的输入总是得到同样的输出：
+      - 抽取请求：本轮每条发言生成一条更新，第一条为新论点，其余随机支持/反驳快照中的论点；
+      - 点评请求：返回固定长度的点评；
+      - 向量请求：按文本哈希生成伪向量，相同文本得到相同向量。
+    """
+    SPEECH_LINE = re.compile(r"^(Pro|Con): (.+)$", re.M)
+    ARGUMENT_ROW = re.compile(r"^(\d+)\|[^|]*\|new_argument\|", re.M)
+
+    def __init__(self, commentary_chars=2000):
+        self.commentary_chars = commentary_chars
+
+    async def request(self, endpoint, payload):
+        if endpoint == "embeddings":
+            inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+            dims = payload.get("dimensions", 2048)
+            return {"data": [{"index": i, "embedding": self.embedding(text, dims)} for i, text in enumerate(inputs)]}
+        user = payload["messages"][-1]["content"]
+        if "当前的论点拓扑图如下" in user:
+            content = json.dumps(self.extract(user), ensure_ascii=False)
+        else:
+            content = ("这场比赛双方攻防激烈。" * self.commentary_chars)[:self.commentary_chars]
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in payload["messages"])
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": estimate_tokens(content),
+                          "total_tokens": prompt_tokens + estimate_tokens(content)}}
+
+    def extract(self, user):
+        rows = self.ARGUMENT_ROW.findall(user)
+        updates = []
+        for k, (speaker, text) in enumerate(self.SPEECH_LINE.findall(user)):
+            digest = int(hashlib.md5(f"{speaker}{text}".encode("utf-8")).hexdigest(), 16)
+            summary = text[:30]
+            if k == 0 or not rows:
+                updates.append({"speaker": speaker, "action": "new_argument", "text": summary,
+                                "importance": round(0.5 + digest % 10 / 10, 1)})
+            else:
+                action = "attack" if digest % 2 else "support"
+                delta = round((digest >> 8) % 5 / 10 + 0.1, 1)
+                updates.append({"speaker": speaker, "action": action, "target_id": rows[digest % len(rows)],
+                                "text": summary, "delta": -delta if action == "attack" else delta})
+        return updates
+
+    @staticmethod
+    def embedding(text, dims):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(dims).tolist()
+
+class ReplayOrSyntheticBackend(LLMBackend):
+    """优先回放录制的真实响应，没录制过的请求退回合成响应"""
+    def __init__(self, record_path):
+        self.replay = ReplayBackend(record_path, miss="error")
+        self.synthetic = SyntheticBackend()
+        self.replayed = 0
+
+    async def request(self, endpoint, payload):
+        try:
+            response = self.replay.lookup(endpoint, payload)
+            self.replayed += 1
+            return response
+        except KeyError:
+            return await self.synthetic.request(endpoint, payload)
+
+class MeasuringBackend(LLMBackend):
+    """注入延迟并记录每次请求的提示词大小；同时在途的请求数与 main.py 的 MAX_CONCURRENCY 一致"""
+    def __init__(self, inner, latency=0.0, jitter=0.0, max_concurrency=judge.MAX_CONCURRENCY, seed=0):
+        self.inner = inner
+        self.latency = latency
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        self.random = random.Random(seed)
+        self.calls = []
+        self._semaphore = None
+
+    async def request(self, endpoint, payload):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            start = time.perf_counter()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            if delay:
+                await asyncio.sleep(delay)
+            response = await self.inner.request(endpoint, payload)
+            elapsed = time.perf_counter() - start
+        if endpoint == "embeddings":
+            inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+            prompt = "".join(inputs)
+            output_chars = 0
+        else:
+            prompt = "".join(m["content"] for m in payload["messages"])
+            output_chars = len(response["choices"][0]["message"]["content"])
+        self.calls.append({"endpoint": endpoint, "model": payload.get("model"), "prompt_chars": len(prompt),
+                           "prompt_tokens": estimate_tokens(prompt), "output_chars": output_chars,
+                           "seconds": elapsed})
+        return response
+
+############################################
+# 运行与汇总
+############################################
+def summarize_calls(calls):
+    summary = {}
+    for endpoint in sorted({c["endpoint"] for c in calls}):
+        selected = [c for c in calls if c["endpoint"] == endpoint]
+        tokens = [c["prompt_tokens"] for c in selected]
+        summary[endpoint] = {
+            "calls": len(selected),
+            "prompt_tokens_total": sum(tokens),
+            "prompt_tokens_mean": sum(tokens) / len(tokens),
+            "prompt_tokens_max": max(tokens),
+            "prompt_chars_total": sum(c["prompt_chars"] for c in selected),
+            "output_chars_total": sum(c["output_chars"] for c in selected),
+            "seconds_mean": sum(c["seconds"] for c in selected) / len(selected),
+        }
+    return summary
+
+def peak_rss_mb():
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def run_debate(topic, filepath, backend_factory, work_dir, trace_memory):
+    with open(filepath, "r", encoding="utf-8") as f:
+        transcripts = json.load(f)
+    backend = backend_factory()
+    set_backend_override(backend)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        outcome = judge.judge_debate(topic, filepath, "benchmark", output_dir=work_dir, output_name="bench")
+    finally:
+        set_backend_override(None)
+    wall = time.perf_counter() - start
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    utterances = sum(len(r) for r in transcripts)
+    chars = sum(len(u["text"]) for r in transcripts for u in r)
+    with open(outcome["graph_path"], "r", encoding="utf-8") as f:
+        nodes = len(json.load(f))
+    return {
+        "topic": topic,
+        "filepath": filepath,
+        "rounds": len(transcripts),
+        "utterances": utterances,
+        "transcript_chars": chars,
+        "graph_nodes": nodes,
+        "Pro_score": outcome["Pro_score"],
+        "Con_score": outcome["Con_score"],
+        "result": outcome["result"],
+        "failed_rounds": outcome["failed_rounds"],
+        "wall_seconds": wall,
+        "stage_seconds": outcome["stage_seconds"],
+        "postprocess_seconds": outcome["postprocess"]["wall_seconds"],
+        "critical_path": outcome["postprocess"]["critical_path"],
+        "throughput": {
+            "rounds_per_second": len(transcripts) / wall,
+            "utterances_per_second": utterances / wall,
+            "transcript_chars_per_second": chars / wall,
+            "llm_calls_per_second": len(backend.calls) / wall,
+        },
+        "requests": summarize_calls(backend.calls),
+        "peak_rss_mb": peak_rss_mb(),
+        "traced_peak_mb": traced_peak,
+        "image_bytes": os.path.getsize(outcome["image_path"]),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmark(files=BENCHMARK_FILES, latency=0.0, jitter=0.0, repeat=1, replay_path=None,
+                  image_format=None, trace_memory=False, keep_outputs=False):
+    # 关掉会让结果依赖历史状态的磁盘缓存：响应缓存、向量库和轮次日志
+    judge.CACHE_PATH = None
+    judge.JOURNAL_ENABLED = False
+    dedup.EMBEDDING_STORE_DIR = None
+    if image_format:
+        judge.IMAGE_FORMAT = image_format
+
+    def backend_factory():
+        inner = ReplayOrSyntheticBackend(replay_path) if replay_path else SyntheticBackend()
+        return MeasuringBackend(inner, latency, jitter)
+
+    work_root = tempfile.mkdtemp(prefix="bench_")
+    runs = []
+    try:
+        for iteration in range(repeat):
+            for index, (topic, filepath) in enumerate(files):
+                work_dir = os.path.join(work_root, f"{iteration}_{index}")
+                run = run_debate(topic, filepath, backend_factory, work_dir, trace_memory)
+                run["iteration"] = iteration
+                runs.append(run)
+    finally:
+        if keep_outputs:
+            print(f"输出文件保留在 {work_root}")
+        else:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    totals = {stage: sum(r["stage_seconds"].get(stage, 0.0) for r in runs) / repeat for stage in STAGES}
+    wall = sum(r["wall_seconds"] for r in runs) / repeat
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"latency": latency, "jitter": jitter, "repeat": repeat, "replay": replay_path,
+                   "image_format": judge.IMAGE_FORMAT, "max_concurrency": judge.MAX_CONCURRENCY,
+                   "snapshot_token_budget": judge.SNAPSHOT_TOKEN_BUDGET},
+        "summary": {
+            "wall_seconds_per_iteration": wall,
+            "stage_seconds_per_iteration": totals,
+            "rounds_per_second": sum(r["rounds"] for r in runs) / (wall * repeat),
+            "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+            "extraction_prompt_tokens_per_iteration":
+                sum(r["requests"].get("chat/completions", {}).get("prompt_tokens_total", 0) for r in runs) / repeat,
+        },
+        "runs": runs,
+    }
+
+def compare(current, baseline):
+    """打印与另一次基准结果的对比：比值大于 1 表示变慢 / 变大"""
+    print(f"\n==== 与 {baseline.get('commit')} 对比（当前 {current.get('commit')}）====")
+    rows = [("wall", baseline["summary"]["wall_seconds_per_iteration"], current["summary"]["wall_seconds_per_iteration"])]
+    for stage in STAGES:
+        rows.append((stage, baseline["summary"]["stage_seconds_per_iteration"].get(stage, 0.0),
+                     current["summary"]["stage_seconds_per_iteration"].get(stage, 0.0)))
+    rows.append(("prompt tokens", baseline["summary"]["extraction_prompt_tokens_per_iteration"],
+                 current["summary"]["extraction_prompt_tokens_per_iteration"]))
+    rows.append(("peak rss MB", baseline["summary"]["peak_rss_mb"], current["summary"]["peak_rss_mb"]))
+    for name, old, new in rows:
+        ratio = f"{new / old:.2f}x" if old else "-"
+        print(f"  {name:<16}{old:>12.3f}{new:>12.3f}{ratio:>9}")
+
+def print_report(report):
+    summary = report["summary"]
+    print("\n==== 基准结果 ====")
+    for run in report["runs"]:
+        stages = "  ".join(f"{stage} {run['stage_seconds'].get(stage, 0.0):.2f}s" for stage in STAGES)
+        chat = run["requests"].get("chat/completions", {})
+        print(f"{run['topic']}：总计 {run['wall_seconds']:.2f}s  {stages}  后处理 {run['postprocess_seconds']:.2f}s  "
+              f"请求 {chat.get('calls', 0)} 次，提示词平均 {chat.get('prompt_tokens_mean', 0):.0f} / 最大 {chat.get('prompt_tokens_max', 0)} tokens")
+    print(f"每轮迭代 {summary['wall_seconds_per_iteration']:.2f}s，{summary['rounds_per_second']:.2f} 轮/秒，"
+          f"峰值内存 {summary['peak_rss_mb']:.0f} MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="赛博评委离线性能基准")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次请求注入的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟的随机波动范围（秒）")
+    parser.add_argument("--repeat", type=int, default=1, help="重复次数，结果取平均")
+    parser.add_argument("--replay", help="录制的响应文件，优先回放其中的真实响应")
+    parser.add_argument("--format", choices=("png", "svg", "html"), help="论点拓扑图格式，默认沿用 main.py 的 IMAGE_FORMAT")
+    parser.add_argument("--trace-memory", action="store_true", help="用 tracemalloc 统计 Python 对象的峰值内存（会显著变慢）")
+    parser.add_argument("--keep-outputs", action="store_true", help="保留每场比赛的输出文件")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="结果 json 的输出路径")
+    parser.add_argument("--compare", help="另一次基准结果的 json，与之逐项对比")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(latency=args.latency, jitter=args.jitter, repeat=args.repeat, replay_path=args.replay,
+                           image_format=args.format, trace_memory=args.trace_memory, keep_outputs=args.keep_outputs)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report)
+    print(f"结果已保存为 {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return report
+
+if __name__ == "__main__":
+    main()
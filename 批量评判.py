@@ -0,0 +1,117 @@
+import csv
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import main as judge
+
+MANIFEST_PATH = "赛程.json"  # 赛程清单，格式见下
+OUTPUT_ROOT = "评判结果"  # 每场比赛的输出各自放在该目录下的子目录中
+MAX_WORKERS = 4  # 同时评判的比赛场数；所有比赛共用 main.py 中 MAX_CONCURRENCY 限定的大模型并发额度
+API_KEY = judge.API_KEY
+ARCHIVE_NAME = "赛程.dgar"  # 全部结束后把评判成功的论点拓扑图打包成归档（见“论点图归档.py”），填 None 则不打包
+
+# 本程序批量评判一个赛程中的多场比赛。赛程清单是一个 json 数组，每个元素为：
+# {"topic": "辩题完整表述", "filepath": "比赛json路径", "argument_rounds": [1,3]}
+# 其中 argument_rounds 可省略，默认使用 main.py 中的 ARGUMENT_ROUNDS。
+# 每场比赛的论点拓扑图、点评和图片写入 OUTPUT_ROOT/<序号>_<辩题>/，
+# 全部结束后在 OUTPUT_ROOT 下写出汇总表 summary.csv 和 summary.json，以及论点拓扑图归档 ARCHIVE_NAME。
+
+SUMMARY_FIELDS = ["index", "topic", "filepath", "status", "Pro_score", "Con_score", "result", "failed_rounds", "seconds", "output_dir", "error"]
+
+def safe_name(text, length=40):
+    """把辩题转换成可以用作文件名的字符串"""
+    name = re.sub(r'[\\/:*?"<>|\s]+', "_", text).strip("_")
+    return name[:length] or "debate"
+
+def load_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    for i, entry in enumerate(entries):
+        if "topic" not in entry or "filepath" not in entry:
+            raise ValueError(f"赛程清单第 {i + 1} 项缺少 topic 或 filepath：{entry}")
+    return entries
+
+def judge_one(index, entry, api_key, output_root):
+    output_dir = os.path.join(output_root, f"{index:03d}_{safe_name(entry['topic'])}")
+    row = {"index": index, "topic": entry["topic"], "filepath": entry["filepath"], "output_dir": output_dir,
+           "status": "ok", "Pro_score": None, "Con_score": None, "result": None, "failed_rounds": "", "error": ""}
+    start = time.perf_counter()
+    try:
+        outcome = judge.judge_debate(
+            entry["topic"], entry["filepath"], api_key,
+            output_dir=output_dir,
+            argument_rounds=entry.get("argument_rounds", judge.ARGUMENT_ROUNDS),
+            output_name=safe_name(entry["topic"])
+        )
+        row["Pro_score"] = round(outcome["Pro_score"], 4)
+        row["Con_score"] = round(outcome["Con_score"], 4)
+        row["result"] = outcome["result"]
+        if outcome["failed_rounds"]:
+            # 部分轮次失败时比分不完整，单独标记，便于只重跑这些比赛
+            row["status"] = "partial"
+            row["failed_rounds"] = ",".join(str(r) for r in outcome["failed_rounds"])
+    except Exception as e:
+        # 一场比赛失败不影响其他比赛，错误写入汇总表和该场的输出目录
+        row["status"] = "failed"
+        row["error"] = f"{type(e).__name__}: {e}"
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, "error.txt"), "w", encoding="utf-8") as f:
+            f.write(traceback.format_exc())
+    row["seconds"] = round(time.perf_counter() - start, 2)
+    return row
+
+def write_summary(rows, output_root):
+    rows = sorted(rows, key=lambda row: row["index"])
+    with open(os.path.join(output_root, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(output_root, "summary.csv"), "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+def write_archive(rows, output_root, archive_name=ARCHIVE_NAME):
+    """把评判成功（含部分轮次失败）的比赛打包成一个归档，供赛季统计直接读取，不必逐个解析json"""
+    from 论点图归档 import pack_json_files
+    done = [row for row in rows if row["status"] in ("ok", "partial")]
+    graph_paths = [os.path.join(row["output_dir"], f"{safe_name(row['topic'])}.json") for row in done]
+    archive_path = os.path.join(output_root, archive_name)
+    pack_json_files(graph_paths, archive_path, topics=[row["topic"] for row in done])
+    return archive_path
+
+def print_summary(rows):
+    print("\n==== 赛程汇总 ====")
+    print(f"{'#':>3}  {'结果':<6}{'Pro':>8}{'Con':>8}{'耗时(s)':>10}  辩题")
+    for row in rows:
+        if row["status"] in ("ok", "partial"):
+            note = f"  (失败轮次：{row['failed_rounds']})" if row["failed_rounds"] else ""
+            print(f"{row['index']:>3}  {row['result']:<6}{row['Pro_score']:>8.2f}{row['Con_score']:>8.2f}{row['seconds']:>10.1f}  {row['topic']}{note}")
+        else:
+            print(f"{row['index']:>3}  {'失败':<6}{'-':>8}{'-':>8}{row['seconds']:>10.1f}  {row['topic']}  ({row['error']})")
+    failed = sum(1 for row in rows if row["status"] == "failed")
+    partial = sum(1 for row in rows if row["status"] == "partial")
+    print(f"共 {len(rows)} 场，成功 {len(rows) - failed - partial} 场，部分轮次失败 {partial} 场，失败 {failed} 场")
+
+def main(manifest_path=MANIFEST_PATH, api_key=API_KEY, output_root=OUTPUT_ROOT, max_workers=MAX_WORKERS):
+    entries = load_manifest(manifest_path)
+    os.makedirs(output_root, exist_ok=True)
+    start = time.perf_counter()
+    rows = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(judge_one, i, entry, api_key, output_root) for i, entry in enumerate(entries, 1)]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            print(f"\n[赛程] 第 {row['index']} 场（{row['topic']}）{'失败' if row['status'] == 'failed' else '完成'}，用时 {row['seconds']} 秒")
+    rows = write_summary(rows, output_root)
+    print_summary(rows)
+    if ARCHIVE_NAME:
+        print(f"论点拓扑图归档已保存为 {write_archive(rows, output_root)}")
+    print(f"总用时 {time.perf_counter() - start:.1f} 秒，汇总表已保存到 {output_root}")
+    return rows
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import json
+import os
+
+# 追加写入的 jsonl 文件（向量库索引、论点库、录音转写断点、轮次日志）共用的读写函数。
+# 进程在写一行的中途退出时，文件末尾会留下半行。读取时只保留完整的记录，并把文件截断到最后一条完整记录之后，
+# 否则之后追加的记录会接在半行后面，下次读取时在半行处停下，这些记录全部丢失。
+
+def read_jsonl(path):
+    """
+    读取 path 中的记录，遇到无法解析的行即停止（之后的内容丢弃），返回记录列表；文件不存在时返回 []。
+    文件末尾有写到一半的内容时截断，保证之后以追加方式打开时从一个完整的行尾开始写。
+    """
+    if not os.path.exists(path):
+        return []
+    records = []
+    good_bytes = 0
+    newline = True
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                break
+            records.append(record)
+            good_bytes += len(line)
+            newline = line.endswith(b"\n")
+    size = os.path.getsize(path)
+    if good_bytes < size or not newline:
+        with open(path, "r+b") as f:
+            f.truncate(good_bytes)
+            if not newline:
+                f.write(b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if good_bytes < size:
+            print(f"{path}：丢弃末尾 {size - good_bytes} 字节写到一半的记录，保留 {len(records)} 条")
+    return records
+
+def rewrite_jsonl(path, records):
+    """用 records 替换 path 的全部内容：先写临时文件再替换，中途退出不会留下只写了一半的文件"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
@@ -0,0 +1,63 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from 大模型接口 import ReplayBackend
+
+RECORD_PATH = "录制的响应.jsonl"  # 用 main.py 中的 RECORD_PATH 录制得到的文件
+HOST = "127.0.0.1"
+PORT = 8000
+MISS = "error"  # 未录制的请求："error" 返回 404，"empty" 返回空更新 "[]" 与伪向量
+
+# 本程序在本地模拟智谱/OpenAI 兼容接口，回放录制好的响应，用于离线运行 DebateJudgeModel。
+# 启动后把 main.py 中的 BASE_URL 改为 http://127.0.0.1:8000 即可
+
+ENDPOINTS = ("chat/completions", "embeddings")
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        # 兼容 /chat/completions、/v1/chat/completions、/api/paas/v4/chat/completions 等路径
+        path = self.path.split("?")[0].strip("/")
+        endpoint = next((name for name in ENDPOINTS if path.endswith(name)), None)
+        if endpoint is None:
+            self._send(404, {"error": {"message": f"未知接口：{self.path}"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length).decode("utf-8"))
+        except json.JSONDecodeError:
+            self._send(400, {"error": {"message": "请求体不是合法的JSON"}})
+            return
+        try:
+            response = self.server.replay.lookup(endpoint, payload)
+        except KeyError as e:
+            self._send(404, {"error": {"message": str(e)}})
+            return
+        self._send(200, response)
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        print(f"[替身服务器] {self.address_string()} {format % args}")
+
+def make_server(record_path=RECORD_PATH, host=HOST, port=PORT, miss=MISS):
+    server = ThreadingHTTPServer((host, port), StandInHandler)
+    server.replay = ReplayBackend(record_path, miss=miss)
+    return server
+
+def main(record_path=RECORD_PATH, host=HOST, port=PORT, miss=MISS):
+    server = make_server(record_path, host, port, miss)
+    print(f"本地替身服务器已启动：http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import threading
+from collections import deque
+
+# 自适应模型路由：为每次抽取请求在多个模型之间选择，并在失败时按顺序退回下一个模型。
+#   1. 用本地估算的 token 数（见“快照编码.estimate_tokens”）检查上下文长度，放不下的模型直接排除；
+#   2. 每个模型保留最近若干次请求的延迟、token 用量和成败，预测本次请求的耗时、花费和出错概率；
+#   3. 按目标函数 latency*秒 + cost*元 + errors*错误率 - quality*质量分 打分，分数低的优先。
+# 还没有实测数据的模型使用配置中的先验速度。
+
+ROUTER_WINDOW = 20  # 每个模型保留的最近请求数
+DEFAULT_COMPLETION_TOKENS = 1000  # 没有实测数据时假定的输出长度
+
+class ModelProfile:
+    def __init__(self, name, context_tokens, input_price=0.0, output_price=0.0, quality=0.0, prior_seconds_per_1k=2.0):
+        """
+        context_tokens: 上下文长度（提示词 + 输出）
+        input_price / output_price: 每千 token 价格（元）
+        quality: 质量分，用来表达同等条件下对某个模型的偏好
+        prior_seconds_per_1k: 没有实测数据时，每千 token（提示词 + 输出）的耗时估计
+        """
+        self.name = name
+        self.context_tokens = context_tokens
+        self.input_price = input_price
+        self.output_price = output_price
+        self.quality = quality
+        self.prior_seconds_per_1k = prior_seconds_per_1k
+
+class ModelStats:
+    def __init__(self, window=ROUTER_WINDOW):
+        self.samples = deque(maxlen=window)  # (耗时秒数, 提示词 token, 输出 token, 是否成功, 是否来自缓存)
+        self.calls = 0
+        self.failures = 0
+        self.cost = 0.0
+
+    def seconds_per_1k(self):
+        timed = [(s, p + c) for s, p, c, ok, cached in self.samples if ok and not cached and p + c > 0]
+        if not timed:
+            return None
+        return sum(s for s, _ in timed) / (sum(t for _, t in timed) / 1000)
+
+    def completion_tokens(self):
+        values = [c for _, _, c, ok, _ in self.samples if ok and c]
+        return sum(values) / len(values) if values else DEFAULT_COMPLETION_TOKENS
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for sample in self.samples if not sample[3]) / len(self.samples)
+
+class ModelRouter:
+    def __init__(self, profiles, objective):
+        """profiles: ModelProfile 列表；objective: {"latency", "cost", "errors", "quality"} 各项权重"""
+        self.profiles = {profile.name: profile for profile in profiles}
+        self.objective = dict(objective)
+        self.stats = {profile.name: ModelStats() for profile in profiles}
+        self._lock = threading.Lock()
+
+    def predict(self, model, prompt_tokens):
+        profile = self.profiles[model]
+        with self._lock:
+            stats = self.stats[model]
+            rate = stats.seconds_per_1k()
+            completion = stats.completion_tokens()
+            error_rate = stats.error_rate()
+        if rate is None:
+            rate = profile.prior_seconds_per_1k
+        seconds = rate * (prompt_tokens + completion) / 1000
+        cost = (prompt_tokens * profile.input_price + completion * profile.output_price) / 1000
+        score = (self.objective.get("latency", 0.0) * seconds
+                 + self.objective.get("cost", 0.0) * cost
+                 + self.objective.get("errors", 0.0) * error_rate
+                 - self.objective.get("quality", 0.0) * profile.quality)
+        return {"model": model, "seconds": seconds, "cost": cost, "error_rate": error_rate, "score": score}
+
+    def candidates(self, prompt_tokens, max_tokens):
+        """按分数从低到高返回上下文放得下的模型；都放不下时只返回上下文最长的模型"""
+        fitting = [name for name, profile in self.profiles.items() if prompt_tokens + max_tokens <= profile.context_tokens]
+        if not fitting:
+            return [max(self.profiles.values(), key=lambda profile: profile.context_tokens).name]
+        return sorted(fitting, key=lambda name: self.predict(name, prompt_tokens)["score"])
+
+    def record(self, model, seconds, prompt_tokens, completion_tokens, ok, cached=False):
+        profile = self.profiles.get(model)
+        if profile is None:
+            return
+        with self._lock:
+            stats = self.stats[model]
+            stats.samples.append((seconds, prompt_tokens or 0, completion_tokens or 0, ok, cached))
+            stats.calls += 1
+            stats.failures += not ok
+            if ok and not cached:
+                stats.cost += ((prompt_tokens or 0) * profile.input_price + (completion_tokens or 0) * profile.output_price) / 1000
+
+    def report(self):
+        lines = []
+        with self._lock:
+            for name, stats in self.stats.items():
+                if not stats.calls:
+                    continue
+                rate = stats.seconds_per_1k()
+                rate_text = f"{rate:.2f} 秒/千token" if rate is not None else "无实测"
+                lines.append(f"{name}：{stats.calls} 次（失败 {stats.failures}），{rate_text}，"
+                             f"近期错误率 {stats.error_rate():.0%}，花费约 {stats.cost:.4f} 元")
+        return "\n".join(lines)
+
+_routers = {}
+
+def get_model_router(profiles, objective):
+    """同一组配置在进程内共用一个路由器，多场比赛共享各模型的实测数据"""
+    key = (tuple(sorted((p.name, p.context_tokens, p.input_price, p.output_price, p.quality, p.prior_seconds_per_1k)
+                        for p in profiles)),
+           tuple(sorted(objective.items())))
+    if key not in _routers:
+        _routers[key] = ModelRouter(profiles, objective)
+    return _routers[key]
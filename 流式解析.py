@@ -0,0 +1,125 @@
+import json
+import re
+
+# 容错的增量 JSON 数组解析器：大模型的回复一段一段到达，每当数组中的一个对象闭合，就立即把它解析出来。
+#   parser = JsonArrayStream()
+#   for piece in 回复片段:
+#       for update in parser.feed(piece):
+#           ...  # 每条完整的更新指令
+#   parser.close()
+# 容错规则：
+#   - 第一个 '[' 之前的文字（如“好的，以下是更新：```json”）被忽略；没有 '[' 时，顶层的每个 {...} 各算一项；
+#   - 不含任何对象的 [...] 不是回复数组（可能是说明文字中的“[要求]”，或照抄提示词里的“（[]）”），闭合后继续往后找；
+#     只有内容为空白的 [] 才算“没有更新”，且其后不能再出现对象；
+#   - 单个对象无法解析时先去掉尾随逗号再试，仍然失败则跳过该对象（计入 errors），不影响之前和之后的对象；
+#   - 回复在对象中途被截断时，已闭合的对象全部保留，只丢弃最后半个对象（truncated 为 True）。
+
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+class JsonArrayStream:
+    def __init__(self):
+        self.buffer = ""
+        self.depth = 0  # 当前括号深度（字符串内的括号不计）
+        self.item_depth = None  # 顶层数组内对象所在的深度：有 '[' 时为 1，没有时为 0
+        self.item_start = None  # 当前未闭合对象在 buffer 中的起点
+        self.in_string = False
+        self.escaped = False
+        self.complete = False  # 顶层数组已闭合（其中至少有一个对象）
+        self.array_objects = 0  # 当前顶层数组中出现过的对象数
+        self.array_blank = True  # 当前顶层数组中除对象外只有空白和逗号
+        self.empty_array = False  # 出现过内容为空白的 []
+        self.objects = 0  # 出现过的对象数（含无法解析的）
+        self.items = 0
+        self.errors = 0
+        self.truncated = False
+
+    def feed(self, text):
+        """追加一段文本，返回其中新闭合的对象（字典）列表"""
+        items = []
+        start = len(self.buffer)
+        self.buffer += text
+        for position in range(start, len(self.buffer)):
+            ch = self.buffer[position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if self.complete:
+                break
+            if (self.item_depth == 1 and self.depth == 1 and self.item_start is None
+                    and not ch.isspace() and ch not in "{],"):
+                self.array_blank = False
+            if ch == '"' and self.depth > 0:
+                self.in_string = True
+            elif ch in "[{":
+                if self.depth == 0:
+                    if ch == "[" and self.item_depth is None:
+                        self.item_depth = 1
+                        self.array_objects = 0
+                        self.array_blank = True
+                    elif ch == "{" and self.item_depth in (None, 0):
+                        self.item_depth = 0
+                        self.item_start = position
+                        self.objects += 1
+                    else:
+                        continue
+                elif ch == "{" and self.depth == self.item_depth and self.item_start is None:
+                    self.item_start = position
+                    self.objects += 1
+                    self.array_objects += 1
+                self.depth += 1
+            elif ch in "]}":
+                if self.depth == 0:
+                    continue
+                self.depth -= 1
+                if self.item_start is not None and self.depth == self.item_depth:
+                    item = self._parse(self.buffer[self.item_start:position + 1])
+                    self.item_start = None
+                    if item is not None:
+                        items.append(item)
+                if self.depth == 0 and self.item_depth == 1:
+                    if self.array_objects:
+                        self.complete = True
+                    else:
+                        # 不是回复数组，继续往后找
+                        self.empty_array = self.empty_array or self.array_blank
+                        self.item_depth = None
+        # 没有未闭合的对象时，已扫描过的文本不必保留
+        if self.item_start is None:
+            self.buffer = ""
+        elif self.item_start > 0:
+            self.buffer = self.buffer[self.item_start:]
+            self.item_start = 0
+        self.items += len(items)
+        return items
+
+    def _parse(self, text):
+        for candidate in (text, TRAILING_COMMA.sub(r"\1", text)):
+            try:
+                item = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(item, dict):
+                return item
+            break
+        self.errors += 1
+        return None
+
+    def close(self):
+        """回复结束；记录是否在对象或数组中途被截断"""
+        self.truncated = self.item_start is not None or (self.item_depth == 1 and not self.complete)
+        return self
+
+    def parsed_anything(self):
+        """是否得到了可用的结果：至少一个对象，或一个空数组 [] 且回复中没有任何（无法解析的）对象"""
+        return self.items > 0 or (self.empty_array and self.objects == 0)
+
+def parse_json_array(text):
+    """一次性解析完整的回复，返回 (对象列表, 解析器)"""
+    parser = JsonArrayStream()
+    items = parser.feed(text)
+    return items, parser.close()
@@ -1,91 +1,81 @@
 
+import html
 import json
+import os
 import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.patches import FancyArrowPatch
-from matplotlib.lines import Line2D
 import numpy as np
+import 论点图
 
 TOPIC = "向下的自由是不是自由"
 FILEPATH = "cleaned_向下的自由是不是自由.json"
 
-# 设置字体为 SimHei
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
+# 输出格式由文件扩展名决定：
+#   .png  matplotlib 渲染的位图（默认）
+#   .svg  矢量图，鼠标悬停显示节点全文
+#   .html 自包含网页，可拖动平移、滚轮缩放，悬停显示节点全文
+# svg 和 html 直接拼接文本生成，不导入 matplotlib，体积和耗时都远小于 png。
+IMAGE_FORMATS = ("png", "svg", "html")
+
+PRO_COLOR = "#64B5F6"  # 正方：清新蓝色
+CON_COLOR = "#E57373"  # 反方：温暖橙红
+EDGE_COLORS = {"support": "green", "attack": "red"}
+LEGEND_ITEMS = [
+    ("o", PRO_COLOR, "正方论点"), ("s", PRO_COLOR, "正方支撑"), ("^", PRO_COLOR, "正方反驳"),
+    ("o", CON_COLOR, "反方论点"), ("s", CON_COLOR, "反方支撑"), ("^", CON_COLOR, "反方反驳"),
+]
 
 def text_snippet(text, length=30):
     return text if len(text) <= length else text[:length] + "..."
 
-def adjust_positions(pos, G, min_dist=0.15, min_dist_connected=0.05, iterations=100):
+def adjust_positions(pos, G, min_dist=0.15, min_dist_connected=0.05, iterations=100, seed=42):
     """
     迭代调整布局：
       - 对于非直接连接的节点，确保距离不少于 min_dist；
       - 对于直接相连的节点（论点与其支撑/反驳），允许距离低至 min_dist_connected。
+    每次迭代用矩阵一次算出所有节点对的位移并同时推开，没有重叠时提前结束。
+    完全重合的节点按 seed 生成的随机方向推开，同样的输入总是得到同样的布局。
     """
     keys = list(pos.keys())
-    pos_arr = {k: np.array(pos[k]) for k in keys}
+    n = len(keys)
+    pos_arr = np.array([pos[k] for k in keys], dtype=float).reshape(n, 2)
+    if n < 2:
+        return {k: pos_arr[i] for i, k in enumerate(keys)}
+
+    # 预先算好每对节点的距离阈值：直接相连的用较小阈值，否则用较大阈值
+    index = {k: i for i, k in enumerate(keys)}
+    threshold = np.full((n, n), float(min_dist))
+    for u, v in G.edges():
+        if u in index and v in index:
+            threshold[index[u], index[v]] = threshold[index[v], index[u]] = min_dist_connected
+    np.fill_diagonal(threshold, 0.0)
+    upper = np.triu(np.ones((n, n), dtype=bool), k=1)
+    rng = np.random.default_rng(seed)
+
     for it in range(iterations):
-        for i in range(len(keys)):
-            for j in range(i+1, len(keys)):
-                k1 = keys[i]
-                k2 = keys[j]
-                p1 = pos_arr[k1]
-                p2 = pos_arr[k2]
-                delta_vec = p2 - p1
-                dist = np.linalg.norm(delta_vec)
-                # 若两节点直接相连，则使用较小阈值，否则使用较大阈值
-                if G.has_edge(k1, k2) or G.has_edge(k2, k1):
-                    threshold = min_dist_connected
-                else:
-                    threshold = min_dist
-                if dist < threshold:
-                    if dist == 0:
-                        displacement = (np.random.rand(2) - 0.5) * threshold
-                    else:
-                        displacement = delta_vec / dist * (threshold - dist) / 2
-                    pos_arr[k1] = p1 - displacement
-                    pos_arr[k2] = p2 + displacement
-    new_pos = {k: pos_arr[k] for k in keys}
+        delta_vec = pos_arr[None, :, :] - pos_arr[:, None, :]  # delta_vec[i, j] = p_j - p_i
+        dist = np.sqrt(np.einsum('ijk,ijk->ij', delta_vec, delta_vec))
+        overlap = dist < threshold
+        if not overlap.any():
+            break
+        direction = delta_vec / np.where(dist > 0, dist, 1.0)[:, :, None]
+        coincident = overlap & (dist == 0) & upper
+        if coincident.any():
+            # 重合的节点没有方向，随机取一个方向，并保证 i、j 两侧方向相反
+            rows, cols = np.nonzero(coincident)
+            angles = rng.uniform(0, 2 * np.pi, len(rows))
+            random_dir = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+            direction[rows, cols] = random_dir
+            direction[cols, rows] = -random_dir
+        push = np.where(overlap, (threshold - dist) / 2, 0.0)
+        # 每个节点沿远离所有重叠节点的方向移动
+        pos_arr -= np.einsum('ij,ijk->ik', push, direction)
+    new_pos = {k: pos_arr[i] for i, k in enumerate(keys)}
     return new_pos
 
-class UtteranceNode:
-    def __init__(self, node_id, speaker, text, node_type, base_importance=0.0,
-                 target_id=None, delta=0.0, round_number=None):
-        """
-        node_type:
-          - "new_argument": 新增论点（需要 base_importance）
-          - "support": 支持（需要 target_id 与正 delta）
-          - "attack": 反驳（需要 target_id 与负 delta）
-        """
-        self.node_id = node_id
-        self.speaker = speaker
-        self.text = text
-        self.node_type = node_type
-        self.base_importance = base_importance
-        self.target_id = target_id
-        self.delta = delta
-        self.round_number = round_number
-
-    def to_dict(self):
-        return {
-            "id": self.node_id,
-            "speaker": self.speaker,
-            "text": self.text,
-            "node_type": self.node_type,
-            "base_importance": self.base_importance,
-            "target_id": self.target_id,
-            "delta": self.delta,
-            "round_number": self.round_number
-        }
-
-class DebateGraph:
-    def __init__(self):
-        self.nodes = {}
-
-    def add_node(self, node: UtteranceNode):
-        self.nodes[node.node_id] = node
-
-    def visualize_graph(self, filename="论点拓扑图.png", topic=""):
+class DebateGraph(论点图.DebateGraph):
+    """在共用的论点拓扑图上加入布局和绘制方法"""
+    def build_layout(self):
+        """构造有向图并计算布局，返回 (G, pos)。png/svg/html 三种输出共用同一份布局"""
         # 构造有向图：只加入存在边连接的节点
         G = nx.DiGraph()
         nodes_with_edges = set()
@@ -110,35 +100,64 @@ class DebateGraph:
         # 使用 spring_layout，利用边权参数将相关节点拉近
         pos = nx.spring_layout(G, weight='weight', seed=42)
         pos = adjust_positions(pos, G, min_dist=0.20, min_dist_connected=0.1, iterations=200)
+        return G, pos
+
+    def node_style(self, node_id):
+        """
+        根据正反方和节点类型设置节点样式，返回 (marker, color, size)，size 为 matplotlib 的面积（点²）
+        节点形状：new_argument：圆形 "o"，support：正方形 "s"，attack：三角形 "^"
+        """
+        node = self.nodes[node_id]
+        if node.speaker.lower() == "pro":
+            color = PRO_COLOR
+        elif node.speaker.lower() == "con":
+            color = CON_COLOR
+        else:
+            color = "gray"
+        if node.node_type == "new_argument":
+            marker = "o"
+            size = abs(node.base_importance) * 1000 if node.base_importance != 0 else 300
+        elif node.node_type == "support":
+            marker = "s"
+            size = abs(node.delta) * 1000 if node.delta != 0 else 300
+        elif node.node_type == "attack":
+            marker = "^"
+            size = abs(node.delta) * 1000 if node.delta != 0 else 300
+        else:
+            marker = "o"
+            size = 300
+        return marker, color, size
+
+    def visualize_graph(self, filename="论点拓扑图.png", topic=""):
+        """按扩展名输出 png / svg / html"""
+        image_format = os.path.splitext(filename)[1].lstrip(".").lower() or "png"
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"不支持的图片格式 {image_format}，可选：{IMAGE_FORMATS}")
+        G, pos = self.build_layout()
+        if image_format == "png":
+            self.render_png(G, pos, filename, topic)
+            return
+        svg = self.render_svg(G, pos, topic)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(svg if image_format == "svg" else wrap_html(svg, topic))
+
+    def render_png(self, G, pos, filename, topic):
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import FancyArrowPatch
+        from matplotlib.lines import Line2D
+
+        # 设置字体为 SimHei
+        plt.rcParams['font.sans-serif'] = ['SimHei']
+        plt.rcParams['axes.unicode_minus'] = False
+
         node_labels = nx.get_node_attributes(G, 'label')
         edge_labels = nx.get_edge_attributes(G, 'label')
         edge_labels = {edge: label for edge, label in edge_labels.items() if edge[0] in pos and edge[1] in pos}
         
-        # 根据正反方和节点类型设置节点样式
-        # 正方采用清新蓝色 (#64B5F6)，反方采用温暖橙红 (#E57373)
-        # 节点形状：new_argument：圆形 "o"，support：正方形 "s"，attack：三角形 "^"
         node_groups = {}
         node_size_dict = {}
         for node_id in G.nodes:
-            node = self.nodes[node_id]
-            if node.speaker.lower() == "pro":
-                color = "#64B5F6"
-            elif node.speaker.lower() == "con":
-                color = "#E57373"
-            else:
-                color = "gray"
-            if node.node_type == "new_argument":
-                marker = "o"
-                size = abs(node.base_importance) * 1000 if node.base_importance != 0 else 300
-            elif node.node_type == "support":
-                marker = "s"
-                size = abs(node.delta) * 1000 if node.delta != 0 else 300
-            elif node.node_type == "attack":
-                marker = "^"
-                size = abs(node.delta) * 1000 if node.delta != 0 else 300
-            else:
-                marker = "o"
-                size = 300
+            marker, color, size = self.node_style(node_id)
             key = (marker, color)
             if key not in node_groups:
                 node_groups[key] = []
@@ -158,12 +177,8 @@ class DebateGraph:
         ax = plt.gca()
         # 绘制边和箭头
         for (u, v, d) in G.edges(data=True):
-            if d['node_type'] == 'support':
-                arrow = FancyArrowPatch(posA=pos[u], posB=pos[v], arrowstyle='->', color='green',
-                                         mutation_scale=15, shrinkA=15, shrinkB=15)
-            elif d['node_type'] == 'attack':
-                arrow = FancyArrowPatch(posA=pos[u], posB=pos[v], arrowstyle='->', color='red',
-                                         mutation_scale=15, shrinkA=15, shrinkB=15)
+            arrow = FancyArrowPatch(posA=pos[u], posB=pos[v], arrowstyle='->', color=EDGE_COLORS[d['node_type']],
+                                     mutation_scale=15, shrinkA=15, shrinkB=15)
             ax.add_patch(arrow)
         nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_color='red',
                                      font_size=8, label_pos=0.5,
@@ -172,12 +187,8 @@ class DebateGraph:
         
         # 添加图例，说明正反方对应的颜色及节点形状对应的性质
         legend_items = [
-            Line2D([0], [0], marker='o', color='w', label='正方论点', markerfacecolor="#64B5F6", markersize=10, markeredgecolor='k'),
-            Line2D([0], [0], marker='s', color='w', label='正方支撑', markerfacecolor="#64B5F6", markersize=10, markeredgecolor='k'),
-            Line2D([0], [0], marker='^', color='w', label='正方反驳', markerfacecolor="#64B5F6", markersize=10, markeredgecolor='k'),
-            Line2D([0], [0], marker='o', color='w', label='反方论点', markerfacecolor="#E57373", markersize=10, markeredgecolor='k'),
-            Line2D([0], [0], marker='s', color='w', label='反方支撑', markerfacecolor="#E57373", markersize=10, markeredgecolor='k'),
-            Line2D([0], [0], marker='^', color='w', label='反方反驳', markerfacecolor="#E57373", markersize=10, markeredgecolor='k')
+            Line2D([0], [0], marker=marker, color='w', label=label, markerfacecolor=color, markersize=10, markeredgecolor='k')
+            for marker, color, label in LEGEND_ITEMS
         ]
         plt.legend(handles=legend_items, loc='upper left', title="图例")
         
@@ -185,24 +196,169 @@ class DebateGraph:
         plt.savefig(filename,dpi=300)
         plt.close()
 
-def main(filepath=FILEPATH, topic=TOPIC):
+    def render_svg(self, G, pos, topic, width=1200, height=800, margin=60):
+        """把布局直接写成 SVG 文本：每个节点带 <title>，悬停即显示全文"""
+        ids = list(G.nodes)
+        coords = np.array([pos[n] for n in ids], dtype=float).reshape(len(ids), 2)
+        top = margin + 40  # 标题占用的高度
+        if len(ids):
+            low, high = coords.min(axis=0), coords.max(axis=0)
+            span = np.where(high - low > 0, high - low, 1.0)
+            scale = min((width - 2 * margin) / span[0], (height - top - margin) / span[1])
+            center = (low + high) / 2
+            coords = (coords - center) * scale * np.array([1, -1]) + np.array([width / 2, (height + top - margin) / 2])
+        xy = {n: coords[i] for i, n in enumerate(ids)}
+        # matplotlib 的 s 是面积（点²），换算成半径
+        radius = {n: max(6.0, np.sqrt(self.node_style(n)[2]) / 2) for n in ids}
+
+        out = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" width="{width}" height="{height}" '
+            f'font-family="SimHei, Microsoft YaHei, PingFang SC, sans-serif">',
+            '<defs>',
+        ]
+        for node_type, color in EDGE_COLORS.items():
+            out.append(f'<marker id="arrow-{node_type}" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" markerHeight="8" '
+                       f'orient="auto-start-reverse"><path d="M0,0 L10,5 L0,10 z" fill="{color}"/></marker>')
+        out.append('</defs>')
+        out.append(f'<rect width="{width}" height="{height}" fill="white"/>')
+        out.append(f'<text x="{width / 2}" y="30" text-anchor="middle" font-size="18">辩论论点图可视化</text>')
+        out.append(f'<text x="{width / 2}" y="54" text-anchor="middle" font-size="15">{html.escape(topic)}</text>')
+
+        # 边：按两端节点半径缩短，箭头不压在节点上
+        out.append('<g class="edges" stroke-width="1.2">')
+        labels = []
+        for u, v, d in G.edges(data=True):
+            p, q = xy[u], xy[v]
+            vec = q - p
+            length = float(np.hypot(*vec))
+            if length == 0:
+                continue
+            unit = vec / length
+            a = p + unit * min(radius[u], length / 2)
+            b = q - unit * min(radius[v], length / 2)
+            out.append(f'<line x1="{a[0]:.1f}" y1="{a[1]:.1f}" x2="{b[0]:.1f}" y2="{b[1]:.1f}" '
+                       f'stroke="{EDGE_COLORS[d["node_type"]]}" marker-end="url(#arrow-{d["node_type"]})"/>')
+            mid = (p + q) / 2
+            labels.append(f'<text x="{mid[0]:.1f}" y="{mid[1]:.1f}">{html.escape(d["label"])}</text>')
+        out.append('</g>')
+        out.append('<g class="edge-labels" font-size="9" fill="red" text-anchor="middle" '
+                   'paint-order="stroke" stroke="white" stroke-width="3">')
+        out.extend(labels)
+        out.append('</g>')
+
+        out.append('<g class="nodes" stroke="black">')
+        for n in ids:
+            node = self.nodes[n]
+            marker, color, _ = self.node_style(n)
+            x, y = xy[n]
+            r = radius[n]
+            if marker == "s":
+                shape = f'<rect x="{x - r:.1f}" y="{y - r:.1f}" width="{2 * r:.1f}" height="{2 * r:.1f}" fill="{color}"/>'
+            elif marker == "^":
+                shape = (f'<polygon points="{x:.1f},{y - r:.1f} {x - r:.1f},{y + r * 0.8:.1f} {x + r:.1f},{y + r * 0.8:.1f}" '
+                         f'fill="{color}"/>')
+            else:
+                shape = f'<circle cx="{x:.1f}" cy="{y:.1f}" r="{r:.1f}" fill="{color}"/>'
+            full_text = f"{n}（{node.speaker}，{node.node_type}）：{node.text}"
+            label_lines = G.nodes[n]["label"].split("\n")
+            tspans = "".join(
+                f'<tspan x="{x:.1f}" dy="{0 if k == 0 else 1.2}em">{html.escape(line)}</tspan>'
+                for k, line in enumerate(label_lines)
+            )
+            out.append(
+                f'<g class="node" data-text="{html.escape(full_text)}"><title>{html.escape(full_text)}</title>{shape}'
+                f'<text x="{x:.1f}" y="{y - (len(label_lines) - 1) * 0.6 * 8:.1f}" font-size="8" text-anchor="middle" '
+                f'stroke="none" fill="black">{tspans}</text></g>'
+            )
+        out.append('</g>')
+
+        # 图例
+        out.append('<g class="legend" font-size="12">')
+        out.append(f'<text x="20" y="{top - 10}">图例</text>')
+        for k, (marker, color, label) in enumerate(LEGEND_ITEMS):
+            y = top + 8 + k * 20
+            if marker == "s":
+                shape = f'<rect x="22" y="{y - 6}" width="12" height="12" fill="{color}" stroke="black"/>'
+            elif marker == "^":
+                shape = f'<polygon points="28,{y - 7} 21,{y + 6} 35,{y + 6}" fill="{color}" stroke="black"/>'
+            else:
+                shape = f'<circle cx="28" cy="{y}" r="6" fill="{color}" stroke="black"/>'
+            out.append(f'{shape}<text x="42" y="{y + 4}">{label}</text>')
+        out.append('</g>')
+        out.append('</svg>')
+        return "\n".join(out)
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+html, body {{ margin: 0; height: 100%; overflow: hidden; background: #fafafa; }}
+#stage {{ width: 100%; height: 100%; cursor: grab; }}
+#stage svg {{ width: 100%; height: 100%; }}
+#tip {{ position: fixed; display: none; max-width: 420px; padding: 6px 10px; background: rgba(255,255,255,0.95);
+        border: 1px solid #999; border-radius: 4px; font: 13px/1.5 SimHei, "Microsoft YaHei", sans-serif; pointer-events: none; }}
+.node:hover > :first-of-type {{ stroke-width: 2.5; }}
+</style>
+</head>
+<body>
+<div id="stage">
+{svg}
+</div>
+<div id="tip"></div>
+<script>
+(function () {{
+  var svg = document.querySelector("#stage svg"), tip = document.getElementById("tip");
+  var vb = svg.viewBox.baseVal, drag = null;
+  svg.removeAttribute("width"); svg.removeAttribute("height");
+  function toSvg(e) {{
+    var r = svg.getBoundingClientRect(), s = Math.max(vb.width / r.width, vb.height / r.height);
+    return {{x: vb.x + (e.clientX - r.left - (r.width - vb.width / s) / 2) * s,
+             y: vb.y + (e.clientY - r.top - (r.height - vb.height / s) / 2) * s, s: s}};
+  }}
+  svg.addEventListener("wheel", function (e) {{
+    e.preventDefault();
+    var p = toSvg(e), k = e.deltaY < 0 ? 0.85 : 1 / 0.85;
+    vb.x = p.x - (p.x - vb.x) * k; vb.y = p.y - (p.y - vb.y) * k;
+    vb.width *= k; vb.height *= k;
+  }}, {{passive: false}});
+  svg.addEventListener("mousedown", function (e) {{ drag = toSvg(e); svg.parentNode.style.cursor = "grabbing"; }});
+  window.addEventListener("mouseup", function () {{ drag = null; svg.parentNode.style.cursor = "grab"; }});
+  window.addEventListener("mousemove", function (e) {{
+    if (drag) {{
+      var p = toSvg(e);
+      vb.x -= p.x - drag.x; vb.y -= p.y - drag.y;
+    }}
+    var node = e.target.closest && e.target.closest(".node");
+    if (node && !drag) {{
+      tip.textContent = node.getAttribute("data-text");
+      tip.style.display = "block";
+      tip.style.left = (e.clientX + 14) + "px"; tip.style.top = (e.clientY + 14) + "px";
+    }} else {{
+      tip.style.display = "none";
+    }}
+  }});
+  // 网页里用自定义提示框，去掉浏览器自带的 title 提示，避免重复
+  Array.prototype.forEach.call(svg.querySelectorAll(".node > title"), function (t) {{ t.remove(); }});
+}})();
+</script>
+</body>
+</html>
+"""
+
+def wrap_html(svg, topic):
+    """把 SVG 嵌入自包含的网页：拖动平移、滚轮缩放、悬停显示全文，不依赖任何外部资源"""
+    return HTML_TEMPLATE.format(title=html.escape(f"辩论论点图可视化 - {topic}"), svg=svg)
+
+def main(filepath=FILEPATH, topic=TOPIC, output_path=None):
+    if output_path is None:
+        output_path = filepath[0:10] + "论点拓扑图.png"
     with open(filepath, 'r', encoding='utf-8') as f:
         nodes_list = json.load(f)
-    graph = DebateGraph()
-    for node_dict in nodes_list:
-        node = UtteranceNode(
-            node_id=node_dict["id"],
-            speaker=node_dict["speaker"],
-            text=node_dict["text"],
-            node_type=node_dict["node_type"],
-            base_importance=node_dict.get("base_importance", 0.0),
-            target_id=node_dict.get("target_id"),
-            delta=node_dict.get("delta", 0.0),
-            round_number=node_dict.get("round_number")
-        )
-        graph.add_node(node)
-    graph.visualize_graph(filename=filepath[0:10]+"论点拓扑图.png", topic=topic)
-    print(f"\n论点拓扑图已保存为 {filepath[0:10]+"论点拓扑图.png"}.png")
+    graph = DebateGraph.from_dicts(nodes_list)
+    graph.visualize_graph(filename=output_path, topic=topic)
+    print(f"\n论点拓扑图已保存为 {output_path}")
 
 if __name__ == "__main__":
     main()
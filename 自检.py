@@ -0,0 +1,231 @@
+import os
+import sys
+import tempfile
+import threading
+from 大模型接口 import HTTPBackend, RecordingBackend, run_sync
+from 性能基准 import SyntheticBackend
+from 向量库 import text_hash
+
+# 自检：不联网地检查几条容易在改动中被破坏的约定，全部通过时退出码为 0。
+#   python 自检.py
+# 每项检查是一个 check_ 开头的函数，失败时抛出 AssertionError。
+
+RESULTS_DIR = "一些运行结果"  # 仓库自带的论点拓扑图，用作载入、打包的样例
+
+def check_stream_replay():
+    """流式录制的请求，经本地替身服务器以流式回放，得到与录制时相同的回复"""
+    from 本地替身服务器 import make_server
+    messages = [{"role": "user", "content": "当前的论点拓扑图如下：\n（空）\n本轮发言：\nPro: 自由意味着可以选择向下"}]
+    with tempfile.TemporaryDirectory() as work_dir:
+        record_path = os.path.join(work_dir, "录制的响应.jsonl")
+        recorder = RecordingBackend(SyntheticBackend(), record_path)
+
+        async def collect(backend):
+            return "".join([piece async for piece in backend.chat_stream("glm-4-flash", messages, temperature=0.2)])
+
+        recorded = run_sync(collect(recorder))
+        server = make_server(record_path, port=0, miss="error")
+        server.RequestHandlerClass.log_message = lambda *args: None
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            backend = HTTPBackend("offline", f"http://127.0.0.1:{server.server_address[1]}", max_retries=0)
+            replayed = run_sync(collect(backend))
+            run_sync(backend.aclose())
+        finally:
+            server.shutdown()
+            server.server_close()
+    assert recorded and replayed == recorded, f"回放结果与录制不一致：{replayed[:50]!r} != {recorded[:50]!r}"
+
+def check_graph_load_lossless():
+    """已保存的论点拓扑图载入后节点一个不少（文本仅差标点的节点也要保留），还原出的 json 与原文件相同"""
+    import glob
+    import json
+    from 论点图 import DebateGraph
+    paths = glob.glob(os.path.join(RESULTS_DIR, "*.json"))
+    assert paths, f"{RESULTS_DIR} 下没有论点拓扑图"
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            nodes_list = json.load(f)
+        graph = DebateGraph.from_dicts(nodes_list)
+        assert graph.to_dicts() == nodes_list, f"{path}：载入 {len(nodes_list)} 个节点，还原出 {len(graph.nodes)} 个"
+
+def check_archive_roundtrip():
+    """论点拓扑图打包成归档后，每场比赛读出的节点与原 json 相同，目录中的双方总分与原图一致"""
+    import glob
+    import json
+    from 论点图 import DebateGraph
+    from 论点图归档 import DebateArchive, pack_json_files, write_archive
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))
+    with tempfile.TemporaryDirectory() as work_dir:
+        archive_path = os.path.join(work_dir, "样例.dgar")
+        assert pack_json_files(paths, archive_path) == len(paths)
+        with DebateArchive(archive_path) as archive:
+            Pro, Con = archive.team_scores()
+            for i, path in enumerate(paths):
+                with open(path, "r", encoding="utf-8") as f:
+                    nodes_list = json.load(f)
+                assert archive.source(i) == path
+                assert archive.debate(i).to_dicts() == nodes_list, f"{path}：归档中的节点与原文件不同"
+                scores = DebateGraph.from_dicts(nodes_list).team_scores
+                assert abs(Pro[i] - scores["Pro"]) < 1e-9 and abs(Con[i] - scores["Con"]) < 1e-9, f"{path}：双方总分不一致"
+        # 目标不在图中的支持/反驳（较早的论点拓扑图中可能出现）也要原样还原
+        dangling = [
+            {"id": "node_1", "speaker": "Pro", "text": "论点", "node_type": "new_argument", "base_importance": 1.0,
+             "target_id": None, "delta": 0.0, "round_number": 1},
+            {"id": "node_2", "speaker": "Con", "text": "反驳", "node_type": "attack", "base_importance": 0.0,
+             "target_id": "node_9", "delta": -0.3, "round_number": 2},
+        ]
+        write_archive(archive_path, [("悬空的目标", dangling, "")])
+        with DebateArchive(archive_path) as archive:
+            assert archive.debate(0).to_dicts() == dangling, "目标不在图中的节点没有原样还原"
+
+def check_optional_stage_failure():
+    """可选阶段失败不中止调度：与它无关的阶段照常执行，只跳过依赖它的输出的阶段；必需阶段失败仍然抛出"""
+    from 阶段调度 import Stage, run_stages
+
+    def fail(**kwargs):
+        raise KeyError("向量库中缺少该文本")
+
+    stages = [
+        Stage("scoring", lambda graph: {"scores": len(graph)}, inputs=("graph",), outputs=("scores",)),
+        Stage("library", fail, inputs=("graph",), outputs=("added",), optional=True),
+        Stage("report", lambda added: None, inputs=("added",)),
+        Stage("commentary", lambda scores: {"commentary": f"得分 {scores}"}, inputs=("scores",), outputs=("commentary",)),
+    ]
+    values, report = run_stages(stages, {"graph": [1, 2, 3]})
+    assert values["commentary"] == "得分 3"
+    assert list(report["failed"]) == ["library"] and report["skipped"] == ["report"]
+    try:
+        run_stages([Stage("scoring", fail, inputs=("graph",))], {"graph": []})
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("必需阶段失败时应抛出异常")
+
+def check_rejected_response_not_cached():
+    """调用方拒绝的回复从缓存中删除，下次重新请求；命中缓存时返回的是副本，不改动缓存中的值"""
+    from 响应缓存 import CachedBackend, ResponseCache
+    messages = [{"role": "user", "content": "请只输出 []"}]
+    with tempfile.TemporaryDirectory() as work_dir:
+        cache = ResponseCache(os.path.join(work_dir, "响应缓存.sqlite"))
+        backend = CachedBackend(SyntheticBackend(), cache)
+        first = run_sync(backend.chat("glm-4-flash", messages, temperature=0.5))
+        hit = run_sync(backend.chat("glm-4-flash", messages, temperature=0.5))
+        assert hit.get("from_cache") and "from_cache" not in first
+        assert backend.discard("glm-4-flash", messages, temperature=0.5) and cache.stats()["entries"] == 0
+        again = run_sync(backend.chat("glm-4-flash", messages, temperature=0.5))
+        assert not again.get("from_cache"), "被拒绝的回复仍然命中了缓存"
+        cache.close()
+
+def check_journal_tracks_extraction_config():
+    """轮次日志的文件头随抽取提示词和模型配置变化，改动配置后不会回放旧的轮次"""
+    import main as judge
+    saved = judge.EXTRACT_MAX_TOKENS, judge.ROUTER_OBJECTIVE, judge.CACHE_PATH
+    judge.CACHE_PATH = None  # 不在当前目录下创建响应缓存
+    try:
+        model = judge.DebateJudgeModel("offline", judge.ARGUMENT_ROUNDS, topic="向下的自由是不是自由")
+        header = model.journal_header()
+        judge.EXTRACT_MAX_TOKENS += 1
+        assert model.journal_header() != header, "修改 EXTRACT_MAX_TOKENS 后日志文件头没有变化"
+        judge.EXTRACT_MAX_TOKENS = saved[0]
+        judge.ROUTER_OBJECTIVE = dict(saved[1], cost=0.0)
+        assert model.journal_header() != header, "修改 ROUTER_OBJECTIVE 后日志文件头没有变化"
+    finally:
+        judge.EXTRACT_MAX_TOKENS, judge.ROUTER_OBJECTIVE, judge.CACHE_PATH = saved
+    model.llm_client.topic = "另一个辩题"
+    assert model.journal_header()["extraction"] != header["extraction"], "提示词改变后抽取配置的哈希没有变化"
+
+def check_brackets_in_prose():
+    """回复数组之前的说明文字中有方括号时，不能把它当成回复数组而丢掉后面真正的更新；无效的回复不能被当作“没有更新”"""
+    from 流式解析 import JsonArrayStream
+    cases = [
+        ('好的，按照[要求]输出：```json\n[{"action": "support"}, {"action": "attack"}]\n```', 2, True),
+        ("拓扑图为空（[]），本轮没有更新：[]", 0, True),
+        ("好的，按照[要求]输出：", 0, False),
+        ('[]\n补充：{"action": "support", ', 0, False),
+        ('[{"action": 无效}]', 0, False),
+    ]
+    for text, count, usable in cases:
+        for size in (len(text), 1):  # 一次收到完整回复 / 逐字到达
+            parser = JsonArrayStream()
+            items = [item for i in range(0, len(text), size) for item in parser.feed(text[i:i + size])]
+            parser.close()
+            assert (len(items), parser.parsed_anything()) == (count, usable), \
+                f"{text!r}：得到 {len(items)} 条、可用 {parser.parsed_anything()}，应为 {count} 条、可用 {usable}"
+
+def check_torn_embedding_index():
+    """向量库索引的最后一行写到一半后，之后新增的向量在重新载入时仍然都在"""
+    import numpy as np
+    from 向量库 import EmbeddingStore
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = EmbeddingStore(work_dir, "embedding-3", 4)
+        store.add_many(["甲", "乙"], np.ones((2, 4)))
+        with open(store.index_path, "a", encoding="utf-8") as f:
+            f.write('{"hash": "写到一半')
+        store = EmbeddingStore(work_dir, "embedding-3", 4)
+        store.add_many(["丙"], np.full((1, 4), 3.0))
+        store = EmbeddingStore(work_dir, "embedding-3", 4)
+        assert len(store) == 3 and "丙" in store, f"重新载入后只有 {len(store)} 条向量"
+        assert (store.get_many(["丙"]) == 3.0).all()
+
+def check_torn_argument_library():
+    """论点库的最后一行写到一半后，之后收录的比赛在重新载入时仍然都在；向量库中缺少的行被跳过而不是让论点库无法打开"""
+    import glob
+    import json
+    from 论点图 import DebateGraph
+    from 论点库 import ArgumentLibrary
+    from 向量库 import EmbeddingStore
+    graphs = []
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))[:2]:
+        with open(path, "r", encoding="utf-8") as f:
+            graphs.append(DebateGraph.from_dicts(json.load(f)))
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = EmbeddingStore(work_dir, "embedding-3", 8)
+        texts = store.missing([node.text for graph in graphs for node in graph.nodes.values()])
+        store.add_many(texts, [SyntheticBackend.embedding(text, 8) for text in texts])
+        ArgumentLibrary(store).add_debate("甲", graphs[0], "甲.json")
+        with open(store.base_path + ".library.jsonl", "a", encoding="utf-8") as f:
+            f.write('{"hash": "写到一半')
+        ArgumentLibrary(store).add_debate("乙", graphs[1], "乙.json")
+        library = ArgumentLibrary(store)
+        assert library.debates == {("甲", "甲.json"), ("乙", "乙.json")}, f"重新载入后只有 {sorted(library.debates)}"
+        store.rows.pop(text_hash(graphs[1].to_dicts()[0]["text"]))
+        library = ArgumentLibrary(store)
+        assert library.debates == {("甲", "甲.json")}, "向量缺失的比赛应被跳过"
+
+def check_torn_transcription_checkpoint():
+    """录音转写断点的最后一行写到一半后，之后追加的断点在重新载入时仍然都在"""
+    from 录音转文字toJson import append_checkpoint, chunk_hash, load_checkpoint
+    with tempfile.TemporaryDirectory() as work_dir:
+        checkpoint_path = os.path.join(work_dir, "转写.json.ckpt.jsonl")
+        with open(checkpoint_path, "a", encoding="utf-8") as f:
+            append_checkpoint(f, "第一段", '{"speaker": "Pro"}')
+            f.write('{"hash": "写到一半')
+        assert len(load_checkpoint(checkpoint_path)) == 1
+        with open(checkpoint_path, "a", encoding="utf-8") as f:
+            append_checkpoint(f, "第二段", '{"speaker": "Con"}')
+        done = load_checkpoint(checkpoint_path)
+        assert set(done) == {chunk_hash("第一段"), chunk_hash("第二段")}, f"重新载入后只有 {len(done)} 个断点"
+
+CHECKS = [
+    check_stream_replay, check_brackets_in_prose, check_graph_load_lossless, check_archive_roundtrip,
+    check_optional_stage_failure, check_rejected_response_not_cached, check_journal_tracks_extraction_config,
+    check_torn_embedding_index, check_torn_argument_library, check_torn_transcription_checkpoint,
+]
+
+def main():
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+        except Exception as e:
+            failed += 1
+            print(f"[失败] {check.__name__}：{type(e).__name__}: {e}")
+        else:
+            print(f"[通过] {check.__name__}")
+    print(f"共 {len(CHECKS)} 项，失败 {failed} 项")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
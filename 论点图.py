@@ -0,0 +1,379 @@
+import json
+import sys
+import unicodedata
+
+# 论点拓扑图的数据结构，main.py 和“绘制论点拓扑图.py”共用：
+#   UtteranceNode  一个发言节点（__slots__，没有实例字典）
+#   DebateGraph    可增量修改的图：反向索引、持方索引、实时比分和文本去重索引
+#   ColumnarGraph  只读的列式存储：数值字段存为 numpy 数组，文本统一驻留到 StringTable，
+#                  适合把大量已评判的比赛同时载入内存并做向量化查询
+# 节点的 json 格式见 UtteranceNode.to_dict。
+
+# 文本归一化：全角转半角、统一大小写、去掉空白和标点，用于判断两条发言是否重复
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(ch for ch in text if not ch.isspace() and not unicodedata.category(ch).startswith(("P", "S")))
+
+class UtteranceNode:
+    __slots__ = ("node_id", "speaker", "text", "node_type", "base_importance", "target_id", "delta", "round_number")
+
+    def __init__(self, node_id, speaker, text, node_type, base_importance=0.0, target_id=None, delta=0.0, round_number=None):
+        """
+        node_type: 
+          - "new_argument": 新增论点（需要 base_importance），
+          - "support": 支持（需要 target_id 与正 delta），
+          - "attack": 反驳（需要 target_id 与负 delta）。
+        """
+        self.node_id = node_id
+        self.speaker = speaker
+        self.text = text
+        self.node_type = node_type
+        self.base_importance = base_importance
+        self.target_id = target_id
+        self.delta = delta
+        self.round_number = round_number  # 用于记录该节点所在的辩论轮数
+
+    def to_dict(self):
+        return {
+            "id": self.node_id,
+            "speaker": self.speaker,
+            "text": self.text,
+            "node_type": self.node_type,
+            "base_importance": self.base_importance,
+            "target_id": self.target_id,
+            "delta": self.delta,
+            "round_number": self.round_number
+        }
+
+    @classmethod
+    def from_dict(cls, node_dict):
+        return cls(
+            node_id=node_dict["id"],
+            speaker=node_dict["speaker"],
+            text=node_dict["text"],
+            node_type=node_dict["node_type"],
+            base_importance=node_dict.get("base_importance", 0.0),
+            target_id=node_dict.get("target_id"),
+            delta=node_dict.get("delta", 0.0),
+            round_number=node_dict.get("round_number")
+        )
+
+############################################
+# 辩论论点拓扑图：管理所有发言节点
+############################################
+class DebateGraph:
+    def __init__(self):
+        # 所有节点存放在 nodes 字典中，键为 node_id
+        self.nodes = {}
+        # 反向索引：target_id -> 指向它的支持/反驳节点 id（用字典当作有序集合）
+        self.children = {}
+        # 持方索引：speaker -> 该持方的 new_argument 节点 id
+        self.arguments_by_speaker = {}
+        # 实时比分：每个论点的残留度，以及双方总分（只计正向贡献），随节点增删增量更新
+        self.aggregates = {}
+        self.team_scores = {"Pro": 0.0, "Con": 0.0}
+        # 文本索引：归一化文本 -> 节点 id，用于在加入节点时直接拒绝重复
+        self.text_index = {}
+        # 被合并掉的节点 id -> 保留下来的节点 id
+        self.aliases = {}
+        
+    def add_node(self, node: UtteranceNode):
+        """
+        加入节点并返回其最终的 node_id。
+        如果已有归一化文本相同的节点，则不加入新节点，记录别名并返回已有节点的 id。
+        """
+        if node.target_id is not None:
+            node.target_id = self.resolve(node.target_id)
+        existing_id = self.find_duplicate(node.text)
+        if existing_id is not None and existing_id != node.node_id:
+            self.aliases[node.node_id] = existing_id
+            return existing_id
+        return self.insert_node(node)
+
+    def insert_node(self, node: UtteranceNode):
+        """原样加入节点，不查重、不解析别名；同 id 的旧节点被替换。载入已保存的图时使用，保证节点与文件一一对应"""
+        if node.node_id in self.nodes:
+            self.remove_node(node.node_id)
+        self.nodes[node.node_id] = node
+        self._index(node)
+        return node.node_id
+
+    def find_duplicate(self, text):
+        """返回与 text 归一化后相同的已有节点 id，没有则返回 None"""
+        key = normalize_text(text)
+        node_id = self.text_index.get(key) if key else None
+        if node_id is not None and node_id not in self.nodes:
+            # 节点文本被直接修改过，索引已过期
+            del self.text_index[key]
+            return None
+        return node_id
+
+    def resolve(self, node_id):
+        """沿别名找到节点最终保留下来的 id"""
+        while node_id in self.aliases:
+            node_id = self.aliases[node_id]
+        return node_id
+
+    def merge_into(self, duplicate_id, survivor_id):
+        """删除重复节点，并把所有指向它的支持/反驳改为指向保留节点"""
+        for child in self.children_of(duplicate_id):
+            self.set_target(child.node_id, survivor_id)
+        self.remove_node(duplicate_id)
+        self.aliases[duplicate_id] = survivor_id
+
+    def remove_node(self, node_id):
+        node = self.nodes.get(node_id)
+        if node is not None:
+            self._unindex(node)
+            del self.nodes[node_id]
+
+    def set_target(self, node_id, target_id):
+        """修改节点的 target_id，同时维护反向索引"""
+        node = self.nodes[node_id]
+        self._unindex(node)
+        node.target_id = target_id
+        self._index(node)
+
+    def _index(self, node):
+        if node.target_id is not None:
+            self.children.setdefault(node.target_id, {})[node.node_id] = None
+            if node.target_id in self.aggregates:
+                self._set_aggregate(node.target_id, self.aggregates[node.target_id] + node.delta)
+        if node.node_type == "new_argument":
+            self.arguments_by_speaker.setdefault(node.speaker, {})[node.node_id] = None
+            self.aggregates[node.node_id] = 0.0
+            self._set_aggregate(node.node_id, self.argument_score(node.node_id))
+        key = normalize_text(node.text)
+        if key:
+            self.text_index.setdefault(key, node.node_id)
+
+    def _unindex(self, node):
+        if node.target_id is not None:
+            siblings = self.children.get(node.target_id)
+            if siblings is not None:
+                siblings.pop(node.node_id, None)
+                if not siblings:
+                    del self.children[node.target_id]
+            if node.target_id in self.aggregates:
+                self._set_aggregate(node.target_id, self.aggregates[node.target_id] - node.delta)
+        if node.node_type == "new_argument":
+            arguments = self.arguments_by_speaker.get(node.speaker)
+            if arguments is not None:
+                arguments.pop(node.node_id, None)
+                if not arguments:
+                    del self.arguments_by_speaker[node.speaker]
+            self._set_aggregate(node.node_id, 0.0)
+            del self.aggregates[node.node_id]
+        key = normalize_text(node.text)
+        if self.text_index.get(key) == node.node_id:
+            del self.text_index[key]
+
+    def _set_aggregate(self, arg_id, value):
+        # 先减去旧的正向贡献，再加上新的
+        speaker = self.nodes[arg_id].speaker if arg_id in self.nodes else None
+        if speaker in self.team_scores:
+            old = self.aggregates[arg_id]
+            self.team_scores[speaker] += max(value, 0.0) - max(old, 0.0)
+        self.aggregates[arg_id] = value
+
+    def children_of(self, node_id):
+        """返回所有以 node_id 为目标的支持/反驳节点"""
+        return [self.nodes[child_id] for child_id in self.children.get(node_id, ())]
+
+    def arguments_of(self, speaker):
+        """返回某一持方的所有 new_argument 节点"""
+        return [self.nodes[arg_id] for arg_id in self.arguments_by_speaker.get(speaker, ())]
+
+    def argument_score(self, node_id):
+        """论点的残留度：base_importance 加上所有对其的支持/反驳 delta"""
+        aggregated = self.nodes[node_id].base_importance
+        for child in self.children_of(node_id):
+            aggregated += child.delta
+        return aggregated
+
+    def remove_duplicate_nodes(self):
+        # add_node 已经拒绝了重复文本，这里只处理绕过 add_node（insert_node 载入、直接修改 text）产生的重复
+        duplicates = []
+        for node_id, node in self.nodes.items():
+            key = normalize_text(node.text)
+            survivor_id = self.text_index.get(key)
+            if survivor_id is None and key:
+                self.text_index[key] = node_id
+            elif survivor_id != node_id and key:
+                duplicates.append((node_id, survivor_id))
+
+        for node_id, survivor_id in duplicates:
+            self.merge_into(node_id, survivor_id)
+
+    @classmethod
+    def from_dicts(cls, nodes_list):
+        """从节点字典列表原样还原：文本重复的节点都保留（去重只在抽取时和词向量查重时进行）"""
+        graph = cls()
+        for node_dict in nodes_list:
+            graph.insert_node(UtteranceNode.from_dict(node_dict))
+        return graph
+
+    def to_dicts(self):
+        return [node.to_dict() for node in self.nodes.values()]
+
+    def to_json(self):
+        return json.dumps(self.to_dicts(), ensure_ascii=False, indent=2)
+    
+
+############################################
+# 列式存储
+############################################
+NODE_TYPES = ("new_argument", "support", "attack")
+NO_VALUE = -1  # 整数列中表示“没有”（无目标、无轮次、id 不是 node_数字 格式）
+
+class StringTable:
+    """字符串驻留表：相同的文本只存一份，列中只保存其下标。多张图可以共用同一个表"""
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def intern(self, text):
+        position = self.index.get(text)
+        if position is None:
+            position = len(self.strings)
+            text = sys.intern(text)
+            self.strings.append(text)
+            self.index[text] = position
+        return position
+
+    def lookup(self, text):
+        """返回 text 的下标，没有则返回 None"""
+        return self.index.get(text)
+
+    def __getitem__(self, position):
+        return self.strings[position]
+
+    def __len__(self):
+        return len(self.strings)
+
+class ColumnarGraph:
+    """
+    只读的列式论点拓扑图，每个节点占一行：
+      id_number      int32    node_17 -> 17，其他格式的 id 记为 -1，原样保存在 extra_ids 中
+      node_type      uint8    NODE_TYPES 中的下标
+      speaker        int32    speaker 字符串在 StringTable 中的下标
+      round_number   int16    -1 表示没有轮次
+      base_importance, delta  float64（分数要能原样写回 json，不用 float32）
+      target         int32    目标节点的行号，-1 表示没有目标或目标不在图中；
+                              后者（较早的论点拓扑图中可能出现）的目标 id 原样保存在 dangling_targets 中
+      text           int32    文本在 StringTable 中的下标
+    """
+    COLUMNS = ("id_number", "node_type", "speaker", "round_number", "base_importance", "delta", "target", "text")
+
+    def __init__(self, columns, strings, extra_ids=None, dangling_targets=None):
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+        self.strings = strings
+        self.extra_ids = extra_ids or {}  # 行号 -> 非 node_数字 格式的 id
+        self.dangling_targets = dangling_targets or {}  # 行号 -> 不在图中的目标 id
+
+    @classmethod
+    def from_nodes(cls, nodes, strings=None):
+        """nodes: UtteranceNode 或节点字典的序列"""
+        import numpy as np
+        strings = strings if strings is not None else StringTable()
+        nodes = [UtteranceNode.from_dict(n) if isinstance(n, dict) else n for n in nodes]
+        rows = {node.node_id: row for row, node in enumerate(nodes)}
+        n = len(nodes)
+        columns = {
+            "id_number": np.full(n, NO_VALUE, dtype=np.int32),
+            "node_type": np.zeros(n, dtype=np.uint8),
+            "speaker": np.zeros(n, dtype=np.int32),
+            "round_number": np.full(n, NO_VALUE, dtype=np.int16),
+            "base_importance": np.zeros(n, dtype=np.float64),
+            "delta": np.zeros(n, dtype=np.float64),
+            "target": np.full(n, NO_VALUE, dtype=np.int32),
+            "text": np.zeros(n, dtype=np.int32),
+        }
+        extra_ids, dangling_targets = {}, {}
+        for row, node in enumerate(nodes):
+            prefix, _, number = str(node.node_id).rpartition("_")
+            if prefix == "node" and number.isdigit():
+                columns["id_number"][row] = int(number)
+            else:
+                extra_ids[row] = node.node_id
+            if node.node_type not in NODE_TYPES:
+                raise ValueError(f"未知的节点类型：{node.node_type}")
+            columns["node_type"][row] = NODE_TYPES.index(node.node_type)
+            columns["speaker"][row] = strings.intern(node.speaker)
+            if node.round_number is not None:
+                columns["round_number"][row] = node.round_number
+            columns["base_importance"][row] = node.base_importance or 0.0
+            columns["delta"][row] = node.delta or 0.0
+            columns["target"][row] = rows.get(node.target_id, NO_VALUE)
+            if node.target_id is not None and node.target_id not in rows:
+                dangling_targets[row] = node.target_id
+            columns["text"][row] = strings.intern(node.text)
+        return cls(columns, strings, extra_ids, dangling_targets)
+
+    @classmethod
+    def from_graph(cls, graph, strings=None):
+        return cls.from_nodes(list(graph.nodes.values()), strings)
+
+    def __len__(self):
+        return len(self.id_number)
+
+    def node_id(self, row):
+        return self.extra_ids.get(row) or f"node_{self.id_number[row]}"
+
+    def node(self, row):
+        target = self.target[row]
+        round_number = self.round_number[row]
+        return UtteranceNode(
+            node_id=self.node_id(row),
+            speaker=self.strings[self.speaker[row]],
+            text=self.strings[self.text[row]],
+            node_type=NODE_TYPES[self.node_type[row]],
+            base_importance=float(self.base_importance[row]),
+            target_id=self.node_id(target) if target != NO_VALUE else self.dangling_targets.get(row),
+            delta=float(self.delta[row]),
+            round_number=int(round_number) if round_number != NO_VALUE else None
+        )
+
+    def to_graph(self, graph_class=None):
+        graph = (graph_class or DebateGraph)()
+        for row in range(len(self)):
+            graph.insert_node(self.node(row))
+        return graph
+
+    def to_dicts(self):
+        return [self.node(row).to_dict() for row in range(len(self))]
+
+    ##### 向量化查询
+    def mask(self, node_type=None, speaker=None, min_round=None, max_round=None):
+        """按条件筛选行，返回布尔数组"""
+        import numpy as np
+        selected = np.ones(len(self), dtype=bool)
+        if node_type is not None:
+            selected &= self.node_type == NODE_TYPES.index(node_type)
+        if speaker is not None:
+            code = self.strings.lookup(speaker)
+            selected &= self.speaker == (code if code is not None else NO_VALUE)
+        if min_round is not None:
+            selected &= (self.round_number != NO_VALUE) & (self.round_number >= min_round)
+        if max_round is not None:
+            selected &= (self.round_number != NO_VALUE) & (self.round_number <= max_round)
+        return selected
+
+    def argument_scores(self):
+        """每行的残留度：论点行为 base_importance 加上所有指向它的 delta，其他行为 0"""
+        import numpy as np
+        has_target = self.target != NO_VALUE
+        incoming = np.bincount(self.target[has_target], weights=self.delta[has_target], minlength=len(self))
+        is_argument = self.node_type == NODE_TYPES.index("new_argument")
+        return np.where(is_argument, self.base_importance + incoming, 0.0)
+
+    def team_scores(self):
+        """双方总分（只计正向贡献），与 DebateGraph.team_scores 一致"""
+        scores = self.argument_scores()
+        positive = scores > 0
+        return {team: float(scores[positive & self.mask(speaker=team)].sum()) for team in ("Pro", "Con")}
+
+    def nbytes(self):
+        """各列占用的字节数（不含共用的 StringTable）"""
+        return sum(getattr(self, name).nbytes for name in self.COLUMNS)
@@ -0,0 +1,236 @@
+import os
+import struct
+import numpy as np
+from 论点图 import ColumnarGraph, DebateGraph, StringTable
+
+# 论点拓扑图归档：把多场已评判比赛的论点拓扑图打包进一个二进制文件。
+# 读取时整个文件用 np.memmap 映射，各列直接切片使用，不解析 json、不逐个创建节点对象；
+# 赛季级别的统计（几千场比赛）只会读到真正用到的列。
+#
+# 文件布局（小端序，每一段按 8 字节对齐）：
+#   文件头     MAGIC，4 个计数（比赛数、节点行数、字符串数、非标准 id 数），
+#              然后按 SECTIONS 的顺序给出每一段的 (偏移字节, 元素个数)
+#   directory  每场比赛一条：辩题、来源路径（字符串下标）、首行、行数、双方总分
+#   各数值列   与 ColumnarGraph 的列相同，所有比赛的行首尾相接；target 是比赛内部的行号
+#   extra_ids  不是 node_数字 格式的节点 id：(全局行号, 字符串下标)，按行号排序
+#   dangling_targets  目标不在本场比赛图中的节点的目标 id，格式同 extra_ids
+#   string_offsets / string_data  字符串表：第 i 个字符串是 data[offsets[i]:offsets[i+1]] 的 utf-8 解码
+# 所有比赛共用一张字符串表，重复的发言者、辩题和发言文本只存一份。
+
+MAGIC = b"DBGARC02"
+ALIGNMENT = 8
+
+DIRECTORY_DTYPE = np.dtype([
+    ("topic", "<i4"),
+    ("source", "<i4"),
+    ("first_row", "<i8"),
+    ("n_rows", "<i8"),
+    ("Pro_score", "<f8"),
+    ("Con_score", "<f8"),
+])
+EXTRA_ID_DTYPE = np.dtype([("row", "<i8"), ("string", "<i4")])
+
+SECTIONS = (
+    ("directory", DIRECTORY_DTYPE),
+    ("id_number", np.dtype("<i4")),
+    ("node_type", np.dtype("u1")),
+    ("speaker", np.dtype("<i4")),
+    ("round_number", np.dtype("<i2")),
+    ("base_importance", np.dtype("<f8")),
+    ("delta", np.dtype("<f8")),
+    ("target", np.dtype("<i4")),
+    ("text", np.dtype("<i4")),
+    ("extra_ids", EXTRA_ID_DTYPE),
+    ("dangling_targets", EXTRA_ID_DTYPE),
+    ("string_offsets", np.dtype("<u8")),
+    ("string_data", np.dtype("u1")),
+)
+HEADER = struct.Struct("<8s4Q" + "2Q" * len(SECTIONS))
+
+def _aligned(position):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+############################################
+# 写入
+############################################
+def write_archive(archive_path, debates):
+    """
+    debates: (辩题, 论点拓扑图, 来源路径) 的序列，论点拓扑图可以是 DebateGraph 或节点字典列表。
+    节点原样按行写入，不做任何去重，debate(i).to_dicts() 与写入的节点列表相同。
+    先写入临时文件再替换，写到一半中断不会留下损坏的归档。返回写入的比赛场数。
+    """
+    strings = StringTable()
+    graphs, directory = [], []
+    first_row = 0
+    for topic, graph, source in debates:
+        nodes = list(graph.nodes.values()) if isinstance(graph, DebateGraph) else graph
+        columnar = ColumnarGraph.from_nodes(nodes, strings)
+        scores = columnar.team_scores()
+        directory.append((strings.intern(topic), strings.intern(source or ""), first_row, len(columnar),
+                          scores["Pro"], scores["Con"]))
+        graphs.append(columnar)
+        first_row += len(columnar)
+
+    sections = {"directory": np.array(directory, dtype=DIRECTORY_DTYPE)}
+    for name in ColumnarGraph.COLUMNS:
+        dtype = dict(SECTIONS)[name]
+        parts = [getattr(graph, name) for graph in graphs]
+        sections[name] = np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+    extra_ids = [(directory[i][2] + row, strings.intern(node_id))
+                 for i, graph in enumerate(graphs) for row, node_id in sorted(graph.extra_ids.items())]
+    sections["extra_ids"] = np.array(extra_ids, dtype=EXTRA_ID_DTYPE)
+    sections["dangling_targets"] = np.array(
+        [(directory[i][2] + row, strings.intern(target_id))
+         for i, graph in enumerate(graphs) for row, target_id in sorted(graph.dangling_targets.items())],
+        dtype=EXTRA_ID_DTYPE)
+    encoded = [text.encode("utf-8") for text in strings.strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    sections["string_offsets"] = offsets
+    sections["string_data"] = np.frombuffer(b"".join(encoded), dtype="u1")
+
+    layout = []
+    position = _aligned(HEADER.size)
+    for name, _ in SECTIONS:
+        layout.extend((position, len(sections[name])))
+        position = _aligned(position + sections[name].nbytes)
+    header = HEADER.pack(MAGIC, len(directory), first_row, len(encoded), len(extra_ids), *layout)
+
+    tmp_path = archive_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for (name, _), offset in zip(SECTIONS, layout[::2]):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(sections[name].tobytes())
+        f.write(b"\0" * (position - f.tell()))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, archive_path)
+    return len(directory)
+
+def pack_json_files(graph_paths, archive_path, topics=None):
+    """把若干论点拓扑图json打包成归档；topics 缺省时用文件名（去掉扩展名）作为辩题"""
+    import json
+
+    def debates():
+        for i, path in enumerate(graph_paths):
+            with open(path, "r", encoding="utf-8") as f:
+                nodes_list = json.load(f)
+            topic = topics[i] if topics else os.path.splitext(os.path.basename(path))[0]
+            yield topic, nodes_list, path
+
+    return write_archive(archive_path, debates())
+
+############################################
+# 读取
+############################################
+class ArchiveStrings:
+    """归档中的字符串表，按需解码；接口与 StringTable 的只读部分相同"""
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+        self._found = {}
+
+    def __getitem__(self, position):
+        return bytes(self.data[self.offsets[position]:self.offsets[position + 1]]).decode("utf-8")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lookup(self, text):
+        """返回 text 的下标，没有则返回 None。只比较字节长度相同的字符串，结果会被缓存"""
+        if text not in self._found:
+            encoded = text.encode("utf-8")
+            lengths = np.diff(self.offsets)
+            self._found[text] = None
+            for position in np.flatnonzero(lengths == len(encoded)):
+                if bytes(self.data[self.offsets[position]:self.offsets[position + 1]]) == encoded:
+                    self._found[text] = int(position)
+                    break
+        return self._found[text]
+
+class DebateArchive:
+    """
+    只读打开一个归档：
+      archive.debate(i) / archive.find(辩题)   单场比赛的 ColumnarGraph，各列是映射内存的切片
+      archive.scan()                          依次产出 (序号, ColumnarGraph)
+      archive.columns[列名]                   全部比赛拼接在一起的列，用于跨比赛的向量化统计
+      archive.directory                       每场比赛的目录项（含双方总分），见 DIRECTORY_DTYPE
+    """
+    def __init__(self, archive_path):
+        self.path = archive_path
+        self._buffer = np.memmap(archive_path, dtype=np.uint8, mode="r")
+        if len(self._buffer) < HEADER.size:
+            raise ValueError(f"{archive_path} 不是论点拓扑图归档（文件过短）")
+        fields = HEADER.unpack(bytes(self._buffer[:HEADER.size]))
+        if fields[0] != MAGIC and fields[0][:6] == MAGIC[:6]:
+            raise ValueError(f"{archive_path} 是旧版本的归档（{fields[0]!r}），请用当前版本重新打包")
+        if fields[0] != MAGIC:
+            raise ValueError(f"{archive_path} 不是论点拓扑图归档（文件头 {fields[0]!r}）")
+        self.n_debates, self.n_rows, self.n_strings, self.n_extra_ids = fields[1:5]
+        layout = fields[5:]
+        self._sections = {}
+        for i, (name, dtype) in enumerate(SECTIONS):
+            offset, count = layout[2 * i], layout[2 * i + 1]
+            self._sections[name] = self._buffer[offset:offset + count * dtype.itemsize].view(dtype)
+        self.directory = self._sections["directory"]
+        self.columns = {name: self._sections[name] for name in ColumnarGraph.COLUMNS}
+        self.strings = ArchiveStrings(self._sections["string_offsets"], self._sections["string_data"])
+        self._extra_ids = self._sections["extra_ids"]
+        self._dangling_targets = self._sections["dangling_targets"]
+
+    def __len__(self):
+        return int(self.n_debates)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """释放对映射内存的引用；已经取出的 ColumnarGraph 仍引用映射，用完后一并丢弃即可"""
+        self._buffer = self._sections = self.directory = self.columns = self.strings = None
+        self._extra_ids = self._dangling_targets = None
+
+    def topic(self, index):
+        return self.strings[self.directory["topic"][index]]
+
+    def source(self, index):
+        return self.strings[self.directory["source"][index]]
+
+    def topics(self):
+        return [self.topic(i) for i in range(len(self))]
+
+    def find(self, topic):
+        """按辩题查找，返回该场比赛的 ColumnarGraph；同一辩题有多场时返回第一场，没有则返回 None"""
+        code = self.strings.lookup(topic)
+        if code is None:
+            return None
+        matches = np.flatnonzero(self.directory["topic"] == code)
+        return self.debate(int(matches[0])) if len(matches) else None
+
+    def debate(self, index):
+        entry = self.directory[index]
+        start, stop = int(entry["first_row"]), int(entry["first_row"] + entry["n_rows"])
+        columns = {name: column[start:stop] for name, column in self.columns.items()}
+        return ColumnarGraph(columns, self.strings, self._row_strings(self._extra_ids, start, stop),
+                             self._row_strings(self._dangling_targets, start, stop))
+
+    def _row_strings(self, table, start, stop):
+        """按行号排序的 (行号, 字符串下标) 表中落在 [start, stop) 的部分，返回 {比赛内行号: 字符串}"""
+        rows = table["row"]
+        lo, hi = np.searchsorted(rows, start), np.searchsorted(rows, stop)
+        return {int(row) - start: self.strings[string] for row, string in table[lo:hi]}
+
+    def scan(self):
+        for index in range(len(self)):
+            yield index, self.debate(index)
+
+    def debate_index(self):
+        """每一行所属的比赛序号，与 columns 中的列等长"""
+        return np.repeat(np.arange(len(self)), self.directory["n_rows"])
+
+    def team_scores(self):
+        """返回 (Pro 总分数组, Con 总分数组)，写入归档时已算好，不需要读取节点列"""
+        return np.asarray(self.directory["Pro_score"]), np.asarray(self.directory["Con_score"])
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import numpy as np
+from 向量库 import text_hash
+from 日志文件 import read_jsonl, rewrite_jsonl
+
+# 跨比赛的论点库：收录已评判比赛中的每条论点（文本、辩题、持方、节点类型、最终得分），
+# 词向量不另存一份，直接引用本地向量库（见“向量库.py”）中的行。
+# 同一辩题在不同赛事中反复出现，论点库可以回答“与这段话最接近的已知论点有哪些”。
+#
+# 近邻查找用随机超平面 LSH：每个向量在 tables 张表中各得到一个 bits 位的签名，
+# 查询时只对至少在一张表中签名相同的候选做精确的余弦相似度计算。
+# 超平面由 seed 决定，签名不落盘，载入时按块重新计算；新增论点时只计算新行的签名。
+# 库较小时（不超过 EXACT_SEARCH_LIMIT 条）直接精确比较全部论点。
+#
+# 每个 (模型, 维度) 对应一个 <模型>_<维度>.library.jsonl，追加写入；载入时截掉写到一半的最后一行，
+# 向量已不在向量库中的记录（向量库被截断或删除过）跳过并从文件中移除，该场比赛之后可以重新收录。
+
+LSH_TABLES = 20
+LSH_BITS = 10
+LSH_SEED = 0
+EXACT_SEARCH_LIMIT = 2000
+SIGNATURE_BLOCK_ROWS = 4096  # 载入时按块计算签名，避免一次读入全部向量
+
+class ArgumentLibrary:
+    def __init__(self, store, tables=LSH_TABLES, bits=LSH_BITS, seed=LSH_SEED):
+        """store: 向量库.EmbeddingStore，论点的向量都从这里读取"""
+        self.store = store
+        self.path = store.base_path + ".library.jsonl"
+        self._lock = threading.Lock()
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((store.dimensions, tables * bits)).astype(np.float32)
+        self.tables, self.bits = tables, bits
+        self.weights = (1 << np.arange(bits)).astype(np.int64)
+
+        self.records = []  # 每条出现记录：一场比赛中的一个节点
+        self.occurrences = {}  # 文本哈希 -> records 下标列表
+        self.texts = []  # 去重后的文本，与 signatures、store_rows 按行对应
+        self.store_rows = []
+        self.signatures = np.zeros((0, tables), dtype=np.int64)
+        self.debates = set()  # 已收录的 (辩题, 来源) ，避免重复收录
+        records = read_jsonl(self.path)
+        valid = [record for record in records if record["hash"] in store.rows]
+        if len(valid) < len(records):
+            dropped = {(record["topic"], record["source"]) for record in records if record["hash"] not in store.rows}
+            print(f"{self.path}：{len(records) - len(valid)} 条论点的向量不在向量库中，已跳过；"
+                  f"涉及的 {len(dropped)} 场比赛下次评判时会重新收录")
+            # 这些比赛的其余记录也一并移除，重新收录时不会重复
+            valid = [record for record in valid if (record["topic"], record["source"]) not in dropped]
+            rewrite_jsonl(self.path, valid)
+        for record in valid:
+            self._remember(record)
+        self._index_new_texts()
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _remember(self, record):
+        self.debates.add((record["topic"], record["source"]))
+        h = record["hash"]
+        if h not in self.occurrences:
+            self.occurrences[h] = []
+            self.texts.append(record["text"])
+        self.occurrences[h].append(len(self.records))
+        self.records.append(record)
+
+    def _index_new_texts(self):
+        """为还没有签名的文本计算签名；文本的向量必须已在向量库中"""
+        start = len(self.store_rows)
+        new_texts = self.texts[start:]
+        if not new_texts:
+            return
+        self.store_rows.extend(self.store.rows[text_hash(text)] for text in new_texts)
+        rows = self.store_rows[start:]
+        blocks = [self.signature(self.store.vectors[rows[i:i + SIGNATURE_BLOCK_ROWS]])
+                  for i in range(0, len(rows), SIGNATURE_BLOCK_ROWS)]
+        self.signatures = np.concatenate([self.signatures] + blocks)
+
+    def signature(self, vectors):
+        """每行向量在各张表中的签名，返回 (n, tables) 的整数数组"""
+        bits = (np.asarray(vectors, dtype=np.float32) @ self.planes) > 0
+        return bits.reshape(len(bits), self.tables, self.bits) @ self.weights
+
+    ##### 收录
+    def add_debate(self, topic, graph, source=""):
+        """
+        收录一场已评判比赛的论点拓扑图（论点图.DebateGraph）。节点文本的向量必须已在向量库中。
+        论点记录其最终残留度，支持/反驳记录其 delta。同一 (辩题, 来源) 只收录一次，返回新增的记录数。
+        """
+        source = source or ""
+        with self._lock:
+            if (topic, source) in self.debates:
+                return 0
+            records = []
+            for node in graph.nodes.values():
+                score = graph.argument_score(node.node_id) if node.node_type == "new_argument" else node.delta
+                records.append({
+                    "hash": text_hash(node.text), "text": node.text, "topic": topic, "source": source,
+                    "speaker": node.speaker, "node_type": node.node_type, "score": score,
+                    "round_number": node.round_number
+                })
+            missing = [r["text"] for r in records if r["hash"] not in self.store.rows]
+            if missing:
+                raise KeyError(f"有 {len(missing)} 条文本的向量不在向量库中，请先嵌入，如：{missing[0][:30]}")
+            with open(self.path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if not records:
+                self.debates.add((topic, source))
+            for record in records:
+                self._remember(record)
+            self._index_new_texts()
+            return len(records)
+
+    ##### 查找
+    def nearest(self, vector, k=5, min_similarity=0.0, exclude_topic=None):
+        """
+        返回与 vector 最接近的至多 k 条已知论点，按相似度从高到低：
+        {"text", "similarity", "mean_score", "occurrences": [出现记录...]}
+        exclude_topic 可排除某个辩题（例如查询正在评判的这场比赛自身）。
+        """
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm == 0 or not self.texts:
+            return []
+        query = query / norm
+        with self._lock:
+            if len(self.texts) <= EXACT_SEARCH_LIMIT:
+                candidates = np.arange(len(self.texts))
+            else:
+                candidates = np.flatnonzero((self.signatures == self.signature(query[None, :])).any(axis=1))
+            store_rows = [self.store_rows[i] for i in candidates]
+            texts = self.texts
+        if not len(candidates):
+            return []
+        vectors = np.asarray(self.store.vectors[store_rows], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1.0
+        similarities = vectors @ query / norms
+        results = []
+        for position in np.argsort(-similarities):
+            similarity = float(similarities[position])
+            if similarity < min_similarity or len(results) >= k:
+                break
+            occurrences = [self.records[i] for i in self.occurrences[text_hash(texts[candidates[position]])]
+                           if self.records[i]["topic"] != exclude_topic]
+            if not occurrences:
+                continue
+            results.append({
+                "text": texts[candidates[position]],
+                "similarity": similarity,
+                "mean_score": sum(r["score"] for r in occurrences) / len(occurrences),
+                "occurrences": occurrences
+            })
+        return results
+
+_libraries = {}
+
+def get_argument_library(store):
+    """同一个向量库在进程内共用一个论点库"""
+    key = store.base_path
+    if key not in _libraries:
+        _libraries[key] = ArgumentLibrary(store)
+    return _libraries[key]
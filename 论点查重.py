@@ -1,86 +1,153 @@
+import asyncio
 import json
-import scipy.spatial
-from zhipuai import ZhipuAI
+import numpy as np
+from 大模型接口 import get_backend, run_sync, ZHIPU_BASE_URL
+from 向量库 import get_embedding_store
 
 FILEPATH = "<生成的论点图json文件>.json"
 API_KEY = "<你的智谱API密钥>" 
-
-def embedding(text_list,api_key=API_KEY):
-    client = ZhipuAI(api_key=api_key)
-    embeddings = []
+BASE_URL = ZHIPU_BASE_URL  # 离线运行时改为本地替身服务器地址
+EMBEDDING_MODEL = "embedding-3"
+EMBEDDING_DIMENSIONS = 2048
+EMBEDDING_STORE_DIR = "向量库"  # 本地向量库目录，已嵌入过的文本不再请求接口；设为 None 则不使用
+ARGUMENT_LIBRARY = True  # 把评判完的比赛收录进跨比赛论点库（见“论点库.py”），需要启用向量库
+
+def embedding(text_list,api_key=API_KEY,base_url=BASE_URL):
+    backend = get_backend(api_key, base_url)
+    if not EMBEDDING_STORE_DIR:
+        return run_sync(aembedding(text_list, backend))
+    # 只把向量库中没有的文本发给接口，结果写回向量库
+    store = get_embedding_store(EMBEDDING_STORE_DIR, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+    missing = store.missing(text_list)
+    print(f"共 {len(text_list)} 条文本，向量库命中 {len(text_list) - len(missing)} 条，需请求 {len(missing)} 条")
+    if missing:
+        store.add_many(missing, run_sync(aembedding(missing, backend)))
+    return store.get_many(text_list)
+
+async def aembedding(text_list, backend):
+    # 各批次并发请求，并发数由后端的 max_concurrency 限制
     batch_size = 64
-    for i in range(0, len(text_list), batch_size):
-        batch = text_list[i:i + batch_size]
-        response = client.embeddings.create(
-            model="embedding-3",
-            input=batch,
-            dimensions=2048
-        )
-        embeddings.extend([item.embedding for item in response.data])
+    batches = [text_list[i:i + batch_size] for i in range(0, len(text_list), batch_size)]
+    results = await asyncio.gather(*[backend.embed(EMBEDDING_MODEL, batch, dimensions=EMBEDDING_DIMENSIONS) for batch in batches])
+    embeddings = []
+    for vectors in results:
+        embeddings.extend(vectors)
     return embeddings
 
+def get_library():
+    """返回跨比赛论点库；未启用向量库或论点库时返回 None"""
+    if not (EMBEDDING_STORE_DIR and ARGUMENT_LIBRARY):
+        return None
+    from 论点库 import get_argument_library
+    return get_argument_library(get_embedding_store(EMBEDDING_STORE_DIR, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS))
+
+def add_to_library(topic, graph, source="", api_key=API_KEY, base_url=BASE_URL):
+    """把一场已评判比赛的论点拓扑图收录进论点库；查重时已嵌入过的文本直接从向量库读取"""
+    library = get_library()
+    if library is None:
+        return 0
+    embedding([node.text for node in graph.nodes.values()], api_key, base_url)
+    return library.add_debate(topic, graph, source)
+
+def similar_arguments(text, k=5, api_key=API_KEY, base_url=BASE_URL, min_similarity=0.0, exclude_topic=None):
+    """在论点库中查找与 text 最接近的已知论点"""
+    library = get_library()
+    if library is None:
+        raise RuntimeError("论点库需要启用向量库：请设置 EMBEDDING_STORE_DIR 和 ARGUMENT_LIBRARY")
+    vector = embedding([text], api_key, base_url)[0]
+    return library.nearest(vector, k, min_similarity, exclude_topic)
+
+SIMILARITY_THRESHOLD = 0.85  # 余弦相似度高于该值的两个节点视为重复
+BLOCK_ELEMENTS = 1 << 22  # 分块计算相似度时，每块相似度矩阵的元素数上限（float32 约 16MB）
+
 def cosine_similarity(vec1, vec2):
-    return 1 - scipy.spatial.distance.cosine(vec1, vec2)
+    vec1 = np.asarray(vec1, dtype=np.float32)
+    vec2 = np.asarray(vec2, dtype=np.float32)
+    return float(vec1 @ vec2 / (np.linalg.norm(vec1) * np.linalg.norm(vec2)))
 
 def get_id_number(node_id):
     """提取节点ID中的数字部分并转为整数"""
     return int(node_id.split('_')[-1])
 
-def main(filepath=FILEPATH, api_key=API_KEY, output_path="cleaned_" + FILEPATH):
+def normalize_rows(vectors):
+    """把每一行归一化为单位向量，之后矩阵乘法的结果即为余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def similar_pairs(vectors, threshold=SIMILARITY_THRESHOLD, block_elements=BLOCK_ELEMENTS):
+    """
+    分块计算相似度矩阵的上三角部分，逐块产出相似度高于 threshold 的下标对 (i, j)，i < j。
+    每块只占用 block_rows * n 个元素的内存，不会生成完整的 n*n 矩阵。
+    """
+    normed = normalize_rows(vectors)
+    n = len(normed)
+    block_rows = max(1, block_elements // max(n, 1))
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        # 只与自身及之后的行比较
+        sims = normed[start:stop] @ normed[start:].T
+        rows, cols = np.nonzero(sims > threshold)
+        cols = cols + start
+        rows = rows + start
+        keep = cols > rows
+        yield from zip(rows[keep].tolist(), cols[keep].tolist())
+
+class UnionFind:
+    """并查集：每个集合的根始终是 rank 最小的元素（即 ID 序号最小的节点）"""
+    def __init__(self, ranks):
+        self.parent = list(range(len(ranks)))
+        self.ranks = ranks
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]  # 路径减半
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return
+        if self.ranks[root_b] < self.ranks[root_a]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+
+def find_duplicates(vectors, id_numbers, threshold=SIMILARITY_THRESHOLD):
+    """
+    把相似度高于阈值的节点聚成簇，每簇保留 ID 序号最小的节点。
+    返回 {被删除节点下标: 保留节点下标}
+    """
+    # ID 序号相同（如合并多场比赛的图）时按原顺序决定先后
+    ranks = list(zip(id_numbers, range(len(id_numbers))))
+    uf = UnionFind(ranks)
+    for i, j in similar_pairs(vectors, threshold):
+        uf.union(i, j)
+    redirects = {}
+    for idx in range(len(id_numbers)):
+        root = uf.find(idx)
+        if root != idx:
+            redirects[idx] = root
+    return redirects
+
+def main(filepath=FILEPATH, api_key=API_KEY, output_path="cleaned_" + FILEPATH, base_url=BASE_URL):
     with open(filepath, "r", encoding="utf-8") as f:
         argument_graph = json.load(f)
 
     text_list = [node["text"] for node in argument_graph]
-    vec_list = embedding(text_list,api_key)
-
-    similarity_pairs = []
-
-    # 生成相似对时按ID序号排序
-    for i in range(len(text_list)):
-        for j in range(i + 1, len(text_list)):
-            # 比较ID序号，确保smaller_idx对应更小的ID
-            i_id = get_id_number(argument_graph[i]["id"])
-            j_id = get_id_number(argument_graph[j]["id"])
-            if i_id < j_id:
-                smaller_idx, larger_idx = i, j
-            else:
-                smaller_idx, larger_idx = j, i
-            
-            similarity = cosine_similarity(vec_list[i], vec_list[j])
-            similarity_pairs.append((similarity, smaller_idx, larger_idx))
-
-    similarity_pairs.sort(reverse=True, key=lambda x: x[0])
-
-    # # 输出最相似的前十对
-    # print("最相似的前十对节点：")
-    # for i in range(min(10, len(similarity_pairs))):
-    #     similarity, idx1, idx2 = similarity_pairs[i]
-    #     print(f"余弦相似度 ({text_list[idx1]}, {text_list[idx2]}): {similarity}")
-
-    threshold = 0.85
-    to_delete = set()
-    redirect_map = {}
-
-    # 处理相似对，建立重定向映射
-    for similarity, smaller_idx, larger_idx in similarity_pairs:
-        if similarity <= threshold:
-            break
-        if larger_idx in to_delete:
-            continue
-        
-        # 获取保留节点的最终ID（处理链式重定向）
-        retained_id = argument_graph[smaller_idx]["id"]
-        while retained_id in redirect_map:
-            retained_id = redirect_map[retained_id]
-        
-        # 记录映射关系
-        deleted_id = argument_graph[larger_idx]["id"]
-        redirect_map[deleted_id] = retained_id
-        to_delete.add(larger_idx)
+    vec_list = embedding(text_list,api_key,base_url)
+
+    # ID 序号只解析一次
+    id_numbers = [get_id_number(node["id"]) for node in argument_graph]
+    redirects = find_duplicates(vec_list, id_numbers)
+
+    # 建立重定向映射：被删除节点 -> 所在簇中保留的节点
+    redirect_map = {argument_graph[idx]["id"]: argument_graph[root]["id"] for idx, root in redirects.items()}
 
     # 构建更新后的图结构
-    deleted_ids = {argument_graph[idx]["id"] for idx in to_delete}
-    updated_graph = [node for node in argument_graph if node["id"] not in deleted_ids]
+    updated_graph = [node for idx, node in enumerate(argument_graph) if idx not in redirects]
 
     # 更新所有节点的target_id
     for node in updated_graph:
@@ -92,7 +159,7 @@ def main(filepath=FILEPATH, api_key=API_KEY, output_path="cleaned_" + FILEPATH):
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(updated_graph, f, ensure_ascii=False, indent=4)
 
-    print("处理完成，已删除重复节点并更新引用关系。")
+    print(f"处理完成，已删除 {len(redirects)} 个重复节点并更新引用关系。")
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,293 @@
+import contextvars
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 结构化追踪：每次大模型/词向量请求、每轮抽取、每个流程阶段都记录为一个 span（名称、起止时间、属性、父 span）。
+# span 之间的父子关系通过 contextvars 传递，跨 run_sync 和 asyncio 任务同样有效。
+# 结束的 span 交给导出器：
+#   JsonLinesExporter   每个 span 追加一行 json
+#   PrometheusExporter  汇总为 Prometheus 文本格式，可以开 HTTP 端口供抓取，也可以写入文件（textfile collector）
+# summary() 按一场比赛（根 span）汇总各阶段耗时、各模型的请求数/延迟分位数/token 用量、解析失败和重试次数。
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+MAX_SPANS = 100000  # 内存中保留的已结束 span 数量上限
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+class Span:
+    def __init__(self, name, attributes, parent):
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.root_id = parent.root_id if parent else self.span_id
+        self.name = name
+        self.attributes = dict(attributes)
+        self.events = []
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def event(self, name, **attributes):
+        self.events.append({"name": name, "offset": time.perf_counter() - self._start, **attributes})
+
+    def to_dict(self):
+        return {
+            "span_id": self.span_id, "parent_id": self.parent_id, "root_id": self.root_id,
+            "name": self.name, "start_time": self.start_time, "duration": self.duration,
+            "status": self.status, "attributes": self.attributes, "events": self.events,
+        }
+
+class _SpanContext:
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.span = Span(self.name, self.attributes, _current_span.get())
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.duration = time.perf_counter() - span._start
+        if exc_type is not None:
+            span.status = "error"
+            span.set(error=f"{exc_type.__name__}: {exc}")
+        _current_span.reset(self.token)
+        self.tracer.finish(span)
+        return False
+
+class Tracer:
+    def __init__(self):
+        self.exporters = []
+        self.spans = deque(maxlen=MAX_SPANS)
+        self._lock = threading.Lock()
+
+    def span(self, name, **attributes):
+        """用法：with tracer.span("llm.chat", model=...) as span: ..."""
+        return _SpanContext(self, name, attributes)
+
+    def current(self):
+        return _current_span.get()
+
+    def annotate(self, **attributes):
+        """给当前 span 添加属性；不在任何 span 内时忽略"""
+        span = _current_span.get()
+        if span is not None:
+            span.set(**attributes)
+
+    def count(self, key, amount=1):
+        span = _current_span.get()
+        if span is not None:
+            span.add(key, amount)
+
+    def event(self, name, **attributes):
+        span = _current_span.get()
+        if span is not None:
+            span.event(name, **attributes)
+
+    def add_exporter(self, exporter):
+        with self._lock:
+            self.exporters.append(exporter)
+
+    def finish(self, span):
+        with self._lock:
+            self.spans.append(span)
+            exporters = list(self.exporters)
+        for exporter in exporters:
+            exporter.export(span)
+
+    def spans_of(self, root_id=None):
+        with self._lock:
+            spans = list(self.spans)
+        return [s for s in spans if root_id is None or s.root_id == root_id]
+
+    def summary(self, root_id=None):
+        spans = self.spans_of(root_id)
+        stages = {s.name[len("stage."):]: s.duration for s in spans if s.name.startswith("stage.")}
+        models = defaultdict(lambda: {"calls": 0, "errors": 0, "cache_hits": 0, "latencies": [],
+                                      "prompt_tokens": 0, "completion_tokens": 0})
+        retries = parse_failures = 0
+        for s in spans:
+            if s.name.startswith("llm."):
+                key = f"{s.attributes.get('endpoint')} {s.attributes.get('model')}"
+                entry = models[key]
+                entry["calls"] += 1
+                entry["errors"] += s.status == "error"
+                entry["cache_hits"] += s.attributes.get("cache") == "hit"
+                entry["latencies"].append(s.duration)
+                entry["prompt_tokens"] += s.attributes.get("prompt_tokens") or 0
+                entry["completion_tokens"] += s.attributes.get("completion_tokens") or 0
+                retries += s.attributes.get("retries", 0)
+            parse_failures += s.attributes.get("parse_failures", 0)
+        for entry in models.values():
+            latencies = sorted(entry.pop("latencies"))
+            entry["p50_seconds"] = percentile(latencies, 0.5)
+            entry["p95_seconds"] = percentile(latencies, 0.95)
+            entry["max_seconds"] = latencies[-1] if latencies else 0.0
+        rounds = sorted(((s.attributes.get("round"), s.duration) for s in spans if s.name == "round.extract"),
+                        key=lambda item: item[1], reverse=True)
+        return {"stages": stages, "models": dict(models), "retries": retries,
+                "parse_failures": parse_failures, "slowest_rounds": rounds[:5]}
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def format_summary(summary):
+    lines = ["==== 运行统计 ===="]
+    if summary["stages"]:
+        lines.append("阶段耗时：" + "，".join(f"{name} {seconds:.2f}s" for name, seconds in summary["stages"].items()))
+    for key, entry in summary["models"].items():
+        lines.append(f"{key}：{entry['calls']} 次（缓存命中 {entry['cache_hits']}，失败 {entry['errors']}），"
+                     f"p50 {entry['p50_seconds']:.2f}s / p95 {entry['p95_seconds']:.2f}s / 最长 {entry['max_seconds']:.2f}s，"
+                     f"tokens 提示词 {entry['prompt_tokens']} / 输出 {entry['completion_tokens']}")
+    lines.append(f"重试 {summary['retries']} 次，输出解析失败 {summary['parse_failures']} 次")
+    if summary["slowest_rounds"]:
+        lines.append("最慢的轮次：" + "，".join(f"第 {r} 轮 {seconds:.2f}s" for r, seconds in summary["slowest_rounds"]))
+    return "\n".join(lines)
+
+############################################
+# 导出器
+############################################
+class JsonLinesExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+class PrometheusExporter:
+    """
+    把 span 汇总成计数器和直方图，按 Prometheus 文本格式输出：
+      - port 不为 None 时在后台线程开 HTTP 服务，GET /metrics 返回指标；
+      - path 不为 None 时每个 span 结束后重写该文件（供 node_exporter 的 textfile collector 读取）。
+    """
+    def __init__(self, port=None, host="0.0.0.0", path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)  # (endpoint, model, status) -> 次数
+        self.latency = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))  # (endpoint, model) -> 各桶计数
+        self.latency_sum = defaultdict(float)
+        self.tokens = defaultdict(int)  # (model, kind) -> token 数
+        self.stage_seconds = defaultdict(float)
+        self.stage_count = defaultdict(int)
+        self.retries = 0
+        self.parse_failures = 0
+        self.cache_hits = 0
+        self.server = None
+        if port is not None:
+            self.server = self._serve(host, port)
+
+    def export(self, span):
+        with self._lock:
+            attrs = span.attributes
+            self.retries += attrs.get("retries", 0)
+            self.parse_failures += attrs.get("parse_failures", 0)
+            if span.name.startswith("llm."):
+                endpoint, model = attrs.get("endpoint", ""), attrs.get("model", "")
+                self.requests[(endpoint, model, span.status)] += 1
+                buckets = self.latency[(endpoint, model)]
+                for i, bound in enumerate(LATENCY_BUCKETS):
+                    if span.duration <= bound:
+                        buckets[i] += 1
+                buckets[-1] += 1
+                self.latency_sum[(endpoint, model)] += span.duration
+                self.tokens[(model, "prompt")] += attrs.get("prompt_tokens") or 0
+                self.tokens[(model, "completion")] += attrs.get("completion_tokens") or 0
+                self.cache_hits += attrs.get("cache") == "hit"
+            elif span.name.startswith("stage."):
+                stage = span.name[len("stage."):]
+                self.stage_seconds[stage] += span.duration
+                self.stage_count[stage] += 1
+            text = self.render() if self.path else None
+        if text is not None:
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(text)
+
+    def render(self):
+        out = ["# TYPE debate_llm_requests_total counter"]
+        for (endpoint, model, status), value in sorted(self.requests.items()):
+            out.append(f'debate_llm_requests_total{{endpoint="{endpoint}",model="{model}",status="{status}"}} {value}')
+        out.append("# TYPE debate_llm_request_seconds histogram")
+        for (endpoint, model), buckets in sorted(self.latency.items()):
+            labels = f'endpoint="{endpoint}",model="{model}"'
+            for bound, value in zip(LATENCY_BUCKETS, buckets):
+                out.append(f'debate_llm_request_seconds_bucket{{{labels},le="{bound}"}} {value}')
+            out.append(f'debate_llm_request_seconds_bucket{{{labels},le="+Inf"}} {buckets[-1]}')
+            out.append(f"debate_llm_request_seconds_sum{{{labels}}} {self.latency_sum[(endpoint, model)]:.6f}")
+            out.append(f"debate_llm_request_seconds_count{{{labels}}} {buckets[-1]}")
+        out.append("# TYPE debate_llm_tokens_total counter")
+        for (model, kind), value in sorted(self.tokens.items()):
+            out.append(f'debate_llm_tokens_total{{model="{model}",kind="{kind}"}} {value}')
+        out.append("# TYPE debate_stage_seconds summary")
+        for stage in sorted(self.stage_seconds):
+            out.append(f'debate_stage_seconds_sum{{stage="{stage}"}} {self.stage_seconds[stage]:.6f}')
+            out.append(f'debate_stage_seconds_count{{stage="{stage}"}} {self.stage_count[stage]}')
+        out.append("# TYPE debate_llm_retries_total counter")
+        out.append(f"debate_llm_retries_total {self.retries}")
+        out.append("# TYPE debate_llm_parse_failures_total counter")
+        out.append(f"debate_llm_parse_failures_total {self.parse_failures}")
+        out.append("# TYPE debate_llm_cache_hits_total counter")
+        out.append(f"debate_llm_cache_hits_total {self.cache_hits}")
+        return "\n".join(out) + "\n"
+
+    def _serve(self, host, port):
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("/metrics", ""):
+                    self.send_error(404)
+                    return
+                with exporter._lock:
+                    body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Prometheus 指标：http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+############################################
+# 进程内共享的追踪器
+############################################
+_tracer = Tracer()
+_configured = set()
+
+def get_tracer():
+    return _tracer
+
+def configure_tracing(trace_path=None, metrics_port=None, metrics_path=None):
+    """按配置挂上导出器；同样的配置重复调用只生效一次"""
+    if trace_path and ("jsonl", trace_path) not in _configured:
+        _configured.add(("jsonl", trace_path))
+        _tracer.add_exporter(JsonLinesExporter(trace_path))
+    if (metrics_port is not None or metrics_path) and ("prometheus", metrics_port, metrics_path) not in _configured:
+        _configured.add(("prometheus", metrics_port, metrics_path))
+        _tracer.add_exporter(PrometheusExporter(port=metrics_port, path=metrics_path))
+    return _tracer
@@ -0,0 +1,176 @@
+import contextvars
+import multiprocessing
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from 追踪 import get_tracer
+
+# 后处理阶段调度：把查重、评分、点评、绘图等环节声明为有向无环图，每个阶段写明输入和输出，
+# 输入全部就绪的阶段立即开始，互不依赖的阶段并发执行：
+#   - pool="thread"：在线程池中执行，适合等待网络的阶段（查重的词向量请求、点评的大模型请求）；
+#   - pool="process"：在进程池中执行，适合 CPU 密集、会长时间占用 GIL 的阶段（matplotlib 绘图）。
+#     函数和参数必须可以 pickle（模块级函数、普通数据），进程池在进程内共用，用 spawn 启动，不继承父进程的线程。
+# 每个阶段记录为一个 "stage.<名称>" 追踪 span；结束后给出各阶段的起止时间和关键路径。
+# optional=True 的阶段（如收录论点库这类附带的写入）失败时只记录在报告里，不影响其他阶段，
+# 只有依赖它的输出的阶段会被跳过。
+
+PROCESS_WORKERS = 2  # 进程池大小；多场比赛并发评判时，各场的绘图可以同时进行
+
+class Stage:
+    def __init__(self, name, func, inputs=(), outputs=(), pool="thread", optional=False):
+        """
+        func 以输入名为关键字参数调用，返回 {输出名: 值}（没有输出时可以返回 None）
+        pool: "thread" 或 "process"
+        optional: 失败时不中止整个调度
+        """
+        if pool not in ("thread", "process"):
+            raise ValueError(f"未知的执行方式：{pool}，可选 thread / process")
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.pool = pool
+        self.optional = optional
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool(max_workers=PROCESS_WORKERS):
+    """返回进程内共用的进程池（首次调用时创建）"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+def check_stages(stages, available):
+    """检查阶段名和输出不重复、每个输入都有来源、没有环；返回 {输出名: 产出它的阶段名}"""
+    producers = {}
+    names = set()
+    for stage in stages:
+        if stage.name in names:
+            raise ValueError(f"阶段名重复：{stage.name}")
+        names.add(stage.name)
+        for output in stage.outputs:
+            if output in producers or output in available:
+                raise ValueError(f"输出 {output} 有多个来源")
+            producers[output] = stage.name
+    for stage in stages:
+        for name in stage.inputs:
+            if name not in producers and name not in available:
+                raise ValueError(f"阶段 {stage.name} 的输入 {name} 没有来源")
+    # 按拓扑顺序逐个“完成”阶段，剩下完成不了的就在环上
+    ready = set(available)
+    pending = list(stages)
+    while pending:
+        runnable = [stage for stage in pending if all(name in ready for name in stage.inputs)]
+        if not runnable:
+            raise ValueError(f"阶段之间存在循环依赖：{[stage.name for stage in pending]}")
+        for stage in runnable:
+            ready.update(stage.outputs)
+            pending.remove(stage)
+    return producers
+
+def run_stages(stages, values, max_threads=4):
+    """
+    按依赖关系执行各阶段。values 为初始输入 {名称: 值}。
+    返回 (全部输入输出的字典, 各阶段计时)。必需阶段失败时，等已开始的阶段结束后抛出第一个异常，未开始的阶段不再执行；
+    可选阶段失败时记入报告的 failed，依赖它的输出而无法执行的阶段记入 skipped，其余阶段照常执行。
+    """
+    values = dict(values)
+    producers = check_stages(stages, values)
+    tracer = get_tracer()
+    origin = time.perf_counter()
+    timings = {}
+    failed = {}
+
+    def execute(stage, kwargs):
+        with tracer.span(f"stage.{stage.name}", pool=stage.pool):
+            start = time.perf_counter()
+            try:
+                if stage.pool == "process":
+                    result = get_process_pool().submit(stage.func, **kwargs).result()
+                else:
+                    result = stage.func(**kwargs)
+            finally:
+                timings[stage.name] = {"start": start - origin, "end": time.perf_counter() - origin}
+        result = result or {}
+        missing = [name for name in stage.outputs if name not in result]
+        if missing:
+            raise ValueError(f"阶段 {stage.name} 没有产出 {missing}")
+        return result
+
+    pending = list(stages)
+    running = {}
+    error = None
+    # 进程池中的阶段也由一个线程提交并等待，这样它的 span 和其他阶段一样挂在当前追踪上下文下
+    with ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="stage") as executor:
+        while pending or running:
+            if error is None:
+                for stage in [s for s in pending if all(name in values for name in s.inputs)]:
+                    pending.remove(stage)
+                    kwargs = {name: values[name] for name in stage.inputs}
+                    context = contextvars.copy_context()
+                    running[executor.submit(context.run, execute, stage, kwargs)] = stage
+            else:
+                pending = []
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    values.update({name: value for name, value in future.result().items() if name in stage.outputs})
+                except Exception as e:
+                    print(f"阶段 {stage.name} 失败：{e}")
+                    if stage.optional:
+                        failed[stage.name] = f"{type(e).__name__}: {e}"
+                    else:
+                        error = error or e
+    if error is not None:
+        raise error
+    report = critical_path(stages, producers, timings)
+    report["failed"] = failed
+    report["skipped"] = [stage.name for stage in pending]
+    return values, report
+
+def critical_path(stages, producers, timings):
+    """
+    各阶段的起止时间（相对调度开始，秒），等待时间（从输入就绪到开始执行），
+    以及关键路径：从最后结束的阶段出发，每次回溯到最晚就绪的那个输入的产出阶段。
+    """
+    report = {"stages": {}, "critical_path": [], "wall_seconds": 0.0, "busy_seconds": 0.0}
+    by_name = {stage.name: stage for stage in stages}
+    for name, timing in timings.items():
+        upstream = [producers[i] for i in by_name[name].inputs if i in producers and producers[i] in timings]
+        ready = max((timings[u]["end"] for u in upstream), default=0.0)
+        report["stages"][name] = {
+            "start": timing["start"], "end": timing["end"], "seconds": timing["end"] - timing["start"],
+            "wait": max(timing["start"] - ready, 0.0), "after": max(upstream, key=lambda u: timings[u]["end"], default=None)
+        }
+    if not timings:
+        return report
+    last = max(report["stages"], key=lambda name: report["stages"][name]["end"])
+    path = []
+    while last is not None:
+        path.append(last)
+        last = report["stages"][last]["after"]
+    report["critical_path"] = path[::-1]
+    report["wall_seconds"] = report["stages"][path[0]]["end"]
+    report["busy_seconds"] = sum(stage["seconds"] for stage in report["stages"].values())
+    return report
+
+def format_stage_report(report):
+    lines = ["后处理阶段（相对开始的时间）："]
+    for name, stage in sorted(report["stages"].items(), key=lambda item: item[1]["start"]):
+        marker = "*" if name in report["critical_path"] else " "
+        lines.append(f" {marker}{name:<12}{stage['start']:>7.2f}s → {stage['end']:>6.2f}s  耗时 {stage['seconds']:.2f}s"
+                     + (f"，输入就绪后等待 {stage['wait']:.2f}s" if stage["wait"] >= 0.01 else ""))
+    if report["critical_path"]:
+        lines.append(f"关键路径（*）：{' → '.join(report['critical_path'])}，共 {report['wall_seconds']:.2f}s；"
+                     f"各阶段耗时合计 {report['busy_seconds']:.2f}s")
+    for name, message in report.get("failed", {}).items():
+        lines.append(f"可选阶段 {name} 失败（已跳过）：{message}")
+    if report.get("skipped"):
+        lines.append(f"因上游失败未执行：{', '.join(report['skipped'])}")
+    return "\n".join(lines)
@@ -0,0 +1,112 @@
+import asyncio
+import random
+import time
+from 快照编码 import estimate_tokens
+
+# 进程内共享的限流器：所有大模型和词向量请求（toJson、LLMClient、论点查重.embedding）都先在这里排队，
+# 同时受“每秒请求数”和“每分钟 token 数”两个令牌桶限制。请求返回后按实际用量多退少补。
+
+REQUESTS_PER_SECOND = 5  # 每秒最多发出的请求数
+TOKENS_PER_MINUTE = 500000  # 每分钟最多消耗的 token 数（提示词 + 输出）
+MAX_RETRIES = 5  # 遇到 429 / 5xx / 网络错误时的最大重试次数
+BACKOFF_BASE = 1.0  # 第一次重试前的基础等待秒数，之后每次翻倍
+BACKOFF_MAX = 60.0  # 单次等待的上限
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self, amount):
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.level >= amount:
+                self.level -= amount
+                return
+            await asyncio.sleep((amount - self.level) / self.rate)
+
+    def adjust(self, amount):
+        """按实际用量修正：amount 为正表示多用了，可以欠账（level 为负）"""
+        self._refill()
+        self.level -= amount
+
+class RateLimiter:
+    def __init__(self, requests_per_second=REQUESTS_PER_SECOND, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_second, max(1, requests_per_second))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self._lock = asyncio.Lock()  # 先到先得
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.retries = 0
+        self.rate_limited = 0
+        self.server_errors = 0
+
+    async def acquire(self, estimated_tokens):
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        start = time.monotonic()
+        try:
+            async with self._lock:
+                await self.requests.take(1)
+                await self.tokens.take(estimated_tokens)
+        finally:
+            self.waiting -= 1
+        self.acquired += 1
+        self.total_wait += time.monotonic() - start
+
+    def settle(self, estimated_tokens, actual_tokens):
+        if actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def record_retry(self, status_code=None):
+        self.retries += 1
+        if status_code == 429:
+            self.rate_limited += 1
+        elif status_code is not None and status_code >= 500:
+            self.server_errors += 1
+
+    def metrics(self):
+        return {
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "requests": self.acquired,
+            "avg_wait_seconds": self.total_wait / self.acquired if self.acquired else 0.0,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "server_errors": self.server_errors,
+        }
+
+def estimate_request_tokens(payload):
+    """估算一次请求会消耗的 token：提示词（或待嵌入文本）加上最大输出长度"""
+    if "messages" in payload:
+        prompt = sum(estimate_tokens(message.get("content") or "") for message in payload["messages"])
+        return prompt + payload.get("max_tokens", 1024)
+    inputs = payload.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    return sum(estimate_tokens(text) for text in inputs)
+
+def backoff_delay(attempt, retry_after=None):
+    """第 attempt 次重试（从 1 开始）前的等待秒数：指数退避加全抖动；服务端给出 Retry-After 时以其为下限"""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+_shared_limiter = None
+
+def get_shared_limiter():
+    global _shared_limiter
+    if _shared_limiter is None:
+        _shared_limiter = RateLimiter()
+    return _shared_limiter